@@ -34,6 +34,7 @@ import boto.plugin
 import boto.utils
 import hmac
 import sys
+import time
 import urllib
 from email.utils import formatdate
 
@@ -68,6 +69,49 @@ except ImportError:
     import sha
     sha256 = None
 
+# The dates put in the requests only change every second, so each format
+# is computed once per second instead of once per request.
+_dates = {}
+
+def _cached_date(format):
+    now = int(time.time())
+    entry = _dates.get(format)
+    if entry is None or entry[0] != now:
+        entry = (now, format(now))
+        _dates[format] = entry
+    return entry[1]
+
+def _format_http_date(t):
+    return formatdate(t, usegmt=True)
+
+def _format_timestamp(t):
+    return time.strftime(boto.utils.ISO8601, time.gmtime(t))
+
+def http_date():
+    """Return the current time as an RFC 1123 date, for the Date header."""
+    return _cached_date(_format_http_date)
+
+def timestamp():
+    """Return the current time as an ISO 8601 timestamp."""
+    return _cached_date(_format_timestamp)
+
+def hmac_digest(mac, msg):
+    """
+    Return the digest of msg under the key of mac, an hmac object that is
+    left untouched.  Only the hash states of its inner and outer pads are
+    copied, instead of the whole hmac object, when the hmac module
+    exposes them.
+    """
+    if not hasattr(mac, 'inner') or not hasattr(mac, 'outer'):
+        mac = mac.copy()
+        mac.update(msg)
+        return mac.digest()
+    inner = mac.inner.copy()
+    inner.update(msg)
+    outer = mac.outer.copy()
+    outer.update(inner.digest())
+    return outer.digest()
+
 class HmacKeys(object):
     """Key based Auth handler helper."""
 
@@ -94,11 +138,10 @@ class HmacKeys(object):
 
     def sign_string(self, string_to_sign):
         if self._hmac_256:
-            hmac = self._hmac_256.copy()
+            digest = hmac_digest(self._hmac_256, string_to_sign)
         else:
-            hmac = self._hmac.copy()
-        hmac.update(string_to_sign)
-        return base64.encodestring(hmac.digest()).strip()
+            digest = hmac_digest(self._hmac, string_to_sign)
+        return base64.b64encode(digest)
 
 class AnonAuthHandler(AuthHandler, HmacKeys):
     """
@@ -128,7 +171,7 @@ class HmacAuthV1Handler(AuthHandler, HmacKeys):
         method = http_request.method
         auth_path = http_request.auth_path
         if not headers.has_key('Date'):
-            headers['Date'] = formatdate(usegmt=True)
+            headers['Date'] = http_date()
 
         if self._provider.security_token:
             key = self._provider.security_token_header
@@ -136,7 +179,7 @@ class HmacAuthV1Handler(AuthHandler, HmacKeys):
         string_to_sign = boto.utils.canonical_string(method, auth_path,
                                                      headers, None,
                                                      self._provider)
-        boto.log.debug('StringToSign:\n%s' % string_to_sign)
+        boto.log.debug('StringToSign:\n%s', string_to_sign)
         b64_hmac = self.sign_string(string_to_sign)
         auth_hdr = self._provider.auth_header
         headers['Authorization'] = ("%s %s:%s" %
@@ -157,7 +200,7 @@ class HmacAuthV2Handler(AuthHandler, HmacKeys):
     def add_auth(self, http_request, **kwargs):
         headers = http_request.headers
         if not headers.has_key('Date'):
-            headers['Date'] = formatdate(usegmt=True)
+            headers['Date'] = http_date()
 
         b64_hmac = self.sign_string(headers['Date'])
         auth_hdr = self._provider.auth_header
@@ -177,7 +220,7 @@ class HmacAuthV3Handler(AuthHandler, HmacKeys):
     def add_auth(self, http_request, **kwargs):
         headers = http_request.headers
         if not headers.has_key('Date'):
-            headers['Date'] = formatdate(usegmt=True)
+            headers['Date'] = http_date()
 
         b64_hmac = self.sign_string(headers['Date'])
         s = "AWS3-HTTPS AWSAccessKeyId=%s," % self._provider.access_key
@@ -247,10 +290,10 @@ class HmacAuthV3HTTPHandler(AuthHandler, HmacKeys):
         # authorization header is removed first.
         if 'X-Amzn-Authorization' in req.headers:
             del req.headers['X-Amzn-Authorization']
-        req.headers['X-Amz-Date'] = formatdate(usegmt=True)
+        req.headers['X-Amz-Date'] = http_date()
         req.headers['X-Amz-Security-Token'] = self._provider.security_token
         string_to_sign, headers_to_sign = self.string_to_sign(req)
-        boto.log.debug('StringToSign:\n%s' % string_to_sign)
+        boto.log.debug('StringToSign:\n%s', string_to_sign)
         hash_value = sha256(string_to_sign).digest()
         b64_hmac = self.sign_string(hash_value)
         s = "AWS3 AWSAccessKeyId=%s," % self._provider.access_key
@@ -271,11 +314,11 @@ class QuerySignatureHelper(HmacKeys):
         params = http_request.params
         params['AWSAccessKeyId'] = self._provider.access_key
         params['SignatureVersion'] = self.SignatureVersion
-        params['Timestamp'] = boto.utils.get_ts()
+        params['Timestamp'] = timestamp()
         qs, signature = self._calc_signature(
             http_request.params, http_request.method,
             http_request.auth_path, http_request.host)
-        boto.log.debug('query_string: %s Signature: %s' % (qs, signature))
+        boto.log.debug('query_string: %s Signature: %s', qs, signature)
         if http_request.method == 'POST':
             headers['Content-Type'] = 'application/x-www-form-urlencoded; charset=UTF-8'
             http_request.body = qs + '&Signature=' + urllib.quote_plus(signature)
@@ -337,32 +380,49 @@ class QuerySignatureV2AuthHandler(QuerySignatureHelper, AuthHandler):
     capability = ['sign-v2', 'ec2', 'ec2', 'emr', 'fps', 'ecs',
                   'sdb', 'iam', 'rds', 'sns', 'sqs', 'cloudformation']
 
+    # parameters with few values, whose quoted pairs are kept in
+    # _quoted_params instead of being quoted for every request
+    ConstantParams = ('AWSAccessKeyId', 'Action', 'SignatureMethod',
+                      'SignatureVersion', 'Version')
+
+    _quoted_params = {}
+
+    def _quote_param(self, key, val):
+        val = boto.utils.get_utf8_value(val)
+        return (urllib.quote(key, safe='') + '=' +
+                urllib.quote(val, safe='-_~'))
+
     def _calc_signature(self, params, verb, path, server_name):
         boto.log.debug('using _calc_signature_2')
         string_to_sign = '%s\n%s\n%s\n' % (verb, server_name.lower(), path)
         if self._hmac_256:
-            hmac = self._hmac_256.copy()
+            mac = self._hmac_256
             params['SignatureMethod'] = 'HmacSHA256'
         else:
-            hmac = self._hmac.copy()
+            mac = self._hmac
             params['SignatureMethod'] = 'HmacSHA1'
         if self._provider.security_token:
             params['SecurityToken'] = self._provider.security_token
         keys = params.keys()
         keys.sort()
         pairs = []
+        quoted_params = self._quoted_params
         for key in keys:
-            val = boto.utils.get_utf8_value(params[key])
-            pairs.append(urllib.quote(key, safe='') + '=' +
-                         urllib.quote(val, safe='-_~'))
+            val = params[key]
+            if key in self.ConstantParams:
+                pair = quoted_params.get((key, val))
+                if pair is None:
+                    pair = self._quote_param(key, val)
+                    quoted_params[(key, val)] = pair
+            else:
+                pair = self._quote_param(key, val)
+            pairs.append(pair)
         qs = '&'.join(pairs)
-        boto.log.debug('query string: %s' % qs)
+        boto.log.debug('query string: %s', qs)
         string_to_sign += qs
-        boto.log.debug('string_to_sign: %s' % string_to_sign)
-        hmac.update(string_to_sign)
-        b64 = base64.b64encode(hmac.digest())
-        boto.log.debug('len(b64)=%d' % len(b64))
-        boto.log.debug('base64 encoded digest: %s' % b64)
+        boto.log.debug('string_to_sign: %s', string_to_sign)
+        b64 = base64.b64encode(hmac_digest(mac, string_to_sign))
+        boto.log.debug('base64 encoded digest: %s', b64)
         return (qs, b64)
 
 
@@ -21,7 +21,8 @@
 # IN THE SOFTWARE.
 
 """
-A set of results returned by SendMessageBatch.
+A set of results returned by SendMessageBatch, DeleteMessageBatch
+and ChangeMessageVisibilityBatch.
 """
 
 class ResultEntry(dict):
@@ -79,13 +80,13 @@ class BatchResults(object):
         self.errors = []
 
     def startElement(self, name, attrs, connection):
-        if name == 'SendMessageBatchResultEntry':
+        if name.endswith('BatchResultEntry'):
             entry = ResultEntry()
             self.results.append(entry)
             return entry
         if name == 'BatchResultErrorEntry':
             entry = ResultEntry()
-            self.results.errors(entry)
+            self.errors.append(entry)
             return entry
         return None
 
@@ -85,15 +85,20 @@ def unquote_v(nv):
         return (nv[0], urllib.unquote(nv[1]))
 
 # generates the aws canonical string for the given parameters
+# the headers always signed, besides those starting with the header
+# prefix of the provider
+_signed_headers = frozenset(['content-md5', 'content-type', 'date'])
+
 def canonical_string(method, path, headers, expires=None,
                      provider=None):
     if not provider:
         provider = boto.provider.get_default()
+    header_prefix = provider.header_prefix
     interesting_headers = {}
     for key in headers:
         lk = key.lower()
-        if headers[key] != None and (lk in ['content-md5', 'content-type', 'date'] or
-                                     lk.startswith(provider.header_prefix)):
+        if headers[key] != None and (lk in _signed_headers or
+                                     lk.startswith(header_prefix)):
             interesting_headers[lk] = headers[key].strip()
 
     # these keys get empty strings if they don't exist
@@ -114,30 +119,47 @@ def canonical_string(method, path, headers, expires=None,
     sorted_header_keys = interesting_headers.keys()
     sorted_header_keys.sort()
 
-    buf = "%s\n" % method
+    buf = ["%s\n" % method]
     for key in sorted_header_keys:
         val = interesting_headers[key]
-        if key.startswith(provider.header_prefix):
-            buf += "%s:%s\n" % (key, val)
+        if key.startswith(header_prefix):
+            buf.append("%s:%s\n" % (key, val))
         else:
-            buf += "%s\n" % val
+            buf.append("%s\n" % val)
+    buf.append(canonical_resource(path))
+    return ''.join(buf)
+
+# the canonical resources of the paths with a query string, which are
+# requested again and again (?acl, ?uploads, retries ...)
+_canonical_resources = {}
+
+def canonical_resource(path):
+    """
+    Return the resource part of the string to sign for path.
+    """
+    if '?' not in path:
+        return path
+    resource = _canonical_resources.get(path)
+    if resource is not None:
+        return resource
 
     # don't include anything after the first ? in the resource...
     # unless it is one of the QSA of interest, defined above
     t =  path.split('?')
-    buf += t[0]
-
-    if len(t) > 1:
-        qsa = t[1].split('&')
-        qsa = [ a.split('=', 1) for a in qsa]
-        qsa = [ unquote_v(a) for a in qsa if a[0] in qsa_of_interest ]
-        if len(qsa) > 0:
-            qsa.sort(cmp=lambda x,y:cmp(x[0], y[0]))
-            qsa = [ '='.join(a) for a in qsa ]
-            buf += '?'
-            buf += '&'.join(qsa)
-
-    return buf
+    resource = t[0]
+    qsa = t[1].split('&')
+    qsa = [ a.split('=', 1) for a in qsa]
+    qsa = [ unquote_v(a) for a in qsa if a[0] in qsa_of_interest ]
+    if len(qsa) > 0:
+        qsa.sort(cmp=lambda x,y:cmp(x[0], y[0]))
+        qsa = [ '='.join(a) for a in qsa ]
+        resource += '?'
+        resource += '&'.join(qsa)
+
+    if len(_canonical_resources) >= 1024:
+        _canonical_resources.clear()
+    _canonical_resources[path] = resource
+    return resource
 
 def merge_meta(headers, metadata, provider=None):
     if not provider:
@@ -70,16 +70,140 @@ from boto.resultset import ResultSet
 
 from boto.connection import *
 import StringIO
+import botornado.handler
+import collections
 import httplib
 import mimetools
+import tornado.concurrent
+import tornado.gen
 import tornado.httpclient
 import tornado.httputil
+import tornado.ioloop
+import tornado.simple_httpclient
+import tornado.stack_context
+
+class AsyncHostConnectionPool(object):
+    """
+    Limits the number of requests in flight to one remote (host,is_secure).
+
+    Requests beyond the limit wait in a FIFO queue and are started as
+    soon as a running request to the same host completes, so a slow host
+    can only tie up its own share of the underlying AsyncHTTPClient.
+    """
+    def __init__(self, max_connections=None):
+        self.max_connections = max_connections
+        self.active = 0
+        self.queue = collections.deque()
+        self.requests = 0
+        self.waited = 0
+
+    def size(self):
+        """
+        Returns the number of requests in flight for this host.
+        """
+        return self.active
+
+    def queued(self):
+        """
+        Returns the number of requests waiting for a free slot.
+        """
+        return len(self.queue)
+
+    def _has_slot(self):
+        return self.max_connections is None or self.active < self.max_connections
+
+    def acquire(self, callback):
+        """
+        Runs callback once a slot is available.  Every acquire() must be
+        paired with a release() when the request completes.
+        """
+        self.requests += 1
+        if self._has_slot():
+            self.active += 1
+            callback()
+        else:
+            self.waited += 1
+            # keep the caller's stack context, not the one of the request
+            # that happens to release the slot.
+            self.queue.append(tornado.stack_context.wrap(callback))
+
+    def release(self):
+        self.active -= 1
+        self.drain()
+
+    def drain(self):
+        """
+        Starts waiting requests as long as there are free slots.
+        """
+        while self.queue and self._has_slot():
+            self.active += 1
+            self.queue.popleft()()
+
+class AsyncConnectionPool(object):
+    """
+    Per-host concurrency limits for asynchronous connections, the
+    counterpart of boto.connection.ConnectionPool.
+
+    A pool may be shared between several connections (e.g. an
+    AsyncS3Connection and an AsyncSQSConnection using the same
+    AsyncHTTPClient) so that traffic to one endpoint cannot starve
+    another.
+
+    The pool only limits the number of requests in flight; it does not
+    hold or reuse sockets.  tornado.simple_httpclient opens a new
+    connection for every request.  Whether connections are kept alive
+    is up to the AsyncHTTPClient implementation, e.g.
+    tornado.curl_httpclient.CurlAsyncHTTPClient does so when its
+    max_clients is at least as large as the sum of the per-host limits.
+    """
+    def __init__(self, max_connections_per_host=None):
+        self.max_connections_per_host = max_connections_per_host
+        # Mapping from (host,is_secure) to AsyncHostConnectionPool.
+        self.host_to_pool = {}
+
+    def get_host_pool(self, host, is_secure):
+        key = (host, is_secure)
+        if key not in self.host_to_pool:
+            self.host_to_pool[key] = AsyncHostConnectionPool(self.max_connections_per_host)
+        return self.host_to_pool[key]
+
+    def set_max_connections(self, host, is_secure, max_connections):
+        """
+        Overrides the concurrency limit for one host.
+        """
+        pool = self.get_host_pool(host, is_secure)
+        pool.max_connections = max_connections
+        pool.drain()
+
+    def size(self):
+        """
+        Returns the number of requests in flight over all hosts.
+        """
+        return sum(pool.size() for pool in self.host_to_pool.values())
+
+    def queued(self):
+        """
+        Returns the number of requests waiting for a slot over all hosts.
+        """
+        return sum(pool.queued() for pool in self.host_to_pool.values())
+
+    def stats(self):
+        """
+        Returns a dict mapping (host,is_secure) to a dict with the number
+        of requests in flight, waiting, started in total and started after
+        having to wait.
+        """
+        return dict((key, {'active': pool.active, 'queued': pool.queued(),
+                           'requests': pool.requests, 'waited': pool.waited})
+                    for (key, pool) in self.host_to_pool.items())
 
 class AsyncHTTPConnection(object):
     """
     a wrapper class to tornado.httpclient.AsyncHTTPClient
     """
-    def __init__(self, host, port=None, strict=None, timeout=20.0, http_client=None, **kwargs):
+    BufferSize = 8192
+
+    def __init__(self, host, port=None, strict=None, timeout=20.0, http_client=None, pool=None, **kwargs):
         """
         """
         self.method = 'GET'
@@ -88,7 +212,10 @@ class AsyncHTTPConnection(object):
         self.path = '/'
         self.headers = []
         self.body = None
+        self.body_producer = None
         self.timeout = timeout
+        self.request_timeout = None
+        self.pool = pool
         self.http_client = http_client if http_client else tornado.httpclient.AsyncHTTPClient(**kwargs)
 
     def __repr__(self):
@@ -99,7 +226,7 @@ class AsyncHTTPConnection(object):
         self.method = method
         if body is not None:
             if hasattr(body,'read'): # file-like object
-                self.body = body.read()
+                self.stream(self.file_producer(body))
             else:
                 self.body = body if body else None
         if headers is not None:
@@ -116,16 +243,84 @@ class AsyncHTTPConnection(object):
             headers.add(k, v)
         request = tornado.httpclient.HTTPRequest(
             url, method=self.method, headers=headers, body=self.body,
-            connect_timeout=self.timeout, request_timeout=self.timeout,
+            body_producer=self.body_producer,
+            connect_timeout=self.timeout, request_timeout=self.request_timeout or self.timeout,
+            # redirects are followed by AsyncConnection._mexe, which re-signs
+            # the request for the new location.
+            follow_redirects=False,
+            # boto decides whether a request carries a body (e.g. PUT with an
+            # empty body to create a bucket), so skip tornado's sanity check.
+            allow_nonstandard_methods=True,
             validate_cert=False, # FIXME: disable validation since we could not validate S3 certs
         )
         return request
 
-    def getresponse(self, callback=None):
+    def getresponse(self, callback=None, streaming_callback=None):
+        """
+        Fetches the request and passes an AsyncHTTPResponse to callback.
+
+        If streaming_callback is given, the body of a successful response is
+        passed to it chunk by chunk as it arrives instead of being buffered
+        in the response.  The body of an error response is still buffered
+        so it can be read from the response handed to callback.
+
+        A request body set with stream is only streamed by
+        tornado.simple_httpclient.  For any other client, such as
+        tornado.curl_httpclient which ignores body producers, the producer
+        is run into a buffer first and the body is sent from it.
+        """
+        request = self.getrequest()
+        if callable(streaming_callback):
+            stream = AsyncHTTPResponseStream(streaming_callback)
+            request.header_callback = stream.header_callback
+            request.streaming_callback = stream.data_callback
+        else:
+            stream = None
         def fetched(tornado_response):
+            if self.pool is not None:
+                self.pool.release()
             if callable(callback):
-                callback(AsyncHTTPResponse(tornado_response))
-        self.http_client.fetch(self.getrequest(), callback=fetched)
+                if stream is not None:
+                    callback(AsyncHTTPResponse(tornado_response, body=stream.error_body()))
+                else:
+                    callback(AsyncHTTPResponse(tornado_response))
+        def fetch():
+            try:
+                self.http_client.fetch(request, callback=fetched)
+            except Exception:
+                # fetched will never run, so give the slot back here
+                if self.pool is not None:
+                    self.pool.release()
+                raise
+        def start():
+            if self.pool is not None:
+                self.pool.acquire(fetch)
+            else:
+                fetch()
+        if request.body_producer is not None and not self.streams_bodies():
+            self._buffer_body(request, start)
+        else:
+            start()
+
+    def streams_bodies(self):
+        """
+        Whether the HTTP client sends request bodies from body producers.
+        """
+        return isinstance(self.http_client, tornado.simple_httpclient.SimpleAsyncHTTPClient)
+
+    def _buffer_body(self, request, callback):
+        chunks = []
+        def write(chunk):
+            chunks.append(chunk)
+            future = tornado.concurrent.Future()
+            future.set_result(None)
+            return future
+        def produced(future):
+            future.result()
+            request.body = ''.join(chunks)
+            request.body_producer = None
+            callback()
+        tornado.ioloop.IOLoop.current().add_future(request.body_producer(write), produced)
 
     def set_debuglevel(self, level):
         pass
@@ -152,16 +347,76 @@ class AsyncHTTPConnection(object):
         else:
             self.body = data if data else None
 
+    def stream(self, producer):
+        """
+        Send the request body from a producer instead of buffering it in
+        memory.  The producer is called with a ``write`` function once the
+        headers have been sent and must return a Future which resolves when
+        the whole body has been written.  Each ``write(chunk)`` returns a
+        Future which resolves once the chunk has been flushed, so a producer
+        waiting on it holds no more than one chunk at a time.
+
+        Clients other than ``tornado.simple_httpclient``, such as
+        ``tornado.curl_httpclient``, do not support body producers: the
+        body is then buffered before it is sent (see getresponse).
+        """
+        self.body = None
+        self.body_producer = producer
+
+    def file_producer(self, fp):
+        """
+        Returns a producer for :meth:`stream` which reads the body from the
+        file-like object ``fp`` in ``BufferSize`` chunks.
+        """
+        @tornado.gen.coroutine
+        def producer(write):
+            data = fp.read(self.BufferSize)
+            while data:
+                yield write(data)
+                data = fp.read(self.BufferSize)
+        return producer
+
 class AsyncHTTPSConnection(AsyncHTTPConnection):
     def getrequest(self, scheme='https'):
         return AsyncHTTPConnection.getrequest(self, scheme=scheme)
 
+class AsyncHTTPResponseStream(object):
+    """
+    Dispatches the body of a streamed response.  Chunks of a successful
+    (2xx) response go to the streaming callback as they arrive, while the
+    body of any other response is kept so that it can be reported in an
+    error.
+    """
+    def __init__(self, streaming_callback):
+        self.streaming_callback = streaming_callback
+        self.status = None
+        self.received_bytes = 0
+        self._error_chunks = []
+
+    def header_callback(self, line):
+        # curl reports the headers of every response in a redirect chain,
+        # so start over on each status line.
+        if line.startswith('HTTP/'):
+            self.status = tornado.httputil.parse_response_start_line(line.strip()).code
+            self._error_chunks = []
+
+    def data_callback(self, chunk):
+        if self.status is not None and 200 <= self.status < 300:
+            self.received_bytes += len(chunk)
+            self.streaming_callback(chunk)
+        else:
+            self._error_chunks.append(chunk)
+
+    def error_body(self):
+        return ''.join(self._error_chunks)
+
 class AsyncHTTPResponse(object):
     """
     a wrapper class to tornado.httpclient.HTTPResponse
     """
-    def __init__(self, tornado_response):
+    def __init__(self, tornado_response, body=None):
         self.response = tornado_response
+        self.body = body
         self._msg = None
         self.version = 10
         self.status = self.response.code
@@ -171,6 +426,8 @@ class AsyncHTTPResponse(object):
         return '<AsyncHTTPResponse: %s>' % (repr(self.response))
 
     def read(self, amt=None):
+        if self.body is not None:
+            return self.body
         return self.response.body
 
     def getheader(self, name, default=None):
@@ -187,103 +444,284 @@ class AsyncHTTPResponse(object):
     msg = property(_get_msg)
 
 class AsyncConnection(object):
-    def __init__(self, http_client=None, **kwargs):
+    MaxRedirects = 5
+
+    def __init__(self, http_client=None, pool=None, max_connections_per_host=None, **kwargs):
+        """
+        :type pool: :class:`botornado.connection.AsyncConnectionPool`
+        :param pool: A pool limiting the requests in flight per host.  Pass
+                     the same pool to several connections to share the
+                     limits between them.
+
+        :type max_connections_per_host: int
+        :param max_connections_per_host: The per-host limit of a new pool
+                                         if none is given.  Defaults to
+                                         max_connections_per_host in the
+                                         Boto section of the config, or no
+                                         limit.
+
+        The incremental_parsing attribute, which defaults to
+        incremental_parsing in the Boto section of the config, makes the
+        XML responses of list and object requests be parsed as their
+        chunks arrive instead of once the whole body has been read.
+        Such requests are neither coalesced nor retried once a chunk has
+        been received.
+        """
         self._httpclient = http_client if http_client else tornado.httpclient.AsyncHTTPClient(**kwargs)
+        if pool is None:
+            if max_connections_per_host is None:
+                max_connections_per_host = config.getint('Boto', 'max_connections_per_host', 0) or None
+            pool = AsyncConnectionPool(max_connections_per_host)
+        self._async_pool = pool
+        # request key -> callbacks waiting for the response in flight
+        self._coalesced = {}
+        self.incremental_parsing = config.getbool('Boto', 'incremental_parsing', False)
 
     def get_http_connection(self, host, is_secure):
         """
-        Gets a connection from the pool for the named host.  Returns
-        None if there is no connection that can be reused.
+        Gets a connection for the named host.  Requests made through it
+        are subject to the per-host limits of the connection pool.
         """
+        pool = self._async_pool.get_host_pool(host, is_secure)
         if is_secure:
-            return AsyncHTTPSConnection(host, http_client=self._httpclient)
+            return AsyncHTTPSConnection(host, http_client=self._httpclient, pool=pool)
         else:
-            return AsyncHTTPConnection(host, http_client=self._httpclient)
+            return AsyncHTTPConnection(host, http_client=self._httpclient, pool=pool)
 
-    def _mexe(self, request, sender=None, callback=None):
+    def _coalesce_key(self, request):
+        """
+        Identify a request by everything but its signature, which is only
+        added when it is sent.
+        """
+        return (request.method, self.is_secure, request.host, request.path,
+                tuple(sorted(request.params.items())),
+                tuple(sorted(request.headers.items())), request.body)
+
+    def _mexe(self, request, sender=None, override_num_retries=None,
+              callback=None, streaming_callback=None, request_timeout=None,
+              coalesce=False):
+        """
+        mexe - Multi-execute, retrying multiple times to handle transient
+               Internet errors by simply trying again.  Also handles
+               redirects.
+
+        Like boto.connection.AWSAuthConnection._mexe this retries on 500
+        and 503 responses and on connection errors (reported by tornado as
+        599) with binary exponential backoff, but the retries are scheduled
+        on the IOLoop instead of sleeping.  A streamed response is not
+        retried once part of its body has been handed to
+        streaming_callback.  When the retries are exhausted the last
+        response is passed to callback as is.
+
+        request_timeout overrides the timeout of the connection for
+        requests the server may hold open, such as long polls.
+
+        If coalesce is True, the request is idempotent and an identical
+        request already in flight on this connection with the same
+        override_num_retries and request_timeout is not sent again: its
+        response is passed to callback as well.
+
+        A file-like body is rewound to its initial position before it is
+        sent again.  If that position cannot be told, the request is
+        neither retried nor redirected.
+        """
         boto.log.debug('Method: %s' % request.method)
         boto.log.debug('Path: %s' % request.path)
         boto.log.debug('Data: %s' % request.body)
         boto.log.debug('Headers: %s' % request.headers)
         boto.log.debug('Host: %s' % request.host)
-
-        connection = self.get_http_connection(request.host, self.is_secure)
-        request.authorize(connection=self)
-
-        if callable(sender):
-            sender(connection, request.method, request.path,
-                   request.body, request.headers, callback)
+        if override_num_retries is None:
+            num_retries = config.getint('Boto', 'num_retries', self.num_retries)
+        else:
+            num_retries = override_num_retries
+        max_retry_delay = config.getint('Boto', 'max_retry_delay', 60)
+        state = {'i': 0, 'redirects': 0, 'streamed': False,
+                 'is_secure': self.is_secure}
+
+        if callable(streaming_callback):
+            def streamed(chunk):
+                state['streamed'] = True
+                streaming_callback(chunk)
         else:
-            connection.request(request.method, request.path, request.body,
-                               request.headers)
-            connection.getresponse(callback=callback)
+            streamed = None
+
+        body_position = None
+        if hasattr(request.body, 'read'):
+            try:
+                body_position = request.body.tell()
+            except (AttributeError, IOError, OSError):
+                pass
+        resendable = body_position is not None or not hasattr(request.body, 'read')
+
+        def send():
+            if body_position is not None:
+                request.body.seek(body_position)
+            connection = self.get_http_connection(request.host, state['is_secure'])
+            connection.request_timeout = request_timeout
+            # we now re-sign each request before it is retried
+            boto.log.debug('Token: %s' % self.provider.security_token)
+            request.authorize(connection=self)
+            if callable(sender):
+                sender(connection, request.method, request.path,
+                       request.body, request.headers, got_response)
+            else:
+                connection.request(request.method, request.path, request.body,
+                                   request.headers)
+                connection.getresponse(callback=got_response,
+                                       streaming_callback=streamed)
+
+        def got_response(response):
+            location = response.getheader('location')
+            if not resendable:
+                # the body has been consumed and cannot be sent again
+                pass
+            elif response.status == 500 or response.status == 503 or \
+                    (response.status == 599 and not state['streamed']):
+                if state['i'] < num_retries:
+                    # Use binary exponential backoff to desynchronize client requests
+                    next_sleep = min(random.random() * (2 ** state['i']), max_retry_delay)
+                    state['i'] += 1
+                    msg = 'Received %d response.  ' % response.status
+                    msg += 'Retrying in %3.1f seconds' % next_sleep
+                    boto.log.debug(msg)
+                    tornado.ioloop.IOLoop.current().call_later(next_sleep, send)
+                    return
+            elif 300 <= response.status < 400 and location and \
+                    state['redirects'] < self.MaxRedirects:
+                # the location may be relative to the current request
+                location = urlparse.urljoin('%s://%s%s' % ('https' if state['is_secure'] else 'http',
+                                                           request.host, request.path), location)
+                scheme, request.host, request.path, \
+                    params, query, fragment = urlparse.urlparse(location)
+                if query:
+                    request.path += '?' + query
+                msg = 'Redirecting: %s' % scheme + '://'
+                msg += request.host + request.path
+                boto.log.debug(msg)
+                state['is_secure'] = (scheme == 'https')
+                state['redirects'] += 1
+                send()
+                return
+            if key is not None:
+                for waiter in self._coalesced.pop(key):
+                    tornado.ioloop.IOLoop.current().add_callback(waiter, response)
+            elif callable(callback):
+                callback(response)
+
+        key = None
+        if coalesce and streaming_callback is None and sender is None:
+            # a caller asking for fewer retries or a shorter timeout must
+            # not wait for a request that was sent with more
+            key = self._coalesce_key(request) + (override_num_retries, request_timeout)
+            waiter = tornado.stack_context.wrap(callback) if callable(callback) else (lambda response: None)
+            if key in self._coalesced:
+                boto.log.debug('Coalesced with a request in flight')
+                self._coalesced[key].append(waiter)
+                return
+            self._coalesced[key] = [waiter]
+        try:
+            send()
+        except Exception:
+            if key is not None:
+                del self._coalesced[key]
+            raise
 
 class AsyncAWSAuthConnection(AsyncConnection, boto.connection.AWSAuthConnection):
-    def __init__(self, host, http_client=None, http_client_params={}, **kwargs):
-        AsyncConnection.__init__(self, http_client=http_client, **http_client_params)
+    def __init__(self, host, http_client=None, http_client_params={}, pool=None,
+                 max_connections_per_host=None, **kwargs):
+        AsyncConnection.__init__(self, http_client=http_client, pool=pool,
+                                 max_connections_per_host=max_connections_per_host,
+                                 **http_client_params)
         boto.connection.AWSAuthConnection.__init__(self, host, **kwargs)
 
-    def make_request(self, method, path, headers=None, data='', host=None, auth_path=None, sender=None, callback=None, **kwargs):
+    def make_request(self, method, path, headers=None, data='', host=None, auth_path=None, sender=None, callback=None,
+                     override_num_retries=None, streaming_callback=None, coalesce=None, **kwargs):
+        """
+        Identical GET and HEAD requests in flight at the same time are
+        sent only once, unless coalesce is False.
+        """
+        if coalesce is None:
+            coalesce = method in ('GET', 'HEAD')
         request = self.build_base_http_request(method, path, auth_path,
                                                {}, headers, data, host)
-        self._mexe(request, sender=sender, callback=callback)
+        self._mexe(request, sender=sender, override_num_retries=override_num_retries,
+                   callback=callback, streaming_callback=streaming_callback,
+                   coalesce=coalesce)
 
 class AsyncAWSQueryConnection(AsyncConnection, boto.connection.AWSQueryConnection):
-    def __init__(self, http_client=None, http_client_params={}, **kwargs):
-        AsyncConnection.__init__(self, http_client=http_client, **http_client_params)
+    def __init__(self, http_client=None, http_client_params={}, pool=None,
+                 max_connections_per_host=None, **kwargs):
+        AsyncConnection.__init__(self, http_client=http_client, pool=pool,
+                                 max_connections_per_host=max_connections_per_host,
+                                 **http_client_params)
         boto.connection.AWSQueryConnection.__init__(self, **kwargs)
 
-    def make_request(self, action, params, path, verb, callback=None):
+    def make_request(self, action, params, path, verb, callback=None, request_timeout=None,
+                     coalesce=False, streaming_callback=None):
+        """
+        Query actions are sent with GET whether they change anything or
+        not, so only the callers of read-only actions pass coalesce=True
+        to share identical requests in flight.
+        """
         request = self.build_base_http_request(verb, path, None,
                                                params, {}, '', self.server_name())
         if action:
             request.params['Action'] = action
         request.params['Version'] = self.APIVersion
-        self._mexe(request, callback=callback)
+        self._mexe(request, callback=callback, request_timeout=request_timeout,
+                   coalesce=coalesce, streaming_callback=streaming_callback)
 
-    def get_list(self, action, params, markers, path='/',
-                 parent=None, verb='GET', callback=None):
-        if not parent:
-            parent = self
-        def list_got(response):
+    def _get_parsed(self, action, params, node, path, parent, verb, callback=None,
+                    request_timeout=None, coalesce=False):
+        """
+        Make a request and parse its XML response into node, which is
+        passed to callback.  With incremental_parsing, the body is parsed
+        while it is being received, unless the request is coalesced.
+        """
+        parser = None
+        received = [0]
+        streaming_callback = None
+        if self.incremental_parsing and not coalesce:
+            parser = botornado.handler.incremental_parser(node, parent)
+            def streaming_callback(chunk):
+                received[0] += len(chunk)
+                parser.feed(chunk)
+        def parsed(response):
             body = response.read()
             boto.log.debug(body)
-            if not body:
+            if not body and not received[0]:
                 boto.log.error('Null body %s' % body)
                 raise self.ResponseError(response.status, response.reason, body)
             elif response.status == 200:
-                rs = ResultSet(markers)
-                h = boto.handler.XmlHandler(rs, parent)
-                xml.sax.parseString(body, h)
+                if parser is None:
+                    botornado.handler.parse(body, node, parent)
+                else:
+                    parser.close()
                 if callable(callback):
-                    callback(rs)
+                    callback(node)
             else:
                 boto.log.error('%s %s' % (response.status, response.reason))
                 boto.log.error('%s' % body)
                 raise self.ResponseError(response.status, response.reason, body)
-        self.make_request(action, params, path, verb, callback=list_got)
+        self.make_request(action, params, path, verb, callback=parsed,
+                          request_timeout=request_timeout, coalesce=coalesce,
+                          streaming_callback=streaming_callback)
+
+    def get_list(self, action, params, markers, path='/',
+                 parent=None, verb='GET', callback=None, request_timeout=None,
+                 coalesce=False):
+        if not parent:
+            parent = self
+        self._get_parsed(action, params, ResultSet(markers), path, parent, verb,
+                         callback=callback, request_timeout=request_timeout,
+                         coalesce=coalesce)
 
     def get_object(self, action, params, cls, path='/',
-                   parent=None, verb='GET', callback=None):
+                   parent=None, verb='GET', callback=None, coalesce=False):
         if not parent:
             parent = self
-        def object_got(response):
-            body = response.read()
-            boto.log.debug(body)
-            if not body:
-                boto.log.error('Null body %s' % body)
-                raise self.ResponseError(response.status, response.reason, body)
-            elif response.status == 200:
-                obj = cls(parent)
-                h = boto.handler.XmlHandler(obj, parent)
-                xml.sax.parseString(body, h)
-                if callable(callback):
-                    callback(obj)
-            else:
-                boto.log.error('%s %s' % (response.status, response.reason))
-                boto.log.error('%s' % body)
-                raise self.ResponseError(response.status, response.reason, body)
-        self.make_request(action, params, path, verb, callback=object_got)
+        self._get_parsed(action, params, cls(parent), path, parent, verb,
+                         callback=callback, coalesce=coalesce)
 
     def get_status(self, action, params, path='/', parent=None, verb='GET', callback=None):
         if not parent:
@@ -296,8 +734,7 @@ class AsyncAWSQueryConnection(AsyncConnection, boto.connection.AWSQueryConnectio
                 raise self.ResponseError(response.status, response.reason, body)
             elif response.status == 200:
                 rs = ResultSet()
-                h = boto.handler.XmlHandler(rs, parent)
-                xml.sax.parseString(body, h)
+                botornado.handler.parse(body, rs, parent)
                 if callable(callback):
                     callback(rs.status)
             else:
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+"""
+Parsing of XML responses into boto objects
+"""
+
+import xml.parsers.expat
+import xml.sax
+from boto import config
+
+from boto.handler import *
+
+class ExpatXmlHandler(object):
+    """
+    Drives the startElement/endElement methods of a tree of boto
+    objects exactly like :class:`boto.handler.XmlHandler`, so the same
+    objects are built, but from expat callbacks instead of going through
+    xml.sax, and the text of an element is joined once instead of being
+    concatenated chunk by chunk.
+    """
+
+    def __init__(self, root_node, connection):
+        self.connection = connection
+        self.nodes = [('root', root_node)]
+        self.text = []
+        self._parser = None
+
+    def startElement(self, name, attrs):
+        del self.text[:]
+        new_node = self.nodes[-1][1].startElement(name, attrs, self.connection)
+        if new_node is not None:
+            self.nodes.append((name, new_node))
+
+    def endElement(self, name):
+        node_name, node = self.nodes[-1]
+        node.endElement(name, ''.join(self.text), self.connection)
+        if node_name == name:
+            self.nodes.pop()
+        del self.text[:]
+
+    def _create_parser(self):
+        parser = xml.parsers.expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = self.startElement
+        parser.EndElementHandler = self.endElement
+        parser.CharacterDataHandler = self.text.append
+        return parser
+
+    def parse(self, body):
+        self._create_parser().Parse(body, True)
+
+    def feed(self, data):
+        """
+        Parse the next chunk of the body; the objects are built as soon
+        as their elements are complete.
+        """
+        if self._parser is None:
+            self._parser = self._create_parser()
+        self._parser.Parse(data, False)
+
+    def close(self):
+        """
+        Finish parsing the chunks given to feed, raising an
+        xml.parsers.expat.ExpatError if the document is incomplete.
+        """
+        parser, self._parser = self._parser or self._create_parser(), None
+        parser.Parse('', True)
+
+def parse_sax(body, root_node, connection):
+    xml.sax.parseString(body, XmlHandler(root_node, connection))
+
+def parse_expat(body, root_node, connection):
+    ExpatXmlHandler(root_node, connection).parse(body)
+
+def incremental_sax(root_node, connection):
+    parser = xml.sax.make_parser()
+    parser.setContentHandler(XmlHandler(root_node, connection))
+    return parser
+
+def incremental_expat(root_node, connection):
+    return ExpatXmlHandler(root_node, connection)
+
+Parsers = {'sax': (parse_sax, incremental_sax),
+           'expat': (parse_expat, incremental_expat)}
+
+# the parser used by parse and incremental_parser, set with set_parser
+# or the xml_parser option in the Boto section of the config
+_parser, _incremental_parser = Parsers[config.get('Boto', 'xml_parser', 'expat')]
+
+def set_parser(name):
+    """
+    Select the parser used for all responses: 'expat' (the default) or
+    'sax', the xml.sax based parser of boto.
+    """
+    global _parser, _incremental_parser
+    _parser, _incremental_parser = Parsers[name]
+
+def parse(body, root_node, connection):
+    """
+    Parse the XML response body into root_node, calling the
+    startElement and endElement methods of root_node and of the nodes it
+    returns.
+    """
+    _parser(body, root_node, connection)
+
+def incremental_parser(root_node, connection):
+    """
+    Return a parser of a response body given in chunks: each chunk is
+    passed to its feed method as it arrives, and its close method is
+    called at the end of the body.  root_node is built as with parse.
+    """
+    return _incremental_parser(root_node, connection)
+
+# vim:set ft=python sw=4 :
@@ -30,18 +30,29 @@ from boto.s3.prefix import Prefix
 from boto.s3.deletemarker import DeleteMarker
 from boto.s3.multipart import MultiPartUpload
 from boto.s3.multipart import CompleteMultiPartUpload
+from boto.s3.multidelete import MultiDeleteResult
+from boto.s3.multidelete import Error
 from boto.s3.bucketlistresultset import BucketListResultSet
 from boto.s3.bucketlistresultset import VersionedBucketListResultSet
 from boto.s3.bucketlistresultset import MultiPartUploadListResultSet
 import boto.jsonresponse
 import boto.utils
 import xml.sax
+import xml.sax.saxutils
+import StringIO
 import urllib
 import re
 from collections import defaultdict
+import tornado.concurrent
+import tornado.gen
+import tornado.ioloop
 
 from boto.s3.bucket import *
+import botornado.handler
 import botornado.s3.key
+import botornado.s3.bucketlistresultset
+import botornado.s3.multipart
+from tornado.concurrent import return_future
 
 class AsyncBucket(Bucket):
     def __init__(self, connection=None, name=None, key_class=botornado.s3.key.AsyncKey, **kwargs):
@@ -50,6 +61,7 @@ class AsyncBucket(Bucket):
     def __repr__(self):
         return '<AsyncBucket: %s>' % self.name
 
+    @return_future
     def lookup(self, key_name, headers=None, callback=None):
         """
         Deprecated: Please use get_key method.
@@ -60,52 +72,105 @@ class AsyncBucket(Bucket):
         :rtype: :class:`boto.s3.key.Key`
         :returns: A Key object from this bucket.
         """
-        return self.get_key(key_name, headers=headers, callback=callback)
+        self.get_key(key_name, headers=headers, callback=callback)
  
+    @return_future
     def get_key(self, key_name, headers=None, version_id=None, callback=None):
+        """
+        Check to see if a particular key exists within the bucket.  This
+        method uses a HEAD request to check for the existance of the key.
+        Returns: An instance of a Key object or None
+
+        If the connection has a metadata_cache, the HEAD response is
+        taken from it when no headers are given.
+        """
+        cache = self.connection.metadata_cache
+        if cache is not None and not headers:
+            cache_key = (self.name, key_name, version_id)
+            def head_fetched(future):
+                response = future.result()
+                if callable(callback):
+                    callback(self._key_from_response(key_name, response) if response else None)
+            tornado.ioloop.IOLoop.current().add_future(
+                cache.fetch(cache_key, lambda: self._head_key(key_name, version_id,
+                                                              cache.get_stale(cache_key))),
+                head_fetched)
+            return
+        def got_key(response):
+            if callable(callback):
+                callback(self._key_from_response(key_name, response) if response else None)
+        self._head_key(key_name, version_id, headers=headers, callback=got_key)
+
+    @return_future
+    def _head_key(self, key_name, version_id=None, cached=None, headers=None, callback=None):
+        """
+        Send a HEAD request for key_name and pass the response to callback,
+        or None if there is no such key.  If the response cached is given,
+        the request is conditional on its ETag, and cached is passed to
+        callback if the key has not changed.
+        """
         if version_id:
             query_args = 'versionId=%s' % version_id
         else:
             query_args = None
-        def got_key(response):
+        if cached is not None and cached.getheader('etag'):
+            headers = headers and headers.copy() or {}
+            headers['If-None-Match'] = cached.getheader('etag')
+        def got_head(response):
             # Allow any success status (2xx) - for example this lets us
             # support Range gets, which return status 206:
             if response.status/100 == 2:
-#               response.body
-                k = self.key_class(self)
-                provider = self.connection.provider
-                k.metadata = boto.utils.get_aws_metadata(response.msg, provider)
-                k.etag = response.getheader('etag')
-                k.content_type = response.getheader('content-type')
-                k.content_encoding = response.getheader('content-encoding')
-                k.last_modified = response.getheader('last-modified')
-                # the following machinations are a workaround to the fact that
-                # apache/fastcgi omits the content-length header on HEAD
-                # requests when the content-length is zero.
-                # See http://goo.gl/0Tdax for more details.
-                clen = response.getheader('content-length')
-                if clen:
-                    k.size = int(response.getheader('content-length'))
-                else:
-                    k.size = 0
-                k.cache_control = response.getheader('cache-control')
-                k.name = key_name
-                k.handle_version_headers(response)
-                k.handle_encryption_headers(response)
                 if callable(callback):
-                    callback(k)
+                    callback(response)
+            elif response.status == 304 and cached is not None:
+                if callable(callback):
+                    callback(cached)
+            elif response.status == 404:
+#               response.read()
+                if callable(callback):
+                    callback(None)
             else:
-                if response.status == 404:
-#                   response.read()
-                    if callable(callback):
-                        callback(None)
-                else:
-                    raise self.connection.provider.storage_response_error(
-                        response.status, response.reason, '')
+                raise self.connection.provider.storage_response_error(
+                    response.status, response.reason, '')
+        self.connection.make_request('HEAD', self.name, key_name,
+                                     headers=headers,
+                                     query_args=query_args, callback=got_head)
 
-        response = self.connection.make_request('HEAD', self.name, key_name,
-                                                headers=headers,
-                                                query_args=query_args, callback=got_key)
+    def _key_from_response(self, key_name, response):
+#       response.body
+        k = self.key_class(self)
+        provider = self.connection.provider
+        k.metadata = boto.utils.get_aws_metadata(response.msg, provider)
+        k.etag = response.getheader('etag')
+        k.content_type = response.getheader('content-type')
+        k.content_encoding = response.getheader('content-encoding')
+        k.last_modified = response.getheader('last-modified')
+        # the following machinations are a workaround to the fact that
+        # apache/fastcgi omits the content-length header on HEAD
+        # requests when the content-length is zero.
+        # See http://goo.gl/0Tdax for more details.
+        clen = response.getheader('content-length')
+        if clen:
+            k.size = int(response.getheader('content-length'))
+        else:
+            k.size = 0
+        k.cache_control = response.getheader('cache-control')
+        k.name = key_name
+        k.handle_version_headers(response)
+        k.handle_encryption_headers(response)
+        return k
+
+    def _invalidate_caches(self, key_name, version_id=None):
+        """
+        Drop key_name from the metadata and content caches of the
+        connection after it has been written or deleted.
+        """
+        for cache in (getattr(self.connection, 'metadata_cache', None),
+                      getattr(self.connection, 'content_cache', None)):
+            if cache is not None:
+                cache.invalidate((self.name, key_name, None))
+                if version_id:
+                    cache.invalidate((self.name, key_name, version_id))
 
     def _get_all(self, element_map, initial_query_string='',
                  headers=None, callback=None, **params):
@@ -122,23 +187,33 @@ class AsyncBucket(Bucket):
             s = initial_query_string + '&' + '&'.join(l)
         else:
             s = initial_query_string
+        rs = boto.resultset.ResultSet(element_map)
+        parser = None
+        streaming_callback = None
+        if self.connection.incremental_parsing:
+            # parse the listing while it is being received
+            parser = botornado.handler.incremental_parser(rs, self)
+            streaming_callback = parser.feed
         def _got_all(response):
             body = response.read()
             boto.log.debug(body)
             if response.status == 200:
-                rs = boto.resultset.ResultSet(element_map)
-                h = boto.handler.XmlHandler(rs, self)
-                xml.sax.parseString(body, h)
+                if parser is None:
+                    botornado.handler.parse(body, rs, self)
+                else:
+                    parser.close()
                 if callable(callback):
                     callback(rs)
             else:
-                raise self.connection.provider.storage_response(
+                raise self.connection.provider.storage_response_error(
                     response.status, response.reason, body)
 
         self.connection.make_request('GET', self.name,
                                      headers=headers,
-                                     query_args=s, callback=_got_all)
+                                     query_args=s, callback=_got_all,
+                                     streaming_callback=streaming_callback)
 
+    @return_future
     def get_all_keys(self, headers=None, callback=None, **params):
         """
         A lower-level method for listing contents of a bucket.
@@ -168,10 +243,248 @@ class AsyncBucket(Bucket):
         :return: The result from S3 listing the keys requested
         
         """
-        return self._get_all([('Contents', self.key_class),
-                              ('CommonPrefixes', boto.s3.prefix.Prefix)],
-                              '', headers, callback=callback, **params)
+        self._get_all([('Contents', self.key_class),
+                       ('CommonPrefixes', boto.s3.prefix.Prefix)],
+                       '', headers, callback=callback, **params)
+
+    @return_future
+    def get_all_versions(self, headers=None, callback=None, **params):
+        """
+        A lower-level, version-aware method for listing contents of a bucket.
+        See :meth:`boto.s3.bucket.Bucket.get_all_versions` for the parameters.
+
+        :rtype: ResultSet
+        :return: The result from S3 listing the keys requested
+        """
+        self._get_all([('Version', self.key_class),
+                       ('CommonPrefixes', boto.s3.prefix.Prefix),
+                       ('DeleteMarker', DeleteMarker)],
+                      'versions', headers, callback=callback, **params)
+
+    @return_future
+    def get_all_multipart_uploads(self, headers=None, callback=None, **params):
+        """
+        A lower-level method for listing active MultiPart uploads for a
+        bucket.  See :meth:`boto.s3.bucket.Bucket.get_all_multipart_uploads`
+        for the parameters.
+
+        :rtype: ResultSet
+        :return: The result from S3 listing the uploads requested
+        """
+        self._get_all([('Upload', botornado.s3.multipart.AsyncMultiPartUpload)],
+                      'uploads', headers, callback=callback, **params)
+
+    def list(self, prefix='', delimiter='', marker='', headers=None):
+        """
+        List key objects within a bucket.  This returns an instance of an
+        AsyncBucketListResultSet that fetches the pages from S3 one after
+        another, requesting the next page while the current one is consumed.
+
+            rs = bucket.list(prefix='foo/')
+            while (yield rs.fetch_next):
+                key = rs.next_object()
+
+        :rtype: :class:`botornado.s3.bucketlistresultset.AsyncBucketListResultSet`
+        :return: an instance of a AsyncBucketListResultSet that handles paging, etc
+        """
+        return botornado.s3.bucketlistresultset.AsyncBucketListResultSet(
+            self, prefix, delimiter, marker, headers)
+
+    def list_parallel(self, prefix='', delimiter='/', max_concurrency=8,
+                      ordered=True, headers=None):
+        """
+        List all key objects below prefix with several concurrent listings,
+        one for each of the CommonPrefixes found with delimiter.  This is
+        used like list.
+
+        :type max_concurrency: int
+        :param max_concurrency: The number of prefixes listed at the same time.
+
+        :type ordered: bool
+        :param ordered: If True, the keys are returned in lexicographic
+                        order, as with list.  Otherwise they are returned
+                        as soon as they are received.
+
+        :rtype: :class:`botornado.s3.bucketlistresultset.AsyncShardedBucketListResultSet`
+        :return: an instance of a AsyncShardedBucketListResultSet
+        """
+        return botornado.s3.bucketlistresultset.AsyncShardedBucketListResultSet(
+            self, prefix, delimiter, max_concurrency, ordered, headers)
+
+    def list_versions(self, prefix='', delimiter='', key_marker='',
+                      version_id_marker='', headers=None):
+        """
+        List version objects within a bucket.  See list.
+
+        :rtype: :class:`botornado.s3.bucketlistresultset.AsyncVersionedBucketListResultSet`
+        :return: an instance of a AsyncVersionedBucketListResultSet that handles paging, etc
+        """
+        return botornado.s3.bucketlistresultset.AsyncVersionedBucketListResultSet(
+            self, prefix, delimiter, key_marker, version_id_marker, headers)
+
+    def list_multipart_uploads(self, key_marker='',
+                               upload_id_marker='',
+                               headers=None):
+        """
+        List multipart upload objects within a bucket.  See list.
+
+        :rtype: :class:`botornado.s3.bucketlistresultset.AsyncMultiPartUploadListResultSet`
+        :return: an instance of a AsyncMultiPartUploadListResultSet that handles paging, etc
+        """
+        return botornado.s3.bucketlistresultset.AsyncMultiPartUploadListResultSet(
+            self, key_marker, upload_id_marker, headers)
+
+    def _delete_entry(self, key, result):
+        """
+        Return the (key_name, version_id) to be deleted for an entry of
+        delete_keys, or None after recording an Error in result if the
+        entry cannot be deleted.
+        """
+        if isinstance(key, basestring):
+            return key, None
+        elif isinstance(key, tuple) and len(key) == 2:
+            return key
+        elif (isinstance(key, Key) or isinstance(key, DeleteMarker)) and key.name:
+            return key.name, key.version_id
+        if isinstance(key, Prefix):
+            key_name = key.name
+            code = 'PrefixSkipped'   # Don't delete Prefix
+        else:
+            key_name = repr(key)     # try get a string
+            code = 'InvalidArgument' # other unknown type
+        message = 'Invalid. No delete action taken for this object.'
+        result.errors.append(Error(key_name, code=code, message=message))
+        return None
+
+    @return_future
+    def _delete_chunk(self, chunk, result, quiet=False, mfa_token=None,
+                      headers=None, callback=None):
+        provider = self.connection.provider
+        hdrs = headers and headers.copy() or {}
+        data = u"""<?xml version="1.0" encoding="UTF-8"?>"""
+        data += u"<Delete>"
+        if quiet:
+            data += u"<Quiet>true</Quiet>"
+        for key_name, version_id in chunk:
+            data += u"<Object><Key>%s</Key>" % xml.sax.saxutils.escape(key_name)
+            if version_id:
+                data += u"<VersionId>%s</VersionId>" % version_id
+            data += u"</Object>"
+        data += u"</Delete>"
+        data = data.encode('utf-8')
+        md5 = boto.utils.compute_md5(StringIO.StringIO(data))
+        hdrs['Content-MD5'] = md5[1]
+        hdrs['Content-Type'] = 'text/xml'
+        if mfa_token:
+            hdrs[provider.mfa_header] = ' '.join(mfa_token)
+        def chunk_deleted(response):
+            body = response.read()
+            for key_name, version_id in chunk:
+                self._invalidate_caches(key_name, version_id)
+            if response.status == 200:
+                botornado.handler.parse(body, result, self)
+                if callable(callback):
+                    callback(result)
+            else:
+                raise provider.storage_response_error(response.status,
+                                                      response.reason,
+                                                      body)
+        self.connection.make_request('POST', self.name,
+                                     headers=hdrs,
+                                     query_args='delete',
+                                     data=data, callback=chunk_deleted)
+
+    @return_future
+    def delete_keys(self, keys, quiet=True, mfa_token=None, headers=None,
+                    max_concurrency=4, callback=None):
+        """
+        Deletes a set of keys using S3's Multi-object delete API, 1000 keys
+        per request with up to max_concurrency requests in flight.  If a
+        VersionID is specified for that key then that version is removed.
+        The callback is passed a MultiDeleteResult Object, which contains
+        Deleted and Error elements for each key you ask to delete.
+
+        :type keys: list
+        :param keys: A list or iterator of either key_names or
+                     (key_name, versionid) pairs or Key instances, or an
+                     asynchronous listing such as the one returned by
+                     list, which is consumed as the deletes proceed.
+
+        :type quiet: boolean
+        :param quiet: In quiet mode the response includes only keys where
+                      the delete operation encountered an error.
+
+        :type mfa_token: tuple or list of strings
+        :param mfa_token: A tuple or list consisting of the serial number
+                          from the MFA device and the current value of
+                          the six-digit token associated with the device.
 
+        :type max_concurrency: int
+        :param max_concurrency: The number of delete requests in flight.
+        """
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency must be positive')
+        result = MultiDeleteResult(self)
+        if hasattr(keys, 'fetch_next'):
+            ikeys = None
+        else:
+            ikeys = iter(keys)
+
+        @tornado.gen.coroutine
+        def next_chunk():
+            chunk = []
+            while len(chunk) < 1000:
+                if ikeys is None:
+                    if not (yield keys.fetch_next):
+                        break
+                    key = keys.next_object()
+                else:
+                    try:
+                        key = ikeys.next()
+                    except StopIteration:
+                        break
+                entry = self._delete_entry(key, result)
+                if entry:
+                    chunk.append(entry)
+            raise tornado.gen.Return(chunk)
+
+        @tornado.gen.coroutine
+        def delete_all():
+            state = {'running': 0, 'freed': None}
+            failures = []
+            def chunk_deleted(future):
+                state['running'] -= 1
+                if future.exception() is not None:
+                    failures.append(future)
+                if state['freed'] and not state['freed'].done():
+                    state['freed'].set_result(None)
+            while not failures:
+                chunk = yield next_chunk()
+                if not chunk:
+                    break
+                while state['running'] >= max_concurrency:
+                    state['freed'] = tornado.concurrent.Future()
+                    yield state['freed']
+                if failures:
+                    break
+                state['running'] += 1
+                tornado.ioloop.IOLoop.current().add_future(
+                    self._delete_chunk(chunk, result, quiet, mfa_token, headers),
+                    chunk_deleted)
+            while state['running']:
+                state['freed'] = tornado.concurrent.Future()
+                yield state['freed']
+            if failures:
+                failures[0].result()
+            raise tornado.gen.Return(result)
+
+        def all_deleted(future):
+            result = future.result()
+            if callable(callback):
+                callback(result)
+        tornado.ioloop.IOLoop.current().add_future(delete_all(), all_deleted)
+
+    @return_future
     def delete_key(self, key_name, headers=None,
                    version_id=None, mfa_token=None, callback=None):
         """
@@ -203,6 +516,7 @@ class AsyncBucket(Bucket):
             headers[provider.mfa_header] = ' '.join(mfa_token)
         def key_deleted(response):
             body = response.read()
+            self._invalidate_caches(key_name, version_id)
             if response.status != 204:
                 raise provider.storage_response_error(response.status,
                                                       response.reason, body)
@@ -212,7 +526,113 @@ class AsyncBucket(Bucket):
                                      headers=headers,
                                      query_args=query_args, callback=key_deleted)
         
+    @return_future
+    def initiate_multipart_upload(self, key_name, headers=None,
+                                  reduced_redundancy=False,
+                                  metadata=None, encrypt_key=False, callback=None):
+        """
+        Start a multipart upload operation.
+
+        :type key_name: string
+        :param key_name: The name of the key that will ultimately result from
+                         this multipart upload operation.
+
+        :type headers: dict
+        :param headers: Additional HTTP headers to send and store with the
+                        resulting key in S3.
+
+        :type reduced_redundancy: boolean
+        :param reduced_redundancy: Use the reduced redundancy storage class
+                                   for the resulting key.
+
+        :type metadata: dict
+        :param metadata: Any metadata that you would like to set on the key
+                         that results from the multipart upload.
+
+        :type encrypt_key: bool
+        :param encrypt_key: If True, the resulting key will be encrypted
+                            on the server-side by S3.
+
+        The callback is passed a
+        :class:`botornado.s3.multipart.AsyncMultiPartUpload`.
+        """
+        query_args = 'uploads'
+        provider = self.connection.provider
+        if headers is None:
+            headers = {}
+        if reduced_redundancy:
+            storage_class_header = provider.storage_class_header
+            if storage_class_header:
+                headers[storage_class_header] = 'REDUCED_REDUNDANCY'
+        if encrypt_key:
+            headers[provider.server_side_encryption_header] = 'AES256'
+        if metadata is None:
+            metadata = {}
+
+        headers = boto.utils.merge_meta(headers, metadata,
+                self.connection.provider)
+        def upload_initiated(response):
+            body = response.read()
+            boto.log.debug(body)
+            if response.status == 200:
+                resp = botornado.s3.multipart.AsyncMultiPartUpload(self)
+                botornado.handler.parse(body, resp, self)
+                if callable(callback):
+                    callback(resp)
+            else:
+                raise provider.storage_response_error(
+                    response.status, response.reason, body)
+        self.connection.make_request('POST', self.name, key_name,
+                                     query_args=query_args,
+                                     headers=headers, callback=upload_initiated)
+
+    @return_future
+    def complete_multipart_upload(self, key_name, upload_id,
+                                  xml_body, headers=None, callback=None):
+        """
+        Complete a multipart upload operation.
+        """
+        query_args = 'uploadId=%s' % upload_id
+        if headers is None:
+            headers = {}
+        headers['Content-Type'] = 'text/xml'
+        def upload_completed(response):
+            body = response.read()
+            # Some errors will be reported in the body of the response
+            # even though the HTTP response code is 200.
+            contains_error = body.find('<Error>') > 0
+            boto.log.debug(body)
+            self._invalidate_caches(key_name)
+            if response.status == 200 and not contains_error:
+                resp = CompleteMultiPartUpload(self)
+                botornado.handler.parse(body, resp, self)
+                if callable(callback):
+                    callback(resp)
+            else:
+                raise self.connection.provider.storage_response_error(
+                    response.status, response.reason, body)
+        self.connection.make_request('POST', self.name, key_name,
+                                     query_args=query_args,
+                                     headers=headers, data=xml_body,
+                                     callback=upload_completed)
+
+    @return_future
+    def cancel_multipart_upload(self, key_name, upload_id, headers=None, callback=None):
+        query_args = 'uploadId=%s' % upload_id
+        def upload_cancelled(response):
+            body = response.read()
+            boto.log.debug(body)
+            if response.status != 204:
+                raise self.connection.provider.storage_response_error(
+                    response.status, response.reason, body)
+            if callable(callback):
+                callback(True)
+        self.connection.make_request('DELETE', self.name, key_name,
+                                     query_args=query_args,
+                                     headers=headers, callback=upload_cancelled)
+
+    @return_future
     def delete(self, headers=None, callback=None):
-        return self.connection.delete_bucket(self.name, headers=headers, callback=callback)
+        self.connection.delete_bucket(self.name, headers=headers, callback=callback)
 
 # vim:set ft=python sw=4 :
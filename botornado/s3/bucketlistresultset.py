@@ -0,0 +1,356 @@
+# Copyright (c) 2006,2007 Mitch Garnaat http://garnaat.org/
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, dis-
+# tribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the fol-
+# lowing conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABIL-
+# ITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT
+# SHALL THE AUTHOR BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import collections
+import functools
+import sys
+import tornado.concurrent
+import tornado.gen
+import tornado.ioloop
+from boto.exception import BotoClientError
+from boto.s3.prefix import Prefix
+
+from boto.s3.bucketlistresultset import *
+
+class AsyncListResultSet(object):
+    """
+    Base class of the asynchronous listings of a bucket.  Subclasses
+    fetch one page with _get_page and move their markers past it with
+    _advance.
+
+    Results are read with fetch_next and next_object:
+
+        while (yield rs.fetch_next):
+            key = rs.next_object()
+
+    or with each.  The next page is requested as soon as the consumer
+    starts on the last page that has been received, so S3 latency
+    overlaps with the processing of the keys.  At most one request is
+    in flight and at most two pages are buffered.
+    """
+    def __init__(self, bucket=None, headers=None):
+        self.bucket = bucket
+        self.headers = headers
+        self._items = collections.deque()
+        self._page_len = 0
+        self._pending = None
+        self._truncated = True
+
+    def _get_page(self):
+        """
+        Return a Future of the ResultSet of the next page.
+        """
+        raise NotImplementedError
+
+    def _advance(self, rs):
+        """
+        Move the markers past the truncated page rs, raising
+        BotoClientError if it gives nothing to continue from, since the
+        same page would be requested again and again.
+        """
+        raise NotImplementedError
+
+    def _fetch_page(self):
+        fetched = tornado.concurrent.Future()
+        def page_got(page):
+            self._pending = None
+            if page.exception() is not None:
+                fetched.set_exc_info(page.exc_info())
+                return
+            rs = page.result()
+            if rs.is_truncated:
+                try:
+                    self._advance(rs)
+                except Exception:
+                    fetched.set_exc_info(sys.exc_info())
+                    return
+            self._items.extend(rs)
+            self._page_len = len(rs)
+            self._truncated = rs.is_truncated
+            self._prefetch()
+            fetched.set_result(True)
+        self._pending = fetched
+        tornado.ioloop.IOLoop.current().add_future(self._get_page(), page_got)
+
+    def _prefetch(self):
+        if self._pending is None and self._truncated and \
+                len(self._items) <= self._page_len:
+            self._fetch_page()
+
+    @property
+    def fetch_next(self):
+        """
+        A Future that resolves to True if there is another object to be
+        read with next_object, or to False at the end of the listing.
+        """
+        future = tornado.concurrent.Future()
+        if self._items:
+            future.set_result(True)
+            return future
+        if self._pending is None:
+            if not self._truncated:
+                future.set_result(False)
+                return future
+            self._fetch_page()
+        def fetched(pending):
+            if pending.exception() is not None:
+                future.set_exc_info(pending.exc_info())
+            else:
+                # a page may be empty even though it is truncated
+                tornado.concurrent.chain_future(self.fetch_next, future)
+        tornado.ioloop.IOLoop.current().add_future(self._pending, fetched)
+        return future
+
+    def next_object(self):
+        """
+        Return the next object of the listing, or None if fetch_next has
+        not resolved to True first.
+        """
+        if not self._items:
+            return None
+        item = self._items.popleft()
+        self._prefetch()
+        return item
+
+    def each(self, callback):
+        """
+        Call callback with every object of the listing and then with None.
+        Returning False from callback stops the iteration.  Returns a
+        Future that resolves once the iteration has ended, or fails with
+        the error of the listing or of callback, in which case callback
+        is not called with None.
+        """
+        done = tornado.concurrent.Future()
+        def fetched(future):
+            try:
+                if future.result():
+                    while self._items:
+                        if callback(self.next_object()) is False:
+                            done.set_result(None)
+                            return
+                    tornado.ioloop.IOLoop.current().add_future(self.fetch_next, fetched)
+                else:
+                    callback(None)
+                    done.set_result(None)
+            except Exception:
+                done.set_exc_info(sys.exc_info())
+        tornado.ioloop.IOLoop.current().add_future(self.fetch_next, fetched)
+        return done
+
+class AsyncBucketListResultSet(AsyncListResultSet):
+    """
+    An asynchronous resultset for listing keys within a bucket.
+    """
+    def __init__(self, bucket=None, prefix='', delimiter='', marker='', headers=None):
+        AsyncListResultSet.__init__(self, bucket, headers)
+        self.prefix = prefix
+        self.delimiter = delimiter
+        self.marker = marker
+
+    def _get_page(self):
+        return self.bucket.get_all_keys(prefix=self.prefix, marker=self.marker,
+                                        delimiter=self.delimiter, headers=self.headers)
+
+    def _advance(self, rs):
+        if rs.next_marker:
+            self.marker = rs.next_marker
+        elif len(rs):
+            self.marker = rs[-1].name
+        else:
+            raise BotoClientError('Truncated listing page without a marker')
+
+class AsyncVersionedBucketListResultSet(AsyncListResultSet):
+    """
+    An asynchronous resultset for listing versions within a bucket.
+    """
+    def __init__(self, bucket=None, prefix='', delimiter='', key_marker='',
+                 version_id_marker='', headers=None):
+        AsyncListResultSet.__init__(self, bucket, headers)
+        self.prefix = prefix
+        self.delimiter = delimiter
+        self.key_marker = key_marker
+        self.version_id_marker = version_id_marker
+
+    def _get_page(self):
+        return self.bucket.get_all_versions(prefix=self.prefix,
+                                            key_marker=self.key_marker,
+                                            version_id_marker=self.version_id_marker,
+                                            delimiter=self.delimiter,
+                                            headers=self.headers, max_keys=999)
+
+    def _advance(self, rs):
+        if not rs.next_key_marker:
+            raise BotoClientError('Truncated listing page without a marker')
+        self.key_marker = rs.next_key_marker
+        self.version_id_marker = rs.next_version_id_marker
+
+class AsyncMultiPartUploadListResultSet(AsyncListResultSet):
+    """
+    An asynchronous resultset for listing multipart uploads within a bucket.
+    """
+    def __init__(self, bucket=None, key_marker='',
+                 upload_id_marker='', headers=None):
+        AsyncListResultSet.__init__(self, bucket, headers)
+        self.key_marker = key_marker
+        self.upload_id_marker = upload_id_marker
+
+    def _get_page(self):
+        return self.bucket.get_all_multipart_uploads(key_marker=self.key_marker,
+                                                     upload_id_marker=self.upload_id_marker,
+                                                     headers=self.headers)
+
+    def _advance(self, rs):
+        if not rs.next_key_marker:
+            raise BotoClientError('Truncated listing page without a marker')
+        self.key_marker = rs.next_key_marker
+        self.upload_id_marker = rs.next_upload_id_marker
+
+class AsyncShardedBucketListResultSet(AsyncListResultSet):
+    """
+    An asynchronous resultset for listing all keys below a prefix with
+    several concurrent listings.
+
+    The keyspace is discovered with a delimiter listing.  Each of the
+    CommonPrefixes found is a shard.  Up to max_concurrency shards are
+    listed at the same time, each with an
+    :class:`AsyncBucketListResultSet`.  If the discovery finds a single
+    prefix and no keys, the discovery continues one level down.  The
+    discovery listing is read a page at a time, as the shards it has
+    found are used up, so a flat keyspace is listed like a plain listing.
+
+    When ordered is True, the keys come back in the same lexicographic
+    order as a plain listing, and only the next max_concurrency shards
+    are listed ahead of the consumer.  When ordered is False, keys are
+    returned as soon as any shard delivers them.
+    """
+    def __init__(self, bucket=None, prefix='', delimiter='/', max_concurrency=8,
+                 ordered=True, headers=None):
+        AsyncListResultSet.__init__(self, bucket, headers)
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency must be positive')
+        self.prefix = prefix
+        self.delimiter = delimiter
+        self.max_concurrency = max_concurrency
+        self.ordered = ordered
+        self._segments = None
+        self._shards = collections.deque()
+        self._discovery_prefix = prefix
+        self._discovery_marker = ''
+        self._discovery_truncated = True
+
+    @tornado.gen.coroutine
+    def _discover(self):
+        """
+        Read the next page of the discovery listing into _segments.
+        """
+        while True:
+            rs = yield self.bucket.get_all_keys(prefix=self._discovery_prefix,
+                                                marker=self._discovery_marker,
+                                                delimiter=self.delimiter,
+                                                headers=self.headers)
+            # S3 returns all the keys of a page before its CommonPrefixes,
+            # which have to be merged by name to keep the listing ordered
+            segments = sorted(rs, key=lambda segment: segment.name)
+            if self._segments is None and not rs.is_truncated and \
+                    len(segments) == 1 and isinstance(segments[0], Prefix) and \
+                    segments[0].name != self._discovery_prefix:
+                self._discovery_prefix = segments[0].name
+                continue
+            break
+        if self._segments is None:
+            self._segments = collections.deque()
+        self._segments.extend(segments)
+        self._discovery_truncated = rs.is_truncated
+        if rs.is_truncated:
+            if not segments and not rs.next_marker:
+                raise BotoClientError('Truncated listing page without a marker')
+            self._discovery_marker = rs.next_marker or segments[-1].name
+
+    def _running(self):
+        return len([s for s in self._shards if isinstance(s, AsyncListResultSet)])
+
+    def _open_shards(self):
+        running = self._running()
+        while self._segments and running < self.max_concurrency:
+            segment = self._segments.popleft()
+            if isinstance(segment, Prefix):
+                segment = AsyncBucketListResultSet(self.bucket, segment.name,
+                                                   headers=self.headers)
+                segment._prefetch()
+                running += 1
+            elif not self.ordered:
+                self._items.append(segment)
+                continue
+            self._shards.append(segment)
+
+    @property
+    def fetch_next(self):
+        return self._fetch_next()
+
+    @tornado.gen.coroutine
+    def _fetch_next(self):
+        if self._segments is None:
+            yield self._discover()
+        while not self._items:
+            if not self._segments and self._discovery_truncated and \
+                    self._running() < self.max_concurrency:
+                yield self._discover()
+            self._open_shards()
+            if self._items:
+                break
+            if not self._shards:
+                if self._discovery_truncated:
+                    continue
+                raise tornado.gen.Return(False)
+            if self.ordered:
+                shard = self._shards[0]
+                if not isinstance(shard, AsyncListResultSet):
+                    self._items.append(self._shards.popleft())
+                    continue
+            else:
+                shard = yield self._first_fetched()
+            if (yield shard.fetch_next):
+                while shard._items:
+                    self._items.append(shard.next_object())
+            else:
+                self._shards.remove(shard)
+        raise tornado.gen.Return(True)
+
+    def _first_fetched(self):
+        """
+        Return a Future of the first open shard that has something to
+        report, an object or the end of its listing.
+        """
+        first = tornado.concurrent.Future()
+        def fetched(shard, future):
+            if not first.done():
+                first.set_result(shard)
+        for shard in self._shards:
+            tornado.ioloop.IOLoop.current().add_future(shard.fetch_next,
+                                                       functools.partial(fetched, shard))
+        return first
+
+    def next_object(self):
+        if not self._items:
+            return None
+        return self._items.popleft()
+
+# vim:set ft=python sw=4 :
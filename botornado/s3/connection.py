@@ -34,18 +34,62 @@ from boto.exception import BotoClientError
 
 from boto.s3.connection import *
 import botornado.connection
+import botornado.handler
 import botornado.s3.bucket
 import botornado.s3.key
+import botornado.utils
+from tornado.concurrent import return_future
 
 class AsyncS3Connection(botornado.connection.AsyncAWSAuthConnection, boto.s3.connection.S3Connection):
     def __init__(self, host=boto.s3.connection.S3Connection.DefaultHost,
                        calling_format=boto.s3.connection.SubdomainCallingFormat(),
-                       bucket_class=botornado.s3.bucket.AsyncBucket, anon=False, **kwargs):
+                       bucket_class=botornado.s3.bucket.AsyncBucket, anon=False,
+                       metadata_cache_ttl=None, metadata_cache_size=1024,
+                       content_cache_size=None, content_cache_max_object_size=1024*1024,
+                       executor=None, **kwargs):
+        """
+        :type metadata_cache_ttl: int
+        :param metadata_cache_ttl: If given, the HEAD responses of
+                                   AsyncBucket.get_key are cached for this
+                                   many seconds.  An expired entry is
+                                   revalidated with If-None-Match.  Keys
+                                   written or deleted through this
+                                   connection are dropped from the cache.
+
+        :type metadata_cache_size: int
+        :param metadata_cache_size: The maximum number of keys cached.
+
+        :type content_cache_size: int
+        :param content_cache_size: If given, AsyncKey.get_contents_as_string
+                                   keeps up to this many bytes of object
+                                   contents in memory, and fetches a cached
+                                   object again only if it has changed.
+
+        :type content_cache_max_object_size: int
+        :param content_cache_max_object_size: Larger objects are not cached.
+
+        :type executor: :class:`concurrent.futures.Executor`
+        :param executor: If given, uploads compute the MD5 of their
+                         contents and read them from disk on this
+                         executor, typically a ThreadPoolExecutor, so
+                         that the IOLoop is not blocked by large files.
+        """
         self.calling_format = calling_format
         self.bucket_class = bucket_class
         self.anon = anon
+        self.metadata_cache = None
+        if metadata_cache_ttl is not None:
+            self.metadata_cache = botornado.utils.AsyncLRUCache(metadata_cache_size,
+                                                                metadata_cache_ttl)
+        self.executor = executor
+        self.content_cache = None
+        self.content_cache_max_object_size = content_cache_max_object_size
+        if content_cache_size is not None:
+            self.content_cache = botornado.utils.AsyncLRUCache(
+                content_cache_size, weigher=lambda (etag, last_modified, body): len(body))
         botornado.connection.AsyncAWSAuthConnection.__init__(self, host, **kwargs)
 
+    @return_future
     def get_all_buckets(self, headers=None, callback=None):
         def got_all_buckets(response):
             body = response.read()
@@ -53,12 +97,12 @@ class AsyncS3Connection(botornado.connection.AsyncAWSAuthConnection, boto.s3.con
                 raise self.provider.storage_response_error(
                     response.status, response.reason, body)
             rs = ResultSet([('Bucket', self.bucket_class)])
-            h = handler.XmlHandler(rs, self)
-            xml.sax.parseString(body, h)
+            botornado.handler.parse(body, rs, self)
             if callable(callback):
                 callback(rs)
         self.make_request('GET', headers=headers, callback=got_all_buckets)
 
+    @return_future
     def get_canonical_user_id(self, headers=None, callback=None):
         """
         Convenience method that returns the "CanonicalUserID" of the
@@ -78,6 +122,7 @@ class AsyncS3Connection(botornado.connection.AsyncAWSAuthConnection, boto.s3.con
         self.get_all_buckets(headers=headers, callback=got_canonical_user_id)
 
 
+    @return_future
     def get_bucket(self, bucket_name, validate=True, headers=None, callback=None):
         bucket = self.bucket_class(connection=self, name=bucket_name)
         if validate:
@@ -89,12 +134,14 @@ class AsyncS3Connection(botornado.connection.AsyncAWSAuthConnection, boto.s3.con
             if callable(callback):
                 callback(bucket)
 
+    @return_future
     def lookup(self, bucket_name, validate=True, headers=None, callback=None):
         def lookedup(bucket):
             if callable(callback):
                 callback(bucket)
         self.get_bucket(bucket_name, validate, headers=headers, callback=lookedup)
 
+    @return_future
     def create_bucket(self, bucket_name, headers=None,
                       location=Location.DEFAULT, policy=None, callback=None):
         """
@@ -141,6 +188,7 @@ class AsyncS3Connection(botornado.connection.AsyncAWSAuthConnection, boto.s3.con
         self.make_request('PUT', bucket_name, headers=headers,
                 data=data, callback=bucket_created)
 
+    @return_future
     def delete_bucket(self, bucket, headers=None, callback=None):
         def bucket_deleted(response):
             body = response.read()
@@ -28,6 +28,11 @@ import re
 import rfc822
 import StringIO
 import base64
+import functools
+import math
+import tornado.gen
+import tornado.ioloop
+from tornado.concurrent import return_future
 import boto.utils
 from boto.exception import BotoClientError
 from boto.provider import Provider
@@ -41,6 +46,17 @@ except ImportError:
 from boto.s3.key import *
 
 class AsyncKey(Key):
+
+    DefaultPartSize = 8 * 1024 * 1024
+    DefaultMaxConcurrency = 4
+
+    # the limits S3 puts on multipart uploads
+    MinimumPartSize = 5 * 1024 * 1024
+    MaximumParts = 10000
+
+    # the size of the reads done on the executor of the connection
+    ExecutorBufferSize = 1024 * 1024
+
     def __init__(self, bucket=None, name=None):
         Key.__init__(self, bucket=bucket, name=name)
 
@@ -50,8 +66,10 @@ class AsyncKey(Key):
         else:
             return '<AsyncKey: None,%s>' % self.name
 
+    @return_future
     def open_read(self, headers=None, query_args=None,
-                  override_num_retries=None, response_headers=None, callback=None):
+                  override_num_retries=None, response_headers=None, callback=None,
+                  streaming_callback=None):
         """
         Open this key for reading
 
@@ -70,6 +88,12 @@ class AsyncKey(Key):
                                  that will override any headers associated with
                                  the stored object in the response.
                                  See http://goo.gl/EWOPb for details.
+
+        :type streaming_callback: function
+        :param streaming_callback: If provided, the body of the object is
+                                   passed to this function chunk by chunk as
+                                   it arrives instead of being kept in the
+                                   response.
         """
         if self.resp == None:
             self.mode = 'r'
@@ -111,14 +135,19 @@ class AsyncKey(Key):
             self.bucket.connection.make_request(
                 'GET', self.bucket.name, self.name, headers,
                 query_args=query_args,
-                override_num_retries=override_num_retries, callback=opened_read)
+                override_num_retries=override_num_retries, callback=opened_read,
+                streaming_callback=streaming_callback)
+        elif callable(callback):
+            callback(self.resp)
 
+    @return_future
     def open(self, mode='r', headers=None, query_args=None,
-             override_num_retries=None, callback=None):
+             override_num_retries=None, callback=None, streaming_callback=None):
         if mode == 'r':
             self.mode = 'r'
             self.open_read(headers=headers, query_args=query_args,
-                           override_num_retries=override_num_retries, callback=callback)
+                           override_num_retries=override_num_retries, callback=callback,
+                           streaming_callback=streaming_callback)
         elif mode == 'w':
             self.mode = 'w'
             self.open_write(headers=headers,
@@ -138,6 +167,7 @@ class AsyncKey(Key):
         """
         raise BotoClientError('Not Implemented')
 
+    @return_future
     def read(self, size=0, callback=None):
         def _read(response):
             if size == 0:
@@ -150,6 +180,7 @@ class AsyncKey(Key):
                 callback(data)
         self.open_read(callback=_read)
 
+    @return_future
     def exists(self, callback=None):
         """
         Returns True if the key exists
@@ -162,14 +193,39 @@ class AsyncKey(Key):
                 callback(bool(response))
         self.bucket.lookup(self.name, callback=existence_tested)
 
+    @return_future
     def delete(self, callback=None):
         """
         Delete this key from S3
         """
-        return self.bucket.delete_key(self.name, version_id=self.version_id, callback=callback)
+        self.bucket.delete_key(self.name, version_id=self.version_id, callback=callback)
 
+    @return_future
+    def _compute_md5(self, fp, size=None, callback=None):
+        """
+        Like compute_md5, but if the connection has an executor the file
+        is read and hashed there, in ExecutorBufferSize reads, so the
+        IOLoop is not blocked.
+        """
+        executor = getattr(self.bucket.connection, 'executor', None)
+        if executor is None:
+            md5 = self.compute_md5(fp, size)
+            if callable(callback):
+                callback(md5)
+            return
+        def md5_computed(future):
+            tup = future.result()
+            self.size = tup[2]
+            if callable(callback):
+                callback(tup[0:2])
+        tornado.ioloop.IOLoop.current().add_future(
+            executor.submit(boto.utils.compute_md5, fp, self.ExecutorBufferSize, size),
+            md5_computed)
+
+    @return_future
     def send_file(self, fp, headers=None, cb=None, num_cb=10,
-                  query_args=None, chunked_transfer=False, callback=None):
+                  query_args=None, chunked_transfer=False, single_pass=False,
+                  callback=None):
         """
         Upload a file to a key into a bucket on S3.
 
@@ -195,19 +251,27 @@ class AsyncKey(Key):
                        transfer. Providing a negative integer will cause
                        your callback to be called with each buffer read.
 
+        :type single_pass: bool
+        :param single_pass: If True, no Content-MD5 is sent; the MD5 is
+                            computed from the buffers as they are sent
+                            and checked against the returned ETag, as
+                            for chunked_transfer.
         """
         provider = self.bucket.connection.provider
+        # with an executor the file is read there, in larger buffers
+        executor = getattr(self.bucket.connection, 'executor', None)
+        buffer_size = self.ExecutorBufferSize if executor is not None else self.BufferSize
 
         def sender(http_conn, method, path, data, headers, sendback=None):
             http_conn.putrequest(method, path)
             for key in headers:
                 http_conn.putheader(key, headers[key])
             http_conn.endheaders()
-            if chunked_transfer:
+            if chunked_transfer or single_pass:
                 # MD5 for the stream has to be calculated on the fly, as
                 # we don't know the size of the stream before hand.
                 m = md5()
-            else:
+            if not chunked_transfer:
                 fp.seek(0)
 
             save_debug = self.bucket.connection.debug
@@ -222,44 +286,59 @@ class AsyncKey(Key):
                 if chunked_transfer:
                     # For chunked Transfer, we call the cb for every 1MB
                     # of data transferred.
-                    cb_count = (1024 * 1024)/self.BufferSize
+                    cb_count = max((1024 * 1024)/buffer_size, 1)
                     self.size = 0
                 elif num_cb > 2:
-                    cb_count = self.size / self.BufferSize / (num_cb-2)
+                    cb_count = self.size / buffer_size / (num_cb-2)
                 elif num_cb < 0:
                     cb_count = -1
                 else:
                     cb_count = 0
+                cb(0, self.size)
+
+            # The body is streamed from fp one buffer at a time; each write
+            # waits until the previous buffer has been flushed to the socket
+            # so memory use does not grow with the size of the object.
+            @tornado.gen.coroutine
+            def producer(write):
                 i = total_bytes = 0
-                cb(total_bytes, self.size)
-            l = fp.read(self.BufferSize)
-            while len(l) > 0:
-                if chunked_transfer:
-                    http_conn.send('%x;\r\n' % len(l))
-                    http_conn.send(l)
-                    http_conn.send('\r\n')
+                if executor is None:
+                    l = fp.read(buffer_size)
                 else:
-                    http_conn.send(l)
-                if cb:
-                    total_bytes += len(l)
-                    i += 1
-                    if i == cb_count or cb_count == -1:
-                        cb(total_bytes, self.size)
-                        i = 0
+                    l = yield executor.submit(fp.read, buffer_size)
+                while len(l) > 0:
+                    if chunked_transfer:
+                        yield write('%x;\r\n' % len(l))
+                        yield write(l)
+                        yield write('\r\n')
+                    else:
+                        yield write(l)
+                    if cb:
+                        total_bytes += len(l)
+                        i += 1
+                        if i == cb_count or cb_count == -1:
+                            cb(total_bytes, self.size)
+                            i = 0
+                    if chunked_transfer or single_pass:
+                        m.update(l)
+                    if executor is None:
+                        l = fp.read(buffer_size)
+                    else:
+                        l = yield executor.submit(fp.read, buffer_size)
                 if chunked_transfer:
-                    m.update(l)
-                l = fp.read(self.BufferSize)
-            if chunked_transfer:
-                http_conn.send('0\r\n')
-                http_conn.send('\r\n')
+                    yield write('0\r\n')
+                    yield write('\r\n')
+                    if cb:
+                        self.size = total_bytes
+                    # Get the md5 which is calculated on the fly.
+                    self.md5 = m.hexdigest()
+                else:
+                    if single_pass:
+                        self.md5 = m.hexdigest()
+                    fp.seek(0)
                 if cb:
-                    self.size = total_bytes
-                # Get the md5 which is calculated on the fly.
-                self.md5 = m.hexdigest()
-            else:
-                fp.seek(0)
-            if cb:
-                cb(total_bytes, self.size)
+                    cb(total_bytes, self.size)
+            http_conn.stream(producer)
             def sender_sent(response):
                 body = response.read()
                 http_conn.set_debuglevel(save_debug)
@@ -307,6 +386,7 @@ class AsyncKey(Key):
         headers = boto.utils.merge_meta(headers, self.metadata, provider)
         def file_sent(resp):
             self.handle_version_headers(resp, force=True)
+            self.bucket._invalidate_caches(self.name)
             if callable(callback):
                 callback(resp)
         self.bucket.connection.make_request('PUT', self.bucket.name,
@@ -314,6 +394,7 @@ class AsyncKey(Key):
                                             sender=sender,
                                             query_args=query_args, callback=file_sent)
 
+    @return_future
     def set_contents_from_stream(self, fp, headers=None, replace=True,
                                  cb=None, num_cb=10, policy=None,
                                  reduced_redundancy=False, query_args=None, callback=None):
@@ -401,10 +482,105 @@ class AsyncKey(Key):
             self.send_file(fp, headers, cb, num_cb, query_args,
                                             chunked_transfer=True, callback=callback)
 
+    def _check_part_size(self, size, part_size):
+        """
+        Raises a BotoClientError if S3 would reject a multipart upload of
+        size bytes in parts of part_size bytes, before it is initiated.
+        """
+        if part_size < size and part_size < self.MinimumPartSize:
+            raise BotoClientError('part_size must be at least %d bytes for all parts but the last'
+                                  % self.MinimumPartSize)
+        if size > part_size * self.MaximumParts:
+            raise BotoClientError('A multipart upload of %d bytes in parts of %d bytes '
+                                  'exceeds the limit of %d parts'
+                                  % (size, part_size, self.MaximumParts))
+
+    def _send_file_multipart(self, fp, size, headers, cb, num_cb,
+                             reduced_redundancy, part_size, max_concurrency,
+                             single_pass=False, callback=None):
+        """
+        Upload the contents of fp as a multipart upload, keeping up to
+        max_concurrency parts in flight on the IOLoop.  The upload is
+        cancelled if any of the parts fails.
+        """
+        if part_size < 1 or max_concurrency < 1:
+            raise ValueError('part_size and max_concurrency must be positive')
+        headers = headers.copy()
+        if not headers.has_key('Content-Type'):
+            if self.path:
+                self.content_type = mimetypes.guess_type(self.path)[0]
+                if self.content_type == None:
+                    self.content_type = self.DefaultContentType
+            headers['Content-Type'] = self.content_type
+        io_loop = tornado.ioloop.IOLoop.current()
+        num_parts = max(1, int(math.ceil(size / float(part_size))))
+        state = {'next': 0, 'running': 0, 'done': 0, 'failed': False,
+                 'reported': 0}
+        sent = {}
+        if cb:
+            # progress is reported for the whole object, not for each part
+            if num_cb > 1:
+                cb_step = size / (num_cb - 1)
+            elif num_cb < 0:
+                cb_step = 1
+            else:
+                cb_step = size
+            cb(0, size)
+        def part_progress(part_num):
+            def progressed(bytes_sent, part_total):
+                sent[part_num] = bytes_sent
+                total_bytes = sum(sent.itervalues())
+                if total_bytes > state['reported'] and \
+                        (total_bytes >= size or total_bytes - state['reported'] >= cb_step):
+                    state['reported'] = total_bytes
+                    cb(total_bytes, size)
+            return progressed
+        def start_parts(mp):
+            while state['running'] < max_concurrency and state['next'] < num_parts:
+                offset = state['next'] * part_size
+                state['next'] += 1
+                state['running'] += 1
+                # the earlier parts may be reading fp on executor threads,
+                # so the offset is passed instead of seeking fp
+                future = mp.upload_part_from_file(
+                    fp, state['next'], cb=cb and part_progress(state['next']),
+                    num_cb=num_cb, size=min(part_size, size - offset),
+                    single_pass=single_pass, offset=offset)
+                io_loop.add_future(future, functools.partial(part_uploaded, mp))
+        def part_uploaded(mp, future):
+            state['running'] -= 1
+            if state['failed']:
+                return
+            if future.exception() is not None:
+                state['failed'] = True
+                def upload_cancelled(cancelled):
+                    # re-raise the error of the part, not of the cancellation
+                    future.result()
+                io_loop.add_future(mp.cancel_upload(), upload_cancelled)
+                return
+            state['done'] += 1
+            if state['done'] < num_parts:
+                start_parts(mp)
+            else:
+                mp.complete_upload(callback=upload_completed)
+        def upload_completed(completed):
+            self.etag = completed.etag
+            self.size = size
+            if callable(callback):
+                callback(completed)
+        self.bucket.initiate_multipart_upload(self.name, headers=headers,
+                                              reduced_redundancy=reduced_redundancy,
+                                              metadata=self.metadata,
+                                              callback=start_parts)
+
+    @return_future
     def set_contents_from_file(self, fp, headers=None, replace=True,
                                cb=None, num_cb=10, policy=None, md5=None,
                                reduced_redundancy=False, query_args=None,
-                               encrypt_key=False, callback=None):
+                               encrypt_key=False, multipart_threshold=None,
+                               part_size=DefaultPartSize,
+                               max_concurrency=DefaultMaxConcurrency,
+                               single_pass=False, callback=None):
         """
         Store an object in S3 using the name of the Key object as the
         key in S3 and the contents of the file pointed to by 'fp' as the
@@ -465,6 +641,31 @@ class AsyncKey(Key):
                             be encrypted on the server-side by S3 and
                             will be stored in an encrypted form while
                             at rest in S3.
+
+        :type multipart_threshold: int
+        :param multipart_threshold: (optional) Files of at least this many
+                                    bytes are sent as a multipart upload
+                                    instead of a single PUT.  The md5
+                                    parameter is ignored in that case and
+                                    the callback is passed the
+                                    :class:`boto.s3.multipart.CompleteMultiPartUpload`.
+
+        :type part_size: int
+        :param part_size: The size of each part of a multipart upload.
+                          S3 requires at least 5MB for all parts but the last.
+
+        :type max_concurrency: int
+        :param max_concurrency: The number of parts of a multipart upload
+                                that are sent at the same time.
+
+        :type single_pass: bool
+        :param single_pass: If True and no md5 is given, the file is not
+                            read ahead of the upload to compute its MD5.
+                            The MD5 is computed while the file is sent and
+                            checked against the ETag returned by S3, so
+                            every byte is read once.  No Content-MD5 header
+                            is sent.  Parts of a multipart upload are
+                            checked the same way.
         """
         provider = self.bucket.connection.provider
         if headers is None:
@@ -482,33 +683,74 @@ class AsyncKey(Key):
                 # What if different providers provide different classes?
         if hasattr(fp, 'name'):
             self.path = fp.name
+        if self.bucket != None and multipart_threshold is not None:
+            fp.seek(0, os.SEEK_END)
+            size = fp.tell()
+            fp.seek(0)
+            if size >= multipart_threshold:
+                if self.name == None:
+                    raise BotoClientError('A key name is required for multipart uploads')
+                self._check_part_size(size, part_size)
+                def send_file_multipart():
+                    self._send_file_multipart(fp, size, headers, cb, num_cb,
+                                              reduced_redundancy, part_size,
+                                              max_concurrency, single_pass,
+                                              callback=callback)
+                if not replace:
+                    def existence_tested(k):
+                        if k:
+                            if callable(callback):
+                                callback(False)
+                        else:
+                            send_file_multipart()
+                    self.bucket.lookup(self.name, callback=existence_tested)
+                    return
+                send_file_multipart()
+                return
         if self.bucket != None:
-            if not md5:
-                md5 = self.compute_md5(fp)
+            single_pass = single_pass and not md5
+            def send_file():
+                if not replace:
+                    def existence_tested(k):
+                        if k:
+                            if callable(callback):
+                                callback(False)
+                        else:
+                            self.send_file(fp, headers, cb, num_cb, query_args,
+                                           single_pass=single_pass, callback=callback)
+                    self.bucket.lookup(self.name, callback=existence_tested)
+                    return
+                self.send_file(fp, headers, cb, num_cb, query_args,
+                               single_pass=single_pass, callback=callback)
+            def md5_computed(md5):
+                self.md5 = md5[0]
+                self.base64md5 = md5[1]
+                if self.name == None:
+                    self.name = self.md5
+                send_file()
+            if single_pass:
+                if self.name == None:
+                    raise BotoClientError('A key name is required for single pass uploads')
+                fp.seek(0, 2)
+                self.size = fp.tell()
+                fp.seek(0)
+                self.md5 = None
+                self.base64md5 = None
+                send_file()
+            elif not md5:
+                self._compute_md5(fp, callback=md5_computed)
             else:
                 # even if md5 is provided, still need to set size of content
                 fp.seek(0, 2)
                 self.size = fp.tell()
                 fp.seek(0)
-            self.md5 = md5[0]
-            self.base64md5 = md5[1]
-            if self.name == None:
-                self.name = self.md5
-            if not replace:
-                def existence_tested(k):
-                    if k:
-                        if callable(callback):
-                            callback(False)
-                    else:
-                        self.send_file(fp, headers, cb, num_cb, query_args, callback=callback)
-                self.bucket.lookup(self.name, callback=existence_tested)
-                return
-            self.send_file(fp, headers, cb, num_cb, query_args, callback=callback)
+                md5_computed(md5)
 
+    @return_future
     def set_contents_from_filename(self, filename, headers=None, replace=True,
                                    cb=None, num_cb=10, policy=None, md5=None,
                                    reduced_redundancy=False,
-                                   encrypt_key=False):
+                                   encrypt_key=False, callback=None):
         """
         Store an object in S3 using the name of the Key object as the
         key in S3 and the contents of the file named by 'filename'.
@@ -576,6 +818,7 @@ class AsyncKey(Key):
                                     policy, md5, reduced_redundancy,
                                     encrypt_key=encrypt_key, callback=_set_contents_from_filename)
 
+    @return_future
     def set_contents_from_string(self, s, headers=None, replace=True,
                                  cb=None, num_cb=10, policy=None, md5=None,
                                  reduced_redundancy=False,
@@ -646,9 +889,11 @@ class AsyncKey(Key):
                                     policy, md5, reduced_redundancy,
                                     encrypt_key=encrypt_key, callback=_set_contents_from_string)
 
+    @return_future
     def get_file(self, fp, headers=None, cb=None, num_cb=10,
                  torrent=False, version_id=None, override_num_retries=None,
-                 response_headers=None, callback=None):
+                 response_headers=None, range_size=None,
+                 max_concurrency=DefaultMaxConcurrency, callback=None):
         """
         Retrieves a file from an S3 Key
 
@@ -685,16 +930,18 @@ class AsyncKey(Key):
                                  that will override any headers associated with
                                  the stored object in the response.
                                  See http://goo.gl/EWOPb for details.
+
+        :type range_size: int
+        :param range_size: (optional) Objects larger than this many bytes
+                           are downloaded as concurrent ranged GETs of
+                           this size, each written to its own offset of
+                           fp.  fp must be seekable.  No md5 is computed
+                           for such downloads.
+
+        :type max_concurrency: int
+        :param max_concurrency: The number of ranges that are downloaded
+                                at the same time.
         """
-        if cb:
-            if num_cb > 2:
-                cb_count = self.size / self.BufferSize / (num_cb-2)
-            elif num_cb < 0:
-                cb_count = -1
-            else:
-                cb_count = 0
-            i = total_bytes = 0
-            cb(total_bytes, self.size)
         save_debug = self.bucket.connection.debug
         if self.bucket.connection.debug == 1:
             self.bucket.connection.debug = 0
@@ -702,6 +949,9 @@ class AsyncKey(Key):
         query_args = []
         if torrent:
             query_args.append('torrent')
+            m = None
+        else:
+            m = md5()
         # If a version_id is passed in, use that.  If not, check to see
         # if the Key object has an explicit version_id and, if so, use that.
         # Otherwise, don't pass a version_id query param.
@@ -713,24 +963,170 @@ class AsyncKey(Key):
             for key in response_headers:
                 query_args.append('%s=%s' % (key, response_headers[key]))
         query_args = '&'.join(query_args)
+
+        if range_size is not None and not torrent and \
+                not (headers and headers.has_key('Range')):
+            self.bucket.connection.debug = save_debug
+            def got_key(key):
+                if key is None:
+                    raise self.bucket.connection.provider.storage_response_error(
+                        404, 'Not Found', '')
+                self.size = key.size
+                self.etag = key.etag
+                if self.size > range_size:
+                    self._get_file_ranged(fp, headers, cb, num_cb, query_args,
+                                          override_num_retries, range_size,
+                                          max_concurrency, callback=callback)
+                else:
+                    self.get_file(fp, headers, cb, num_cb, version_id=version_id,
+                                  override_num_retries=override_num_retries,
+                                  response_headers=response_headers,
+                                  callback=callback)
+            if self.size is None or self.etag is None:
+                self.bucket.get_key(self.name, headers, version_id, callback=got_key)
+            else:
+                got_key(self)
+            return
+
+        # The body is written to fp as it arrives, so progress is reported
+        # in bytes received rather than in buffers read.
+        progress = {'data_len': 0, 'reported': 0, 'next_cb': None}
+        if cb:
+            if num_cb < 0:
+                cb_interval = 1
+            elif self.size is None:
+                # If size is not known yet, we'll call the cb for every 1MB
+                # of data transferred.
+                cb_interval = 1024 * 1024
+            elif num_cb > 1:
+                cb_interval = max(self.size / (num_cb - 1), 1)
+            else:
+                cb_interval = None
+            progress['next_cb'] = cb_interval
+            cb(0, self.size or 0)
+
+        def chunk_got(chunk):
+            fp.write(chunk)
+            progress['data_len'] += len(chunk)
+            if m:
+                m.update(chunk)
+            if cb and progress['next_cb'] is not None and \
+                    progress['data_len'] >= progress['next_cb']:
+                cb(progress['data_len'], self.size or 0)
+                progress['reported'] = progress['data_len']
+                progress['next_cb'] = progress['data_len'] + cb_interval
+
         def file_got(response):
-            body = self.resp.read()
-            fp.write(body)
-            if cb:
-                cb(total_bytes, self.size)
+            data_len = progress['data_len']
+            if cb and data_len > progress['reported']:
+                cb(data_len, self.size or data_len)
+            if m:
+                self.md5 = m.hexdigest()
+            if self.size is None and not torrent and \
+                    not (headers and headers.has_key('Range')):
+                self.size = data_len
             self.close()
             self.bucket.connection.debug = save_debug
             if callable(callback):
                 callback(response)
         self.open('r', headers, query_args=query_args,
-                  override_num_retries=override_num_retries, callback=file_got)
+                  override_num_retries=override_num_retries, callback=file_got,
+                  streaming_callback=chunk_got)
 
+    def _get_file_ranged(self, fp, headers, cb, num_cb, query_args,
+                         override_num_retries, range_size, max_concurrency,
+                         callback=None):
+        """
+        Download the object as concurrent ranged GETs of range_size bytes,
+        keeping up to max_concurrency of them in flight on the IOLoop.
+        Every range is requested with If-Match so that a change of the
+        object during the download is reported as an error instead of
+        producing a mixed file.
+        """
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency must be positive')
+        provider = self.bucket.connection.provider
+        io_loop = tornado.ioloop.IOLoop.current()
+        size = self.size
+        num_ranges = int(math.ceil(size / float(range_size)))
+        state = {'next': 0, 'running': 0, 'done': 0, 'failed': False,
+                 'data_len': 0, 'reported': 0}
+        if cb:
+            if num_cb > 1:
+                cb_step = size / (num_cb - 1)
+            elif num_cb < 0:
+                cb_step = 1
+            else:
+                cb_step = size
+            cb(0, size)
+        def range_receiver(offset, length):
+            received = {'len': 0}
+            def chunk_got(chunk):
+                if state['failed']:
+                    # another range failed, so the rest of the ranges in
+                    # flight are read to their end but not written
+                    return
+                if received['len'] + len(chunk) > length:
+                    state['failed'] = True
+                    raise BotoClientError('Range GET returned more data than requested')
+                # the IOLoop runs one callback at a time, so seek and
+                # write are never interleaved with another range
+                fp.seek(offset + received['len'])
+                fp.write(chunk)
+                received['len'] += len(chunk)
+                state['data_len'] += len(chunk)
+                if cb and (state['data_len'] >= size or
+                           state['data_len'] - state['reported'] >= cb_step):
+                    state['reported'] = state['data_len']
+                    cb(state['data_len'], size)
+            return received, chunk_got
+        def start_ranges():
+            while state['running'] < max_concurrency and state['next'] < num_ranges:
+                offset = state['next'] * range_size
+                length = min(range_size, size - offset)
+                state['next'] += 1
+                state['running'] += 1
+                range_headers = headers and headers.copy() or {}
+                range_headers['Range'] = 'bytes=%d-%d' % (offset, offset + length - 1)
+                if self.etag:
+                    range_headers['If-Match'] = self.etag
+                key = self.bucket.new_key(self.name)
+                received, chunk_got = range_receiver(offset, length)
+                future = key.open_read(range_headers, query_args=query_args or None,
+                                       override_num_retries=override_num_retries,
+                                       streaming_callback=chunk_got)
+                io_loop.add_future(future, functools.partial(range_got, key, received, length))
+        def range_got(key, received, length, future):
+            state['running'] -= 1
+            key.close()
+            if state['failed']:
+                return
+            if future.exception() is not None:
+                state['failed'] = True
+                future.result()
+            response = future.result()
+            if response.status != 206 or received['len'] != length:
+                state['failed'] = True
+                raise provider.storage_response_error(
+                    response.status, response.reason,
+                    'Incomplete range: got %d of %d bytes' % (received['len'], length))
+            state['done'] += 1
+            if state['done'] < num_ranges:
+                start_ranges()
+            else:
+                fp.seek(size)
+                if callable(callback):
+                    callback(response)
+        start_ranges()
+
+    @return_future
     def get_contents_to_file(self, fp, headers=None,
                              cb=None, num_cb=10,
                              torrent=False,
                              version_id=None,
                              res_download_handler=None,
-                             response_headers=None, callback=None):
+                             response_headers=None, range_size=None,
+                             max_concurrency=DefaultMaxConcurrency, callback=None):
         """
         Retrieve an object from S3 using the name of the Key object as the
         key in S3.  Write the contents of the object to the file pointed
@@ -771,6 +1167,14 @@ class AsyncKey(Key):
                                  that will override any headers associated with
                                  the stored object in the response.
                                  See http://goo.gl/EWOPb for details.
+
+        :type range_size: int
+        :param range_size: (optional) Download objects larger than this
+                           many bytes as concurrent ranged GETs.  See
+                           get_file for details.
+
+        :type max_concurrency: int
+        :param max_concurrency: The number of ranges downloaded at once.
         """
         if self.bucket != None:
             if res_download_handler:
@@ -780,14 +1184,18 @@ class AsyncKey(Key):
             else:
                 self.get_file(fp, headers, cb, num_cb, torrent=torrent,
                               version_id=version_id,
-                              response_headers=response_headers, callback=callback)
+                              response_headers=response_headers,
+                              range_size=range_size,
+                              max_concurrency=max_concurrency, callback=callback)
 
+    @return_future
     def get_contents_to_filename(self, filename, headers=None,
                                  cb=None, num_cb=10,
                                  torrent=False,
                                  version_id=None,
                                  res_download_handler=None,
-                                 response_headers=None, callback=None):
+                                 response_headers=None, range_size=None,
+                                 max_concurrency=DefaultMaxConcurrency, callback=None):
         """
         Retrieve an object from S3 using the name of the Key object as the
         key in S3.  Store contents of the object to a file named by 'filename'.
@@ -828,6 +1236,14 @@ class AsyncKey(Key):
                                  that will override any headers associated with
                                  the stored object in the response.
                                  See http://goo.gl/EWOPb for details.
+
+        :type range_size: int
+        :param range_size: (optional) Download objects larger than this
+                           many bytes as concurrent ranged GETs.  See
+                           get_file for details.
+
+        :type max_concurrency: int
+        :param max_concurrency: The number of ranges downloaded at once.
         """
         fp = open(filename, 'wb')
         def got_contents_to_filename(response):
@@ -844,8 +1260,12 @@ class AsyncKey(Key):
         self.get_contents_to_file(fp, headers, cb, num_cb, torrent=torrent,
                                   version_id=version_id,
                                   res_download_handler=res_download_handler,
-                                  response_headers=response_headers, callback=got_contents_to_filename)
+                                  response_headers=response_headers,
+                                  range_size=range_size,
+                                  max_concurrency=max_concurrency,
+                                  callback=got_contents_to_filename)
 
+    @return_future
     def get_contents_as_string(self, headers=None,
                                cb=None, num_cb=10,
                                torrent=False,
@@ -887,7 +1307,17 @@ class AsyncKey(Key):
 
         :rtype: string
         :returns: The contents of the file as a string
+
+        If the connection has a content_cache and no headers, cb, torrent
+        or response_headers are given, the contents are cached together
+        with their ETag and Last-Modified.  A cached object is requested
+        with If-None-Match and If-Modified-Since and taken from the cache
+        on 304; a cached version of an object is not requested again.
         """
+        cache = getattr(self.bucket.connection, 'content_cache', None)
+        if cache is not None and not (headers or cb or torrent or response_headers):
+            self._get_contents_cached(cache, version_id, callback=callback)
+            return
         fp = StringIO.StringIO()
         def got_contents_as_string(response):
             if callable(callback):
@@ -896,4 +1326,55 @@ class AsyncKey(Key):
                                   version_id=version_id,
                                   response_headers=response_headers, callback=got_contents_as_string)
 
+    @return_future
+    def _get_contents_cached(self, cache, version_id=None, callback=None):
+        if version_id is None:
+            version_id = self.version_id
+        cache_key = (self.bucket.name, self.name, version_id)
+        cached = cache.get(cache_key)
+        def contents_got(etag, last_modified, body):
+            self.etag = etag
+            self.last_modified = last_modified
+            self.size = len(body)
+            if callable(callback):
+                callback(body)
+        if cached is not None and version_id:
+            # a version never changes
+            contents_got(*cached)
+            return
+        headers = {}
+        if cached is not None:
+            etag, last_modified, body = cached
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        query_args = None
+        if version_id:
+            query_args = 'versionId=%s' % version_id
+        # the object may be written or deleted while it is being read
+        generation = cache.begin_fill(cache_key)
+        def got_response(response):
+            if response.status == 304 and cached is not None:
+                cache.end_fill(cache_key)
+                contents_got(*cached)
+                return
+            body = response.read()
+            if response.status != 200:
+                cache.end_fill(cache_key)
+                raise self.bucket.connection.provider.storage_response_error(
+                    response.status, response.reason, body)
+            entry = (response.getheader('etag'), response.getheader('last-modified'), body)
+            if len(body) <= self.bucket.connection.content_cache_max_object_size:
+                cache.set(cache_key, entry, generation=generation)
+            else:
+                cache.end_fill(cache_key)
+            contents_got(*entry)
+        try:
+            self.bucket.connection.make_request('GET', self.bucket.name, self.name, headers,
+                                                query_args=query_args, callback=got_response)
+        except Exception:
+            cache.end_fill(cache_key)
+            raise
+
 # vim:set ft=python sw=4 :
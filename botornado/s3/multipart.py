@@ -0,0 +1,230 @@
+# Copyright (c) 2006-2010 Mitch Garnaat http://garnaat.org/
+# Copyright (c) 2010, Eucalyptus Systems, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, dis-
+# tribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the fol-
+# lowing conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABIL-
+# ITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT
+# SHALL THE AUTHOR BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import os
+import threading
+import weakref
+import xml.sax
+import boto
+from boto import handler
+from boto.exception import BotoClientError
+
+from boto.s3.multipart import *
+import botornado.handler
+from tornado.concurrent import return_future
+
+# the lock of each file read through FileChunkIO views, as the parts may
+# be read on the threads of an executor at the same time
+_file_locks = weakref.WeakKeyDictionary()
+_file_locks_lock = threading.Lock()
+# shared by the files that cannot be weakly referenced
+_fallback_lock = threading.Lock()
+
+def _file_lock(fp):
+    with _file_locks_lock:
+        try:
+            lock = _file_locks.get(fp)
+            if lock is None:
+                lock = _file_locks[fp] = threading.Lock()
+        except TypeError:
+            lock = _fallback_lock
+    return lock
+
+class FileChunkIO(object):
+    """
+    A read-only view of size bytes of the file-like object fp starting at
+    offset.  Every read seeks fp first, under a lock of fp, so several
+    views of the same file can be read in turn, as happens when the parts
+    of a multipart upload are sent concurrently.
+    """
+
+    def __init__(self, fp, offset, size):
+        self.fp = fp
+        self.offset = offset
+        self.size = size
+        self.pos = 0
+        self._lock = _file_lock(fp)
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            pos += self.pos
+        elif whence == os.SEEK_END:
+            pos += self.size
+        self.pos = max(0, min(pos, self.size))
+
+    def read(self, size=-1):
+        remaining = self.size - self.pos
+        if size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return ''
+        with self._lock:
+            self.fp.seek(self.offset + self.pos)
+            data = self.fp.read(size)
+        self.pos += len(data)
+        return data
+
+    def close(self):
+        pass
+
+class AsyncMultiPartUpload(MultiPartUpload):
+    """
+    Represents a MultiPart Upload operation.
+
+    Parts may be uploaded concurrently; the ETag of each part uploaded
+    through this object is remembered so that complete_upload does not
+    have to list the parts again.
+    """
+    def __init__(self, bucket=None):
+        MultiPartUpload.__init__(self, bucket=bucket)
+        self._part_etags = {}
+
+    def __repr__(self):
+        return '<AsyncMultiPartUpload %s>' % self.key_name
+
+    def __iter__(self):
+        raise BotoClientError('Not Implemented')
+
+    def to_xml(self):
+        s = '<CompleteMultipartUpload>\n'
+        for part_num in sorted(self._part_etags):
+            s += '  <Part>\n'
+            s += '    <PartNumber>%d</PartNumber>\n' % part_num
+            s += '    <ETag>%s</ETag>\n' % self._part_etags[part_num]
+            s += '  </Part>\n'
+        s += '</CompleteMultipartUpload>'
+        return s
+
+    @return_future
+    def get_all_parts(self, max_parts=None, part_number_marker=None, callback=None):
+        """
+        Return the uploaded parts of this MultiPart Upload.  This is
+        a lower-level method that requires you to manually page through
+        results.
+        """
+        self._parts = []
+        query_args = 'uploadId=%s' % self.id
+        if max_parts:
+            query_args += '&max-parts=%d' % max_parts
+        if part_number_marker:
+            query_args += '&part-number-marker=%s' % part_number_marker
+        def got_all_parts(response):
+            body = response.read()
+            if response.status != 200:
+                raise self.bucket.connection.provider.storage_response_error(
+                    response.status, response.reason, body)
+            botornado.handler.parse(body, self, self)
+            for part in self._parts:
+                self._part_etags[part.part_number] = part.etag
+            if callable(callback):
+                callback(self._parts)
+        self.bucket.connection.make_request('GET', self.bucket.name,
+                                            self.key_name,
+                                            query_args=query_args, callback=got_all_parts)
+
+    @return_future
+    def upload_part_from_file(self, fp, part_num, headers=None, replace=True,
+                              cb=None, num_cb=10, policy=None, md5=None,
+                              size=None, single_pass=False, offset=None,
+                              callback=None):
+        """
+        Upload another part of this MultiPart Upload.
+
+        :type fp: file
+        :param fp: The file object you want to upload.
+
+        :type part_num: int
+        :param part_num: The number of this part.
+
+        :type size: int
+        :param size: (optional) The number of bytes to upload from the
+                     current position of fp.  fp is advanced past them right
+                     away, so the next part can be started before this one
+                     has been sent.
+
+        :type offset: int
+        :param offset: (optional) Where the size bytes start in fp.  fp
+                       is then neither read nor moved here, which is how
+                       parts read concurrently on the threads of an
+                       executor must be uploaded.
+
+        The other parameters are exactly as defined for the
+        :class:`botornado.s3.key.AsyncKey` set_contents_from_file method.
+        The callback is passed the key of the uploaded part.
+        """
+        if part_num < 1:
+            raise ValueError('Part numbers must be greater than zero')
+        if size is not None:
+            if offset is None:
+                offset = fp.tell()
+                fp.seek(offset + size)
+            fp = FileChunkIO(fp, offset, size)
+        query_args = 'uploadId=%s&partNumber=%d' % (self.id, part_num)
+        key = self.bucket.new_key(self.key_name)
+        def part_uploaded(response):
+            self._part_etags[part_num] = key.etag
+            if callable(callback):
+                callback(key)
+        key.set_contents_from_file(fp, headers, replace, cb, num_cb, policy,
+                                   md5, reduced_redundancy=False,
+                                   query_args=query_args, single_pass=single_pass,
+                                   callback=part_uploaded)
+
+    @return_future
+    def complete_upload(self, callback=None):
+        """
+        Complete the MultiPart Upload operation.  This method should
+        be called when all parts of the file have been successfully
+        uploaded to S3.
+
+        :rtype: :class:`boto.s3.multipart.CompletedMultiPartUpload`
+        :returns: An object representing the completed upload.
+        """
+        def parts_listed(parts=None):
+            if self.is_truncated:
+                self.get_all_parts(part_number_marker=self.next_part_number_marker,
+                                   callback=parts_listed)
+            else:
+                self.bucket.complete_multipart_upload(self.key_name, self.id,
+                                                      self.to_xml(), callback=callback)
+        if self._part_etags:
+            parts_listed()
+        else:
+            # the parts were not uploaded through this object
+            self.get_all_parts(callback=parts_listed)
+
+    @return_future
+    def cancel_upload(self, callback=None):
+        """
+        Cancels a MultiPart Upload operation.  The storage consumed by
+        any previously uploaded parts will be freed. However, if any
+        part uploads are currently in progress, those part uploads
+        might or might not succeed. As a result, it might be necessary
+        to abort a given multipart upload multiple times in order to
+        completely free all storage consumed by all parts.
+        """
+        self.bucket.cancel_multipart_upload(self.key_name, self.id, callback=callback)
+
+# vim:set ft=python sw=4 :
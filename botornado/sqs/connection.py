@@ -24,26 +24,51 @@ from boto.sqs.regioninfo import SQSRegionInfo
 from boto.sqs.queue import Queue
 from boto.sqs.message import Message
 from boto.sqs.attributes import Attributes
+from boto.sqs.batchresults import BatchResults
 from boto.exception import SQSError
 
 from boto.sqs.connection import *
+import boto
 import boto.regioninfo
 import botornado.connection
 import botornado.sqs.queue
 import botornado.sqs.message
+import botornado.utils
+import tornado.ioloop
+from tornado.concurrent import return_future
 
 class AsyncSQSConnection(botornado.connection.AsyncAWSQueryConnection, SQSConnection):
     """
     A Connection to the SQS Service.
     """
+    # 2012-11-05 adds WaitTimeSeconds (long polling) to ReceiveMessage
+    APIVersion = '2012-11-05'
 
-    def __init__(self, region=None, **kwargs):
+    # seconds a long poll may take on top of its WaitTimeSeconds
+    LongPollTimeoutMargin = 10
+
+    def __init__(self, region=None, queue_cache_ttl=None, queue_cache_size=1024, **kwargs):
+        """
+        :type queue_cache_ttl: int
+        :param queue_cache_ttl: If given, the queues returned by get_queue
+                                are cached by name for this many seconds,
+                                and concurrent lookups of the same name
+                                share one ListQueues request.  The cached
+                                queue objects are shared by all callers.
+
+        :type queue_cache_size: int
+        :param queue_cache_size: The maximum number of queues cached.
+        """
         if not region:
            region = boto.regioninfo.RegionInfo(self, self.DefaultRegionName,
                                                self.DefaultRegionEndpoint, connection_cls=self.__class__)
         self.region = region
+        self.queue_cache = None
+        if queue_cache_ttl is not None:
+            self.queue_cache = botornado.utils.AsyncLRUCache(queue_cache_size, queue_cache_ttl)
         botornado.connection.AsyncAWSQueryConnection.__init__(self, host=self.region.endpoint, **kwargs)
 
+    @return_future
     def create_queue(self, queue_name, visibility_timeout=None, callback=None):
         """
         Create an SQS Queue.
@@ -69,11 +94,14 @@ class AsyncSQSConnection(botornado.connection.AsyncAWSQueryConnection, SQSConnec
         :return: The newly created queue.
 
         """
+        if self.queue_cache is not None:
+            self.queue_cache.invalidate(queue_name)
         params = {'QueueName': queue_name}
         if visibility_timeout:
             params['DefaultVisibilityTimeout'] = '%d' % (visibility_timeout,)
-        return self.get_object('CreateQueue', params, botornado.sqs.queue.AsyncQueue, callback=callback)
+        self.get_object('CreateQueue', params, botornado.sqs.queue.AsyncQueue, callback=callback)
 
+    @return_future
     def delete_queue(self, queue, force_deletion=False, callback=None):
         """
         Delete an SQS Queue.
@@ -93,8 +121,11 @@ class AsyncSQSConnection(botornado.connection.AsyncAWSQueryConnection, SQSConnec
         :rtype: bool
         :return: True if the command succeeded, False otherwise
         """
-        return self.get_status('DeleteQueue', None, queue.id, callback=callback)
+        if self.queue_cache is not None:
+            self.queue_cache.invalidate(queue.name)
+        self.get_status('DeleteQueue', None, queue.id, callback=callback)
 
+    @return_future
     def get_queue_attributes(self, queue, attribute='All', callback=None):
         """
         Gets one or all attributes of a Queue
@@ -118,15 +149,18 @@ class AsyncSQSConnection(botornado.connection.AsyncAWSQueryConnection, SQSConnec
         :return: An Attributes object containing request value(s).
         """
         params = {'AttributeName' : attribute}
-        return self.get_object('GetQueueAttributes', params,
-                               Attributes, queue.id, callback=callback)
+        self.get_object('GetQueueAttributes', params,
+                        Attributes, queue.id, callback=callback, coalesce=True)
 
+    @return_future
     def set_queue_attribute(self, queue, attribute, value, callback=None):
         params = {'Attribute.Name' : attribute, 'Attribute.Value' : value}
-        return self.get_status('SetQueueAttributes', params, queue.id, callback=callback)
+        self.get_status('SetQueueAttributes', params, queue.id, callback=callback)
 
+    @return_future
     def receive_message(self, queue, number_messages=1,
-                        visibility_timeout=None, attributes=None, callback=None):
+                        visibility_timeout=None, attributes=None,
+                        wait_time_seconds=None, callback=None):
         """
         Read messages from an SQS Queue.
 
@@ -151,19 +185,49 @@ class AsyncSQSConnection(botornado.connection.AsyncAWSQueryConnection, SQSConnec
                            All|SenderId|SentTimestamp|
                            ApproximateReceiveCount|
                            ApproximateFirstReceiveTimestamp
+
+        :type wait_time_seconds: int
+        :param wait_time_seconds: If given, the request is a long poll
+                                  that waits up to this many seconds (0-20)
+                                  for a message to arrive.
         
         :rtype: list
         :return: A list of :class:`boto.sqs.message.Message` objects.
+
+        If the message_class of the queue is a
+        :class:`botornado.sqs.message.AsyncLightMessage`, the response is
+        parsed with :class:`botornado.sqs.message.ReceiveMessageParser`.
         """
         params = {'MaxNumberOfMessages' : number_messages}
         if visibility_timeout:
             params['VisibilityTimeout'] = visibility_timeout
         if attributes:
             self.build_list_params(params, attributes, 'AttributeName')
-        return self.get_list('ReceiveMessage', params,
-                             [('Message', queue.message_class)],
-                             queue.id, queue, callback=callback)
-
+        request_timeout = None
+        if wait_time_seconds is not None:
+            params['WaitTimeSeconds'] = wait_time_seconds
+            request_timeout = wait_time_seconds + self.LongPollTimeoutMargin
+        if isinstance(queue.message_class, type) and \
+                issubclass(queue.message_class, botornado.sqs.message.AsyncLightMessage):
+            def received(response):
+                body = response.read()
+                if response.status != 200 or not body:
+                    boto.log.error('%s %s' % (response.status, response.reason))
+                    boto.log.error('%s' % body)
+                    raise self.ResponseError(response.status, response.reason, body)
+                parser = botornado.sqs.message.ReceiveMessageParser(queue, queue.message_class)
+                rs = parser.parse(body)
+                if callable(callback):
+                    callback(rs)
+            self.make_request('ReceiveMessage', params, queue.id, 'GET', callback=received,
+                              request_timeout=request_timeout)
+            return
+        self.get_list('ReceiveMessage', params,
+                      [('Message', queue.message_class)],
+                      queue.id, queue, callback=callback,
+                      request_timeout=request_timeout)
+
+    @return_future
     def delete_message(self, queue, message, callback=None):
         """
         Delete a message from a queue.
@@ -178,8 +242,9 @@ class AsyncSQSConnection(botornado.connection.AsyncAWSQueryConnection, SQSConnec
         :return: True if successful, False otherwise.
         """
         params = {'ReceiptHandle' : message.receipt_handle}
-        return self.get_status('DeleteMessage', params, queue.id, callback=callback)
+        self.get_status('DeleteMessage', params, queue.id, callback=callback)
 
+    @return_future
     def delete_message_from_handle(self, queue, receipt_handle, callback=None):
         """
         Delete a message from a queue, given a receipt handle.
@@ -194,13 +259,94 @@ class AsyncSQSConnection(botornado.connection.AsyncAWSQueryConnection, SQSConnec
         :return: True if successful, False otherwise.
         """
         params = {'ReceiptHandle' : receipt_handle}
-        return self.get_status('DeleteMessage', params, queue.id, callback=callback)
+        self.get_status('DeleteMessage', params, queue.id, callback=callback)
 
+    @return_future
     def send_message(self, queue, message_content, callback=None):
         params = {'MessageBody' : message_content}
-        return self.get_object('SendMessage', params, botornado.sqs.message.AsyncMessage,
-                               queue.id, verb='POST', callback=callback)
+        self.get_object('SendMessage', params, botornado.sqs.message.AsyncMessage,
+                        queue.id, verb='POST', callback=callback)
+
+    @return_future
+    def send_message_batch(self, queue, messages, callback=None):
+        """
+        Delivers up to 10 messages to a queue in a single request.
+
+        :type queue: A :class:`boto.sqs.queue.Queue` object.
+        :param queue: The Queue to which the messages will be written.
+
+        :type messages: List of lists.
+        :param messages: A list of lists or tuples.  Each inner
+            tuple represents a single message to be written
+            and consists of and ID (string) that must be unique
+            within the list of messages, the message body itself
+            which can be a maximum of 64K in length, and an
+            integer which represents the delay time (in seconds)
+            for the message (0-900) before the message will
+            be delivered to the queue.
+
+        :rtype: :class:`boto.sqs.batchresults.BatchResults`
+        :return: The successful and failed entries, by ID.
+        """
+        params = {}
+        for i, msg in enumerate(messages):
+            prefix = 'SendMessageBatchRequestEntry.%i' % (i+1)
+            params['%s.Id' % prefix] = msg[0]
+            params['%s.MessageBody' % prefix] = msg[1]
+            params['%s.DelaySeconds' % prefix] = msg[2]
+        self.get_object('SendMessageBatch', params, BatchResults,
+                        queue.id, verb='POST', callback=callback)
+
+    @return_future
+    def delete_message_batch(self, queue, messages, callback=None):
+        """
+        Deletes up to 10 messages from a queue in a single request.
+
+        :type queue: A :class:`boto.sqs.queue.Queue` object.
+        :param queue: The Queue from which the messages will be deleted.
+
+        :type messages: List of :class:`boto.sqs.message.Message` objects.
+        :param messages: A list of message objects.  The index of each
+            message in the list is used as the ID of its entry.
 
+        :rtype: :class:`boto.sqs.batchresults.BatchResults`
+        :return: The successful and failed entries, by ID.
+        """
+        params = {}
+        for i, msg in enumerate(messages):
+            prefix = 'DeleteMessageBatchRequestEntry.%i' % (i+1)
+            params['%s.Id' % prefix] = str(i)
+            params['%s.ReceiptHandle' % prefix] = msg.receipt_handle
+        self.get_object('DeleteMessageBatch', params, BatchResults,
+                        queue.id, verb='POST', callback=callback)
+
+    @return_future
+    def change_message_visibility_batch(self, queue, messages, callback=None):
+        """
+        Changes the visibility timeout of up to 10 messages in a single
+        request.
+
+        :type queue: A :class:`boto.sqs.queue.Queue` object.
+        :param queue: The Queue of the messages.
+
+        :type messages: List of tuples.
+        :param messages: A list of (message, visibility_timeout) tuples.
+            The index of each tuple in the list is used as the ID of its
+            entry.
+
+        :rtype: :class:`boto.sqs.batchresults.BatchResults`
+        :return: The successful and failed entries, by ID.
+        """
+        params = {}
+        for i, t in enumerate(messages):
+            prefix = 'ChangeMessageVisibilityBatchRequestEntry.%i' % (i+1)
+            params['%s.Id' % prefix] = str(i)
+            params['%s.ReceiptHandle' % prefix] = t[0].receipt_handle
+            params['%s.VisibilityTimeout' % prefix] = t[1]
+        self.get_object('ChangeMessageVisibilityBatch', params, BatchResults,
+                        queue.id, verb='POST', callback=callback)
+
+    @return_future
     def change_message_visibility(self, queue, receipt_handle,
                                   visibility_timeout, callback=None):
         """
@@ -220,15 +366,36 @@ class AsyncSQSConnection(botornado.connection.AsyncAWSQueryConnection, SQSConnec
         """
         params = {'ReceiptHandle' : receipt_handle,
                   'VisibilityTimeout' : visibility_timeout}
-        return self.get_status('ChangeMessageVisibility', params, queue.id, callback=callback)
+        self.get_status('ChangeMessageVisibility', params, queue.id, callback=callback)
 
+    @return_future
     def get_all_queues(self, prefix='', callback=None):
         params = {}
         if prefix:
             params['QueueNamePrefix'] = prefix
-        return self.get_list('ListQueues', params, [('QueueUrl', botornado.sqs.queue.AsyncQueue)], callback=callback)
+        self.get_list('ListQueues', params, [('QueueUrl', botornado.sqs.queue.AsyncQueue)], callback=callback,
+                      coalesce=True)
         
+    @return_future
     def get_queue(self, queue_name, callback=None):
+        """
+        Return the queue named queue_name, or None if there is none.  If
+        the connection has a queue_cache, the queue is looked up there
+        first.
+        """
+        if self.queue_cache is None:
+            self._get_queue(queue_name, callback=callback)
+            return
+        def cache_fetched(future):
+            queue = future.result()
+            if callable(callback):
+                callback(queue)
+        tornado.ioloop.IOLoop.current().add_future(
+            self.queue_cache.fetch(queue_name, lambda: self._get_queue(queue_name)),
+            cache_fetched)
+
+    @return_future
+    def _get_queue(self, queue_name, callback=None):
         def queue_got(response):
             qs = [ q for q in response if q.url.endswith(queue_name) ]
             if callable(callback):
@@ -241,6 +408,7 @@ class AsyncSQSConnection(botornado.connection.AsyncAWSQueryConnection, SQSConnec
     # Permissions methods
     #
 
+    @return_future
     def add_permission(self, queue, label, aws_account_id, action_name, callback=None):
         """
         Add a permission to a queue.
@@ -272,8 +440,9 @@ class AsyncSQSConnection(botornado.connection.AsyncAWSQueryConnection, SQSConnec
         params = {'Label': label,
                   'AWSAccountId' : aws_account_id,
                   'ActionName' : action_name}
-        return self.get_status('AddPermission', params, queue.id, callback=callback)
+        self.get_status('AddPermission', params, queue.id, callback=callback)
 
+    @return_future
     def remove_permission(self, queue, label, callback=None):
         """
         Remove a permission from a queue.
@@ -289,7 +458,7 @@ class AsyncSQSConnection(botornado.connection.AsyncAWSQueryConnection, SQSConnec
         :return: True if successful, False otherwise.
         """
         params = {'Label': label}
-        return self.get_status('RemovePermission', params, queue.id, callback=callback)
+        self.get_status('RemovePermission', params, queue.id, callback=callback)
 
     
     
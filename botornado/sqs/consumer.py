@@ -0,0 +1,203 @@
+# Copyright (c) 2015 Yamashita, Yuu
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, dis-
+# tribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the fol-
+# lowing conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABIL-
+# ITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT
+# SHALL THE AUTHOR BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, 
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+A long-polling consumer of an SQS queue
+"""
+
+import sys
+import boto
+import tornado.concurrent
+import tornado.gen
+import tornado.ioloop
+import tornado.stack_context
+
+class AsyncQueueConsumer(object):
+    """
+    Runs a number of concurrent long polls (receivers) on a queue and
+    passes each message to handler, with at most max_in_flight messages
+    being handled at a time.  handler may return a Future; the message is
+    deleted once it (or handler itself) returns without raising, and the
+    deletes are sent as DeleteMessageBatch requests.  A message whose
+    handler fails is left in the queue to be received again once its
+    visibility timeout expires.
+
+    If a :class:`botornado.sqs.lease.AsyncLeaseManager` is given as
+    lease_manager, the visibility of each message is extended while its
+    handler runs.
+
+        consumer = AsyncQueueConsumer(queue, handle_message)
+        consumer.start()
+        ...
+        yield consumer.stop()
+    """
+
+    # seconds to wait before polling again after a failed ReceiveMessage
+    ErrorDelay = 1.0
+
+    def __init__(self, queue, handler, receivers=2, max_in_flight=20,
+                 wait_time_seconds=20, visibility_timeout=None,
+                 attributes=None, delete_linger=0.01, lease_manager=None):
+        if receivers < 1 or max_in_flight < 1:
+            raise ValueError('receivers and max_in_flight must be positive')
+        self.queue = queue
+        self.handler = handler
+        self.receivers = receivers
+        self.max_in_flight = max_in_flight
+        self.wait_time_seconds = wait_time_seconds
+        self.visibility_timeout = visibility_timeout
+        self.attributes = attributes
+        self.delete_linger = delete_linger
+        self.lease_manager = lease_manager
+        self.running = False
+        self.received = 0
+        self.handled = 0
+        self.failed = 0
+        self._in_flight = 0
+        self._reserved = 0
+        self._freed = None
+        self._receivers = []
+        self._acks = []
+        self._ack_timeout = None
+        self._deleting = 0
+
+    def start(self):
+        """
+        Start the receivers on the current IOLoop.
+        """
+        if self.running:
+            return
+        self.running = True
+        if self.lease_manager is not None:
+            self.lease_manager.start()
+        with tornado.stack_context.NullContext():
+            self._receivers = [self._receive() for i in range(self.receivers)]
+
+    @tornado.gen.coroutine
+    def stop(self):
+        """
+        Stop receiving.  The returned Future resolves once the pending
+        polls have returned, the messages they received have been
+        handled and their deletes have been sent.
+        """
+        self.running = False
+        self._wake()
+        for receiver in self._receivers:
+            yield receiver
+        self._receivers = []
+        while self._in_flight:
+            yield self._wait_freed()
+        self._flush_acks()
+        while self._deleting:
+            yield self._wait_freed()
+        if self.lease_manager is not None:
+            self.lease_manager.stop()
+
+    def _wake(self):
+        if self._freed is not None and not self._freed.done():
+            self._freed.set_result(None)
+
+    def _wait_freed(self):
+        if self._freed is None or self._freed.done():
+            self._freed = tornado.concurrent.Future()
+        return self._freed
+
+    @tornado.gen.coroutine
+    def _receive(self):
+        while self.running:
+            available = self.max_in_flight - self._in_flight - self._reserved
+            if available <= 0:
+                yield self._wait_freed()
+                continue
+            num_messages = min(10, available)
+            self._reserved += num_messages
+            try:
+                messages = yield self.queue.get_messages(
+                    num_messages, visibility_timeout=self.visibility_timeout,
+                    attributes=self.attributes,
+                    wait_time_seconds=self.wait_time_seconds)
+            except Exception, e:
+                boto.log.error('ReceiveMessage failed: %s' % e)
+                messages = []
+                if self.running:
+                    yield tornado.gen.sleep(self.ErrorDelay)
+            finally:
+                self._reserved -= num_messages
+            self.received += len(messages)
+            for message in messages:
+                self._in_flight += 1
+                self._dispatch(message)
+
+    def _dispatch(self, message):
+        def handled(future):
+            self._in_flight -= 1
+            if self.lease_manager is not None:
+                self.lease_manager.release(message)
+            if future.exception() is not None:
+                self.failed += 1
+                boto.log.error('Handler failed for message %s: %s' %
+                               (message.id, future.exception()))
+            else:
+                self.handled += 1
+                self._ack(message)
+            self._wake()
+        if self.lease_manager is not None:
+            self.lease_manager.add(message, self.visibility_timeout)
+        with tornado.stack_context.NullContext():
+            try:
+                future = tornado.gen.maybe_future(self.handler(message))
+            except Exception:
+                future = tornado.concurrent.Future()
+                future.set_exc_info(sys.exc_info())
+            tornado.ioloop.IOLoop.current().add_future(future, handled)
+
+    def _ack(self, message):
+        self._acks.append(message)
+        if len(self._acks) >= 10:
+            self._flush_acks()
+        elif self._ack_timeout is None:
+            with tornado.stack_context.NullContext():
+                self._ack_timeout = tornado.ioloop.IOLoop.current().call_later(
+                    self.delete_linger, self._flush_acks)
+
+    def _flush_acks(self):
+        if self._ack_timeout is not None:
+            tornado.ioloop.IOLoop.current().remove_timeout(self._ack_timeout)
+            self._ack_timeout = None
+        messages = self._acks
+        if not messages:
+            return
+        self._acks = []
+        self._deleting += 1
+        def deleted(future):
+            self._deleting -= 1
+            if future.exception() is not None:
+                boto.log.error('DeleteMessageBatch failed: %s' % future.exception())
+            else:
+                for e in future.result().errors:
+                    boto.log.error('Delete of message %s failed: %s' %
+                                   (messages[int(e['id'])].id, e.get('error_message')))
+            self._wake()
+        with tornado.stack_context.NullContext():
+            tornado.ioloop.IOLoop.current().add_future(
+                self.queue.delete_message_batch(messages), deleted)
+
+# vim:set ft=python sw=4 :
@@ -0,0 +1,184 @@
+# Copyright (c) 2015 Yamashita, Yuu
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, dis-
+# tribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the fol-
+# lowing conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABIL-
+# ITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT
+# SHALL THE AUTHOR BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, 
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+Keeps received SQS messages invisible while they are being handled
+"""
+
+import time
+import boto
+import tornado.ioloop
+import tornado.stack_context
+
+class AsyncLeaseManager(object):
+    """
+    Tracks the messages received from a queue and extends their
+    visibility timeout, in ChangeMessageVisibilityBatch requests of up to
+    10 messages, until they are released.  This keeps a message from
+    being delivered again while a slow handler is still working on it.
+
+    Every interval seconds the leases that would expire before the next
+    check (plus a margin of interval) are extended by visibility_timeout
+    seconds.  A lease that has been held for max_lease seconds is no
+    longer extended, so a handler that hangs cannot hold a message
+    forever.
+
+    If no visibility_timeout is given and the queue does not know its
+    own, start reads the VisibilityTimeout attribute of the queue, and
+    the leases are extended once it is known.
+
+        leases = AsyncLeaseManager(queue, visibility_timeout=30)
+        leases.start()
+        leases.add(message)
+        ...
+        leases.release(message)
+    """
+
+    # seconds to wait before reading the VisibilityTimeout again after a
+    # failed GetQueueAttributes
+    ErrorDelay = 1.0
+
+    def __init__(self, queue, visibility_timeout=None, interval=None,
+                 max_lease=None):
+        self.queue = queue
+        self.visibility_timeout = visibility_timeout or queue.visibility_timeout
+        self.interval = interval
+        self.max_lease = max_lease
+        self.extended = 0
+        self.running = False
+        self._leases = {}
+        self._periodic = None
+
+    def start(self):
+        """
+        Start extending leases on the current IOLoop.
+        """
+        if self.running:
+            return
+        self.running = True
+        if self.visibility_timeout is None:
+            self._read_timeout()
+        else:
+            self._start()
+
+    def _read_timeout(self):
+        def got_timeout(future):
+            if not self.running:
+                return
+            if future.exception() is not None:
+                boto.log.error('Could not read the VisibilityTimeout of %s: %s' %
+                               (self.queue.url, future.exception()))
+                tornado.ioloop.IOLoop.current().call_later(self.ErrorDelay, self._read_timeout)
+                return
+            self.visibility_timeout = future.result()
+            for lease in self._leases.itervalues():
+                if lease['expires'] is None:
+                    lease['expires'] = lease['acquired'] + self.visibility_timeout
+            self._start()
+        with tornado.stack_context.NullContext():
+            tornado.ioloop.IOLoop.current().add_future(self.queue.get_timeout(), got_timeout)
+
+    def _start(self):
+        if self.interval is None:
+            self.interval = max(self.visibility_timeout / 3.0, 1)
+        with tornado.stack_context.NullContext():
+            self._periodic = tornado.ioloop.PeriodicCallback(
+                self.extend, self.interval * 1000)
+            self._periodic.start()
+
+    def stop(self):
+        self.running = False
+        if self._periodic is not None:
+            self._periodic.stop()
+            self._periodic = None
+
+    def add(self, message, visibility_timeout=None):
+        """
+        Start tracking a message that has just been received with
+        visibility_timeout (by default the one of the lease manager).
+        """
+        now = time.time()
+        visibility_timeout = visibility_timeout or self.visibility_timeout
+        self._leases[message.receipt_handle] = {
+            'message': message, 'acquired': now, 'extending': False,
+            'expires': visibility_timeout and now + visibility_timeout}
+
+    def release(self, message, visibility_timeout=None):
+        """
+        Stop extending the visibility of message.  If visibility_timeout
+        is given, the visibility is set to it, for example 0 to make a
+        message that could not be handled available again right away.
+        """
+        self._leases.pop(message.receipt_handle, None)
+        if visibility_timeout is not None:
+            with tornado.stack_context.NullContext():
+                self.queue.connection.change_message_visibility(
+                    self.queue, message.receipt_handle, visibility_timeout)
+
+    def __len__(self):
+        return len(self._leases)
+
+    def __contains__(self, message):
+        return message.receipt_handle in self._leases
+
+    def extend(self):
+        """
+        Extend the leases that would expire before the next check, except
+        those whose extension is still in flight.
+        """
+        if self.visibility_timeout is None:
+            return
+        now = time.time()
+        expiring = []
+        for handle, lease in self._leases.items():
+            if self.max_lease is not None and now - lease['acquired'] >= self.max_lease:
+                del self._leases[handle]
+            elif not lease['extending'] and lease['expires'] - now < self.interval * 2:
+                expiring.append(lease)
+        for i in range(0, len(expiring), 10):
+            self._extend_batch(expiring[i:i+10], now)
+
+    def _extend_batch(self, leases, now):
+        def extended(future):
+            for lease in leases:
+                lease['extending'] = False
+            if future.exception() is not None:
+                boto.log.error('ChangeMessageVisibilityBatch failed: %s' % future.exception())
+                return
+            rs = future.result()
+            for r in rs.results:
+                lease = leases[int(r['id'])]
+                lease['expires'] = now + self.visibility_timeout
+                self.extended += 1
+            for e in rs.errors:
+                # the receipt handle is no longer valid
+                lease = leases[int(e['id'])]
+                self._leases.pop(lease['message'].receipt_handle, None)
+                boto.log.error('Lease of message %s lost: %s' %
+                               (lease['message'].id, e.get('error_message')))
+        for lease in leases:
+            lease['extending'] = True
+        with tornado.stack_context.NullContext():
+            future = self.queue.change_message_visibility_batch(
+                [(lease['message'], self.visibility_timeout) for lease in leases])
+            tornado.ioloop.IOLoop.current().add_future(future, extended)
+
+# vim:set ft=python sw=4 :
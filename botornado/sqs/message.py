@@ -65,6 +65,8 @@ in the format in which it would be stored in SQS.
 
 import base64
 import StringIO
+import xml.parsers.expat
+from boto.resultset import ResultSet
 from boto.sqs.attributes import Attributes
 from boto.exception import SQSDecodeError
 
@@ -77,9 +79,9 @@ class _AsyncMessage:
 
     def change_visibility(self, visibility_timeout, callback=None):
         if self.queue:
-            self.queue.connection.change_message_visibility(self.queue,
-                                                            self.receipt_handle,
-                                                            visibility_timeout, callback=callback)
+            return self.queue.connection.change_message_visibility(self.queue,
+                                                                   self.receipt_handle,
+                                                                   visibility_timeout, callback=callback)
 
 class AsyncRawMessage(_AsyncMessage, RawMessage):
     """
@@ -94,9 +96,9 @@ class AsyncRawMessage(_AsyncMessage, RawMessage):
 
     def change_visibility(self, visibility_timeout, callback=None):
         if self.queue:
-            self.queue.connection.change_message_visibility(self.queue,
-                                                            self.receipt_handle,
-                                                            visibility_timeout, callback=callback)
+            return self.queue.connection.change_message_visibility(self.queue,
+                                                                   self.receipt_handle,
+                                                                   visibility_timeout, callback=callback)
      
 class AsyncMessage(_AsyncMessage, Message):
     """
@@ -133,5 +135,149 @@ class AsyncEncodedMHMessage(_AsyncMessage, EncodedMHMessage):
     The message instance can be treated like a mapping object,
     i.e. m['HeaderName'] would return 'HeaderValue'.
     """
-    
+
+# marks the body of a received light message that has not been decoded yet
+_NOT_DECODED = object()
+
+class AsyncLightMessage(object):
+    """
+    A compact message for high-throughput receivers.  When it is the
+    message_class of a queue, ReceiveMessage responses are parsed with
+    :class:`ReceiveMessageParser` instead of the SAX handlers, and the
+    base64 body is only decoded when get_body is called.  It is
+    otherwise used like :class:`AsyncMessage`.
+    """
+    __slots__ = ('queue', 'id', 'receipt_handle', 'md5', '_attributes',
+                 '_encoded', '_body')
+
+    def __init__(self, queue=None, body=''):
+        self.queue = queue
+        self.id = None
+        self.receipt_handle = None
+        self.md5 = None
+        self._attributes = None
+        self._encoded = None
+        self._body = body
+
+    def __len__(self):
+        return len(self.get_body_encoded())
+
+    @property
+    def attributes(self):
+        if self._attributes is None:
+            self._attributes = {}
+        return self._attributes
+
+    def encode(self, value):
+        return base64.b64encode(value)
+
+    def decode(self, value):
+        try:
+            value = base64.b64decode(value)
+        except:
+            raise SQSDecodeError('Unable to decode message', self)
+        return value
+
+    def set_encoded_body(self, encoded):
+        """Set the body as it was received from SQS, to be decoded on demand."""
+        self._encoded = encoded
+        self._body = _NOT_DECODED
+
+    def set_body(self, body):
+        self._body = body
+        self._encoded = None
+
+    def get_body(self):
+        if self._body is _NOT_DECODED:
+            self._body = self.decode(self._encoded)
+        return self._body
+
+    def get_body_encoded(self):
+        if self._encoded is None:
+            self._encoded = self.encode(self._body)
+        return self._encoded
+
+    def delete(self, callback=None):
+        if self.queue:
+            return self.queue.delete_message(self, callback=callback)
+
+    def change_visibility(self, visibility_timeout, callback=None):
+        if self.queue:
+            return self.queue.connection.change_message_visibility(self.queue,
+                                                                   self.receipt_handle,
+                                                                   visibility_timeout, callback=callback)
+
+class AsyncLightRawMessage(AsyncLightMessage):
+    """
+    An :class:`AsyncLightMessage` that does not encode its body.
+    """
+    __slots__ = ()
+
+    def encode(self, value):
+        return value
+
+    def decode(self, value):
+        return value
+
+class ReceiveMessageParser(object):
+    """
+    Parses a ReceiveMessage response with expat, setting the fields of
+    each message directly instead of going through
+    :class:`boto.handler.XmlHandler` and the startElement/endElement
+    callbacks of the message.
+
+        rs = ReceiveMessageParser(queue, AsyncLightMessage).parse(body)
+    """
+
+    # element name -> message attribute
+    Fields = {'MessageId': 'id', 'ReceiptHandle': 'receipt_handle',
+              'MD5OfBody': 'md5', 'MD5OfMessageBody': 'md5'}
+
+    def __init__(self, queue, message_class=AsyncLightMessage):
+        self.queue = queue
+        self.message_class = message_class
+
+    def parse(self, body):
+        """
+        Return a :class:`boto.resultset.ResultSet` of the messages of
+        the ReceiveMessage response body.
+        """
+        rs = ResultSet([('Message', self.message_class)])
+        fields = self.Fields
+        text = []
+        state = {'message': None, 'in_attribute': False, 'name': None}
+        def start(name, attrs):
+            del text[:]
+            if name == 'Message':
+                state['message'] = self.message_class(self.queue)
+            elif name == 'Attribute':
+                state['in_attribute'] = True
+        def end(name):
+            message = state['message']
+            if message is None:
+                if name == 'RequestId':
+                    rs.request_id = ''.join(text)
+                return
+            if state['in_attribute']:
+                if name == 'Name':
+                    state['name'] = ''.join(text)
+                elif name == 'Value':
+                    message.attributes[state['name']] = ''.join(text)
+                elif name == 'Attribute':
+                    state['in_attribute'] = False
+            elif name == 'Body':
+                message.set_encoded_body(''.join(text))
+            elif name == 'Message':
+                rs.append(message)
+                state['message'] = None
+            elif name in fields:
+                setattr(message, fields[name], ''.join(text))
+        parser = xml.parsers.expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.CharacterDataHandler = text.append
+        parser.Parse(body, True)
+        return rs
+
 # vim:set ft=python sw=4 :
@@ -23,19 +23,113 @@
 Represents an SQS Queue
 """
 
+import collections
+import functools
 import urlparse
+import boto
+import tornado.concurrent
+import tornado.gen
+import tornado.ioloop
+import tornado.stack_context
 from boto.sqs.message import Message
+from boto.exception import SQSError
 
 from boto.sqs.queue import *
+from tornado.concurrent import return_future
+
+class AsyncBatchWriter(object):
+    """
+    Coalesces the messages written to a queue into SendMessageBatch
+    requests.  A batch is sent when it holds max_messages messages, when
+    the next message would make it larger than max_bytes, or linger
+    seconds after its first message was written, whichever comes first.
+    """
+
+    def __init__(self, queue, linger=0.005, max_messages=10, max_bytes=256*1024):
+        self.queue = queue
+        self.linger = linger
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self._entries = []
+        self._bytes = 0
+        self._timeout = None
+
+    def write(self, message):
+        """
+        Queue message for the next batch and return a Future of the
+        message, with its id and md5 set once the batch has been sent.
+        """
+        body = message.get_body_encoded()
+        if self._entries and self._bytes + len(body) > self.max_bytes:
+            self.flush()
+        future = tornado.concurrent.Future()
+        self._entries.append((message, body, future))
+        self._bytes += len(body)
+        if len(self._entries) >= self.max_messages:
+            self.flush()
+        elif self._timeout is None:
+            # the batch does not belong to the caller of the first write
+            with tornado.stack_context.NullContext():
+                self._timeout = tornado.ioloop.IOLoop.current().call_later(
+                    self.linger, self.flush)
+        return future
+
+    def flush(self):
+        """
+        Send the messages written so far.
+        """
+        if self._timeout is not None:
+            tornado.ioloop.IOLoop.current().remove_timeout(self._timeout)
+            self._timeout = None
+        entries = self._entries
+        if not entries:
+            return
+        self._entries = []
+        self._bytes = 0
+        def batch_sent(sent):
+            if sent.exception() is not None:
+                for message, body, future in entries:
+                    future.set_exc_info(sent.exc_info())
+                return
+            rs = sent.result()
+            for r in rs.results:
+                message, body, future = entries[int(r['id'])]
+                message.id = r.get('message_id')
+                message.md5 = r.get('message_md5')
+                future.set_result(message)
+            for e in rs.errors:
+                message, body, future = entries[int(e['id'])]
+                error = SQSError(400, e.get('error_code'))
+                error.error_code = e.get('error_code')
+                error.error_message = e.get('error_message')
+                future.set_exception(error)
+            # a message the response says nothing about must not be left
+            # waiting forever
+            for message, body, future in entries:
+                if not future.done():
+                    error = SQSError(200, 'MissingBatchResult')
+                    error.error_code = 'MissingBatchResult'
+                    error.error_message = 'SendMessageBatch returned no result for the message'
+                    future.set_exception(error)
+        with tornado.stack_context.NullContext():
+            batch = self.queue.connection.send_message_batch(
+                self.queue, [(str(i), body, 0) for i, (message, body, future) in enumerate(entries)])
+            tornado.ioloop.IOLoop.current().add_future(batch, batch_sent)
 
 class AsyncQueue(Queue):
 
+    # When set to a number of seconds, write coalesces the messages
+    # written within that time into SendMessageBatch requests.
+    write_linger = None
+
     def __init__(self, connection=None, url=None, message_class=Message):
         self.connection = connection
         self.url = url
         self.message_class = message_class
         self.visibility_timeout = None
+        self._batch_writer = None
 
+    @return_future
     def get_attributes(self, attributes='All', callback=None):
         """
         Retrieves attributes about this queue object and returns
@@ -53,8 +147,9 @@ class AsyncQueue(Queue):
         :return: An Attribute object which is a mapping type holding the
                  requested name/value pairs
         """
-        return self.connection.get_queue_attributes(self, attributes, callback=callback)
+        self.connection.get_queue_attributes(self, attributes, callback=callback)
 
+    @return_future
     def set_attribute(self, attribute, value, callback=None):
         """
         Set a new value for an attribute of the Queue.
@@ -70,8 +165,9 @@ class AsyncQueue(Queue):
         :rtype: bool
         :return: True if successful, otherwise False.
         """
-        return self.connection.set_queue_attribute(self, attribute, value, callback=callback)
+        self.connection.set_queue_attribute(self, attribute, value, callback=callback)
 
+    @return_future
     def get_timeout(self, callback=None):
         """
         Get the visibility timeout for the queue.
@@ -84,6 +180,7 @@ class AsyncQueue(Queue):
                 callback(int(a['VisibilityTimeout']))
         self.get_attributes('VisibilityTimeout', callback=got_timeout)
 
+    @return_future
     def set_timeout(self, visibility_timeout, callback=None):
         """
         Set the visibility timeout for the queue.
@@ -98,6 +195,7 @@ class AsyncQueue(Queue):
                 callback(retval)
         retval = self.set_attribute('VisibilityTimeout', visibility_timeout, callback=_set_timeout)
 
+    @return_future
     def add_permission(self, label, aws_account_id, action_name, callback=None):
         """
         Add a permission to a queue.
@@ -122,8 +220,9 @@ class AsyncQueue(Queue):
         :return: True if successful, False otherwise.
 
         """
-        return self.connection.add_permission(self, label, aws_account_id, action_name, callback=callback)
+        self.connection.add_permission(self, label, aws_account_id, action_name, callback=callback)
 
+    @return_future
     def remove_permission(self, label, callback=None):
         """
         Remove a permission from a queue.
@@ -134,8 +233,9 @@ class AsyncQueue(Queue):
         :rtype: bool
         :return: True if successful, False otherwise.
         """
-        return self.connection.remove_permission(self, label, callback=callback)
+        self.connection.remove_permission(self, label, callback=callback)
 
+    @return_future
     def read(self, visibility_timeout=None, callback=None):
         """
         Read a single message from the queue.
@@ -149,8 +249,9 @@ class AsyncQueue(Queue):
         def _read(rs):
             if callable(callback):
                 callback(rs[0] if len(rs) == 1 else None)
-        self.get_messages(1, visibility_timeout, callback=callback)
+        self.get_messages(1, visibility_timeout, callback=_read)
 
+    @return_future
     def write(self, message, callback=None):
         """
         Add a single message to the queue.
@@ -160,7 +261,22 @@ class AsyncQueue(Queue):
 
         :rtype: :class:`boto.sqs.message.Message`
         :return: The :class:`boto.sqs.message.Message` object that was written.
-        """
+
+        If write_linger is set, the message is sent in a batch with the
+        other messages written within write_linger seconds.
+        """
+        if self.write_linger is not None:
+            if self._batch_writer is None or self._batch_writer.linger != self.write_linger:
+                if self._batch_writer is not None:
+                    self._batch_writer.flush()
+                self._batch_writer = AsyncBatchWriter(self, self.write_linger)
+            def batch_wrote(future):
+                message = future.result()
+                if callable(callback):
+                    callback(message)
+            tornado.ioloop.IOLoop.current().add_future(
+                self._batch_writer.write(message), batch_wrote)
+            return
         def wrote(new_msg):
             message.id = new_msg.id
             message.md5 = new_msg.md5
@@ -168,9 +284,37 @@ class AsyncQueue(Queue):
                 callback(message)
         self.connection.send_message(self, message.get_body_encoded(), callback=wrote)
 
+    def flush(self):
+        """
+        Send the messages that are waiting to be batched by write.
+        """
+        if self._batch_writer is not None:
+            self._batch_writer.flush()
+
+    @return_future
+    def write_batch(self, messages, callback=None):
+        """
+        Delivers up to 10 messages in a single request.
+
+        :type messages: List of lists.
+        :param messages: A list of lists or tuples.  Each inner
+            tuple represents a single message to be written
+            and consists of and ID (string) that must be unique
+            within the list of messages, the message body itself
+            which can be a maximum of 64K in length, and an
+            integer which represents the delay time (in seconds)
+            for the message (0-900) before the message will
+            be delivered to the queue.
+
+        :rtype: :class:`boto.sqs.batchresults.BatchResults`
+        :return: The successful and failed entries, by ID.
+        """
+        self.connection.send_message_batch(self, messages, callback=callback)
+
     # get a variable number of messages, returns a list of messages
+    @return_future
     def get_messages(self, num_messages=1, visibility_timeout=None,
-                     attributes=None, callback=None):
+                     attributes=None, wait_time_seconds=None, callback=None):
         """
         Get a variable number of messages.
 
@@ -189,14 +333,21 @@ class AsyncQueue(Queue):
                            SentTimestamp
                            ApproximateReceiveCount
                            ApproximateFirstReceiveTimestamp
+
+        :type wait_time_seconds: int
+        :param wait_time_seconds: If given, wait up to this many seconds
+                                  (0-20) for a message to arrive.
                            
         :rtype: list
         :return: A list of :class:`boto.sqs.message.Message` objects.
         """
-        return self.connection.receive_message(self, number_messages=num_messages,
-                                               visibility_timeout=visibility_timeout,
-                                               attributes=attributes, callback=callback)
+        self.connection.receive_message(self, number_messages=num_messages,
+                                        visibility_timeout=visibility_timeout,
+                                        attributes=attributes,
+                                        wait_time_seconds=wait_time_seconds,
+                                        callback=callback)
 
+    @return_future
     def delete_message(self, message, callback=None):
         """
         Delete a message from the queue.
@@ -207,18 +358,145 @@ class AsyncQueue(Queue):
         :rtype: bool
         :return: True if successful, False otherwise
         """
-        return self.connection.delete_message(self, message, callback=callback)
+        self.connection.delete_message(self, message, callback=callback)
+
+    @return_future
+    def delete_message_batch(self, messages, callback=None):
+        """
+        Deletes up to 10 messages in a single request.
 
+        :type messages: List of :class:`boto.sqs.message.Message` objects.
+        :param messages: A list of message objects.
+
+        :rtype: :class:`boto.sqs.batchresults.BatchResults`
+        :return: The successful and failed entries, identified by the
+                 index of the message in messages.
+        """
+        self.connection.delete_message_batch(self, messages, callback=callback)
+
+    @return_future
+    def change_message_visibility_batch(self, messages, callback=None):
+        """
+        Changes the visibility timeout of up to 10 messages in a single
+        request.
+
+        :type messages: List of tuples.
+        :param messages: A list of (message, visibility_timeout) tuples.
+
+        :rtype: :class:`boto.sqs.batchresults.BatchResults`
+        :return: The successful and failed entries, identified by the
+                 index of the tuple in messages.
+        """
+        self.connection.change_message_visibility_batch(self, messages, callback=callback)
+
+    @return_future
     def delete(self, callback=None):
         """
         Delete the queue.
         """
-        return self.connection.delete_queue(self, callback=callback)
+        self.connection.delete_queue(self, callback=callback)
+
+    @tornado.gen.coroutine
+    def _drain(self, process, page_size=10, vtimeout=10, receivers=4, delete=True):
+        """
+        Read the queue with receivers concurrent ReceiveMessage requests
+        until they come back empty, pass every page of messages to
+        process (which may return a Future or a list of Futures) and
+        then, if delete is True, delete the page with a
+        DeleteMessageBatch request that overlaps with the next receive.
+        At most receivers deletes are in flight; the messages that could
+        not be deleted are logged as each delete returns.  A failed
+        receive, process or delete stops all the receivers before their
+        next ReceiveMessage request and fails the drain.  Resolves to the
+        number of messages read.
+        """
+        state = {'n': 0, 'stopped': False}
+        deletes = collections.deque()
+        def deleted(future):
+            if future.exception() is not None:
+                state['stopped'] = True
+                return
+            for e in future.result().errors:
+                boto.log.error('Could not delete message: %s' % e.get('error_message'))
+        @tornado.gen.coroutine
+        def receive():
+            while not state['stopped']:
+                try:
+                    messages = yield self.get_messages(page_size, vtimeout)
+                    if not messages:
+                        break
+                    processed = process(messages)
+                    if processed is not None:
+                        yield processed
+                except Exception:
+                    state['stopped'] = True
+                    raise
+                state['n'] += len(messages)
+                if delete:
+                    future = self.delete_message_batch(messages)
+                    tornado.ioloop.IOLoop.current().add_future(future, deleted)
+                    deletes.append(future)
+                    while len(deletes) > receivers:
+                        yield deletes.popleft()
+        yield [receive() for i in range(receivers)]
+        while deletes:
+            yield deletes.popleft()
+        raise tornado.gen.Return(state['n'])
+
+    @tornado.gen.coroutine
+    def _load(self, items, transform=None, max_pending=100, linger=0.005):
+        """
+        Write a message for every item of the iterator or asynchronous
+        listing items, coalesced into SendMessageBatch requests.  The body
+        of the message is transform(item), which may return a Future, or
+        the item itself.  Up to max_pending messages are being prepared
+        or waiting to be sent at a time.  Resolves to the number of
+        messages written.
+        """
+        writer = AsyncBatchWriter(self, linger=linger)
+        @tornado.gen.coroutine
+        def load_one(item):
+            body = item
+            if transform is not None:
+                body = yield tornado.gen.maybe_future(transform(item))
+            yield writer.write(self.new_message(body))
+        pending = collections.deque()
+        n = 0
+        while True:
+            if hasattr(items, 'fetch_next'):
+                if not (yield items.fetch_next):
+                    break
+                item = items.next_object()
+            else:
+                try:
+                    item = items.next()
+                except StopIteration:
+                    break
+            pending.append(load_one(item))
+            n += 1
+            if len(pending) >= max_pending:
+                yield pending.popleft()
+        yield list(pending)
+        raise tornado.gen.Return(n)
+
+    def _return(self, future, callback):
+        def returned(future):
+            result = future.result()
+            if callable(callback):
+                callback(result)
+        tornado.ioloop.IOLoop.current().add_future(future, returned)
 
-    def clear(self, page_size=10, vtimeout=10, callback=None):
-        """Utility function to remove all messages from a queue"""
-        raise BotoClientError('Not Implemented')
+    @return_future
+    def clear(self, page_size=10, vtimeout=10, receivers=4, callback=None):
+        """
+        Utility function to remove all messages from a queue, with
+        receivers concurrent readers and batched deletes.
+        Returns the number of messages removed.
+        """
+        self._return(self._drain(lambda messages: None, page_size, vtimeout,
+                                 receivers), callback)
 
+    @return_future
     def count(self, page_size=10, vtimeout=10, callback=None):
         """
         Utility function to count the number of messages in a queue.
@@ -230,7 +508,8 @@ class AsyncQueue(Queue):
                 callback(int(a['ApproximateNumberOfMessages']))
         self.get_attributes('ApproximateNumberOfMessages', callback=counted)
 
-    def count_slow(self, page_size=10, vtimeout=10, callback=None):
+    @return_future
+    def count_slow(self, page_size=10, vtimeout=10, receivers=4, callback=None):
         """
         Deprecated.  This is the old 'count' method that actually counts
         the messages by reading them all.  This gives an accurate count but
@@ -239,14 +518,30 @@ class AsyncQueue(Queue):
         advantage of the new SQS capability.  This is retained only for
         the unit tests.
         """
-        raise BotoClientError('Not Implemented')
+        self._return(self._drain(lambda messages: None, page_size, vtimeout,
+                                 receivers, delete=False), callback)
 
-    def dump(self, file_name, page_size=10, vtimeout=10, sep='\n', callback=None):
+    @return_future
+    def dump(self, file_name, page_size=10, vtimeout=10, sep='\n', receivers=4,
+             callback=None):
         """Utility function to dump the messages in a queue to a file
         NOTE: Page size must be < 10 else SQS errors"""
-        raise BotoClientError('Not Implemented')
-
-    def save_to_file(self, fp, sep='\n', callback=None):
+        @tornado.gen.coroutine
+        def dump():
+            with open(file_name, 'wb') as fp:
+                n = yield self._drain(functools.partial(self._write_bodies, fp, sep),
+                                      page_size, vtimeout, receivers, delete=False)
+            raise tornado.gen.Return(n)
+        self._return(dump(), callback)
+
+    def _write_bodies(self, fp, sep, messages):
+        for m in messages:
+            fp.write(m.get_body())
+            if sep:
+                fp.write(sep)
+
+    @return_future
+    def save_to_file(self, fp, sep='\n', receivers=4, callback=None):
         """
         Read all messages from the queue and persist them to file-like object.
         Messages are written to the file and the 'sep' string is written
@@ -254,9 +549,11 @@ class AsyncQueue(Queue):
         being written to the file.
         Returns the number of messages saved.
         """
-        raise BotoClientError('Not Implemented')
+        self._return(self._drain(functools.partial(self._write_bodies, fp, sep),
+                                 receivers=receivers), callback)
 
-    def save_to_filename(self, file_name, sep='\n', callback=None):
+    @return_future
+    def save_to_filename(self, file_name, sep='\n', receivers=4, callback=None):
         """
         Read all messages from the queue and persist them to local file.
         Messages are written to the file and the 'sep' string is written
@@ -264,12 +561,18 @@ class AsyncQueue(Queue):
         being written to the file.
         Returns the number of messages saved.
         """
-        raise BotoClientError('Not Implemented')
+        @tornado.gen.coroutine
+        def save():
+            with open(file_name, 'wb') as fp:
+                n = yield self.save_to_file(fp, sep, receivers)
+            raise tornado.gen.Return(n)
+        self._return(save(), callback)
 
     # for backwards compatibility
     save = save_to_filename
 
-    def save_to_s3(self, bucket):
+    @return_future
+    def save_to_s3(self, bucket, receivers=4, callback=None):
         """
         Read all messages from the queue and persist them to S3.
         Messages are stored in the S3 bucket using a naming scheme of::
@@ -277,23 +580,52 @@ class AsyncQueue(Queue):
             <queue_id>/<message_id>
         
         Messages are deleted from the queue after being saved to S3.
+        The messages of a page are uploaded concurrently.
         Returns the number of messages saved.
         """
-        raise BotoClientError('Not Implemented')
+        def upload(messages):
+            return [bucket.new_key('%s/%s' % (self.id, m.id)).set_contents_from_string(m.get_body())
+                    for m in messages]
+        self._return(self._drain(upload, receivers=receivers), callback)
 
-    def load_from_s3(self, bucket, prefix=None):
+    @return_future
+    def load_from_s3(self, bucket, prefix=None, max_pending=100, callback=None):
         """
-        Load messages previously saved to S3.
+        Load messages previously saved to S3.  Up to max_pending keys
+        are downloaded or waiting to be sent at a time.
         """
-        raise BotoClientError('Not Implemented')
+        if prefix:
+            prefix = '%s/' % prefix
+        else:
+            prefix = '%s/' % self.id[1:]
+        self._return(self._load(bucket.list(prefix=prefix),
+                                lambda key: key.get_contents_as_string(),
+                                max_pending), callback)
 
-    def load_from_file(self, fp, sep='\n'):
+    @return_future
+    def load_from_file(self, fp, sep='\n', max_pending=100, callback=None):
         """Utility function to load messages from a file-like object to a queue"""
-        raise BotoClientError('Not Implemented')
-
-    def load_from_filename(self, file_name, sep='\n'):
+        def bodies():
+            body = ''
+            l = fp.readline()
+            while l:
+                if l == sep:
+                    yield body
+                    body = ''
+                else:
+                    body = body + l
+                l = fp.readline()
+        self._return(self._load(bodies(), max_pending=max_pending), callback)
+
+    @return_future
+    def load_from_filename(self, file_name, sep='\n', max_pending=100, callback=None):
         """Utility function to load messages from a local filename to a queue"""
-        raise BotoClientError('Not Implemented')
+        @tornado.gen.coroutine
+        def load():
+            with open(file_name, 'rb') as fp:
+                n = yield self.load_from_file(fp, sep, max_pending)
+            raise tornado.gen.Return(n)
+        self._return(load(), callback)
 
     # for backward compatibility
     load = load_from_filename
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import base64
+import email.utils
+import hashlib
+import hmac
+import time
+import unittest
+
+import boto.auth
+import boto.utils
+from boto.provider import Provider
+
+class AuthTestCase(unittest.TestCase):
+    def setUp(self):
+        self.provider = Provider('aws', 'public', 'secret')
+
+    def test_dates(self):
+        real_time = time.time
+        try:
+            for now in (1325376000.25, 1325376000.75, 1325376001.5):
+                time.time = lambda: now
+                self.assertEqual(email.utils.formatdate(now, usegmt=True),
+                                 boto.auth.http_date())
+                self.assertEqual(boto.utils.get_ts(time.gmtime(now)), boto.auth.timestamp())
+        finally:
+            time.time = real_time
+
+    def test_hmac_digest(self):
+        class OpaqueHMAC(object):
+            # an hmac object that does not expose its pads
+            def __init__(self, mac):
+                self._mac = mac
+
+            def copy(self):
+                return self._mac.copy()
+
+        mac = hmac.new('secret', digestmod=hashlib.sha256)
+        expected = hmac.new('secret', 'message', hashlib.sha256).digest()
+        self.assertEqual(expected, boto.auth.hmac_digest(mac, 'message'))
+        self.assertEqual(expected, boto.auth.hmac_digest(OpaqueHMAC(mac), 'message'))
+
+    def test_query_signature_v2(self):
+        handler = boto.auth.QuerySignatureV2AuthHandler('127.0.0.1', None, self.provider)
+        for body in ('hello world', u'caf\xe9 ~*+'):
+            params = {'Action': 'SendMessage', 'Version': '2011-10-01', 'MessageBody': body,
+                      'AWSAccessKeyId': 'public', 'SignatureVersion': 2,
+                      'Timestamp': '2012-01-01T00:00:00Z'}
+            qs, signature = handler._calc_signature(params, 'GET', '/queue', 'Queue.amazonaws.com')
+            self.assertEqual('AWSAccessKeyId=public&Action=SendMessage&MessageBody=%s&'
+                             'SignatureMethod=HmacSHA256&SignatureVersion=2&'
+                             'Timestamp=2012-01-01T00%%3A00%%3A00Z&Version=2011-10-01'
+                             % {'hello world': 'hello%20world',
+                                u'caf\xe9 ~*+': 'caf%C3%A9%20~%2A%2B'}[body], qs)
+            digest = hmac.new('secret', 'GET\nqueue.amazonaws.com\n/queue\n' + qs,
+                              hashlib.sha256).digest()
+            self.assertEqual(base64.b64encode(digest), signature)
+
+    def test_canonical_resource(self):
+        for i in range(2):
+            self.assertEqual('/bucket/key?partNumber=2&uploadId=a b',
+                             boto.utils.canonical_resource(
+                                 '/bucket/key?uploadId=a%20b&partNumber=2&foo=bar'))
+        self.assertEqual('/bucket/key', boto.utils.canonical_resource('/bucket/key?foo=bar'))
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim:set ft=python sw=4 :
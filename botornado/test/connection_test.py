@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+import random
+import StringIO
+import unittest
+
+import tornado.testing
+import tornado.web
+
+from botornado.connection import *
+from botornado.s3.connection import *
+
+class FlakyHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.application.settings['requests'].append(self.request.path)
+        if self.application.settings['failures'] > 0:
+            self.application.settings['failures'] -= 1
+            self.send_error(503)
+        elif self.request.path.strip('/') == 'old':
+            self.redirect('/new', status=307)
+        else:
+            self.write("""<?xml version="1.0" encoding="UTF-8"?>
+<ListAllMyBucketsResult xmlns="http://doc.s3.amazonaws.com/2006-03-01">
+  <Buckets><Bucket><Name>%s</Name></Bucket></Buckets>
+</ListAllMyBucketsResult>
+""" % self.request.path.strip('/'))
+
+    def put(self):
+        self.application.settings['bodies'].append(self.request.body)
+        self.get()
+
+class UnseekableIO(object):
+    def __init__(self, data):
+        self.read = StringIO.StringIO(data).read
+
+class AsyncConnectionPoolTestCase(unittest.TestCase):
+    def test_max_connections_per_host(self):
+        pool = AsyncConnectionPool(max_connections_per_host=2)
+        started = []
+        s3 = pool.get_host_pool('bucket.s3.amazonaws.com', True)
+        sqs = pool.get_host_pool('queue.amazonaws.com', True)
+        for i in range(3):
+            s3.acquire(lambda i=i: started.append(('s3', i)))
+        sqs.acquire(lambda: started.append(('sqs', 0)))
+        self.assertEqual([('s3', 0), ('s3', 1), ('sqs', 0)], started)
+        self.assertEqual(3, pool.size())
+        self.assertEqual(1, pool.queued())
+        s3.release()
+        self.assertEqual(('s3', 2), started[-1])
+        self.assertEqual(0, pool.queued())
+        self.assertEqual({'active': 2, 'queued': 0, 'requests': 3, 'waited': 1},
+                         pool.stats()[('bucket.s3.amazonaws.com', True)])
+
+    def test_set_max_connections(self):
+        pool = AsyncConnectionPool(max_connections_per_host=1)
+        started = []
+        for i in range(3):
+            pool.get_host_pool('queue.amazonaws.com', True).acquire(lambda i=i: started.append(i))
+        self.assertEqual([0], started)
+        pool.set_max_connections('queue.amazonaws.com', True, 3)
+        self.assertEqual([0, 1, 2], started)
+
+    def test_release_on_failed_fetch(self):
+        class BrokenClient(object):
+            def fetch(self, request, callback):
+                raise ValueError('broken')
+        pool = AsyncConnectionPool(max_connections_per_host=1)
+        conn = AsyncHTTPConnection('127.0.0.1', http_client=BrokenClient(),
+                                   pool=pool.get_host_pool('127.0.0.1', False))
+        conn.request('GET', '/')
+        self.assertRaises(ValueError, conn.getresponse)
+        self.assertEqual(0, pool.size())
+
+class AsyncConnectionRetryTestCase(tornado.testing.AsyncHTTPTestCase, tornado.testing.LogTrapTestCase):
+    def get_app(self):
+        return tornado.web.Application([(r'.*', FlakyHandler)], failures=0, requests=[],
+                                       bodies=[])
+
+    def setUp(self):
+        super(AsyncConnectionRetryTestCase, self).setUp()
+        self.s3_client = AsyncS3Connection(aws_access_key_id='public', aws_secret_access_key='secret',
+                                           host='127.0.0.1', port=self.get_http_port(),
+                                           is_secure=False, calling_format=OrdinaryCallingFormat(),
+                                           http_client=self.http_client)
+        self._random = random.random
+        random.random = lambda: 0.0
+
+    def tearDown(self):
+        random.random = self._random
+        super(AsyncConnectionRetryTestCase, self).tearDown()
+
+    def test_retry_on_503(self):
+        self._app.settings['failures'] = 2
+        self.s3_client.make_request('GET', 'bucket', callback=self.stop)
+        response = self.wait()
+        self.assertEqual(200, response.status)
+        self.assertEqual(0, self._app.settings['failures'])
+
+    def test_retries_exhausted(self):
+        self._app.settings['failures'] = 3
+        self.s3_client.make_request('GET', 'bucket', override_num_retries=1, callback=self.stop)
+        response = self.wait()
+        self.assertEqual(503, response.status)
+        self.assertEqual(1, self._app.settings['failures'])
+
+    def test_retry_file_body(self):
+        self._app.settings['failures'] = 1
+        data = 'x' * 20000
+        self.s3_client.make_request('PUT', 'bucket', data=StringIO.StringIO(data),
+                                    headers={'Content-Length': str(len(data))},
+                                    callback=self.stop)
+        response = self.wait()
+        self.assertEqual(200, response.status)
+        self.assertEqual([data, data], self._app.settings['bodies'])
+
+    def test_no_retry_of_unseekable_body(self):
+        self._app.settings['failures'] = 1
+        data = 'x' * 20000
+        self.s3_client.make_request('PUT', 'bucket', data=UnseekableIO(data),
+                                    headers={'Content-Length': str(len(data))},
+                                    callback=self.stop)
+        response = self.wait()
+        self.assertEqual(503, response.status)
+        self.assertEqual([data], self._app.settings['bodies'])
+
+    def test_redirect(self):
+        self.s3_client.make_request('GET', 'old', callback=self.stop)
+        response = self.wait()
+        self.assertEqual(200, response.status)
+        self.assertTrue('<Name>new</Name>' in response.read())
+
+    def test_coalesce(self):
+        responses = []
+        def got(response):
+            responses.append(response)
+            if len(responses) == 5:
+                self.stop()
+        for i in range(3):
+            self.s3_client.make_request('GET', 'bucket', callback=got)
+        self.s3_client.make_request('GET', 'other', callback=got)
+        self.s3_client.make_request('GET', 'bucket', coalesce=False, callback=got)
+        self.wait()
+        self.assertEqual(['/bucket/', '/bucket/', '/other/'], sorted(self._app.settings['requests']))
+        self.assertEqual([200] * 5, [r.status for r in responses])
+        self.assertEqual(4, len([r for r in responses if '<Name>bucket</Name>' in r.read()]))
+
+    def test_coalesce_respects_retries(self):
+        self._app.settings['failures'] = 2
+        responses = {}
+        def got(retries):
+            def got_response(response):
+                responses[retries] = response.status
+                if len(responses) == 2:
+                    self.stop()
+            return got_response
+        self.s3_client.make_request('GET', 'bucket', override_num_retries=0, callback=got(0))
+        self.s3_client.make_request('GET', 'bucket', callback=got(None))
+        self.wait()
+        self.assertEqual({0: 503, None: 200}, responses)
+        self.assertEqual(['/bucket/'] * 3, self._app.settings['requests'])
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim:set ft=python sw=4 :
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import unittest
+
+from boto.resultset import ResultSet
+from boto.s3.acl import Policy
+
+from botornado.handler import *
+from botornado.s3.bucket import *
+from botornado.s3.key import *
+
+LIST_BUCKET = """<?xml version="1.0" encoding="UTF-8"?>
+<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">
+  <Name>bucket</Name><IsTruncated>true</IsTruncated><NextMarker>b&amp;c</NextMarker>
+  <Contents><Key>a&lt;b</Key><Size>10</Size><ETag>"x"</ETag>
+    <Owner><ID>owner</ID><DisplayName>me</DisplayName></Owner></Contents>
+  <Contents><Key>b&amp;c</Key><Size>0</Size><StorageClass>STANDARD</StorageClass></Contents>
+  <CommonPrefixes><Prefix>dir/</Prefix></CommonPrefixes>
+</ListBucketResult>"""
+
+ACL = """<AccessControlPolicy><Owner><ID>owner</ID></Owner><AccessControlList>
+  <Grant><Grantee xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:type="CanonicalUser">
+    <ID>owner</ID></Grantee><Permission>FULL_CONTROL</Permission></Grant>
+</AccessControlList></AccessControlPolicy>"""
+
+class ParserTestCase(unittest.TestCase):
+    def parse_with(self, parser, body, node):
+        set_parser(parser)
+        try:
+            parse(body, node, None)
+        finally:
+            set_parser('expat')
+        return node
+
+    def test_same_objects(self):
+        results = []
+        for parser in ('sax', 'expat'):
+            rs = self.parse_with(parser, LIST_BUCKET,
+                                 ResultSet([('Contents', AsyncKey), ('CommonPrefixes', Prefix)]))
+            results.append((rs.is_truncated, rs.next_marker,
+                            [(type(k), k.name, getattr(k, 'size', None), getattr(k, 'etag', None),
+                              getattr(k, 'owner', None) and k.owner.display_name) for k in rs]))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(u'a<b', results[1][2][0][1])
+        self.assertEqual(u'b&c', results[1][1])
+
+    def test_incremental(self):
+        for name in ('sax', 'expat'):
+            set_parser(name)
+            try:
+                rs = ResultSet([('Contents', AsyncKey), ('CommonPrefixes', Prefix)])
+                parser = incremental_parser(rs, None)
+                for i in range(0, len(LIST_BUCKET), 7):
+                    parser.feed(LIST_BUCKET[i:i+7])
+                parser.close()
+            finally:
+                set_parser('expat')
+            self.assertEqual([u'a<b', u'b&c', u'dir/'], [k.name for k in rs])
+            self.assertEqual(u'b&c', rs.next_marker)
+
+    def test_attributes(self):
+        policy = self.parse_with('expat', ACL, Policy())
+        self.assertEqual('CanonicalUser', policy.acl.grants[0].type)
+        self.assertEqual('FULL_CONTROL', policy.acl.grants[0].permission)
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim:set ft=python sw=4 :
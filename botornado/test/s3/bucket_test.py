@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+import re
+
+import tornado.gen
+import tornado.testing
+import tornado.web
+
+from boto.exception import BotoClientError
+
+from botornado.s3.bucket import *
+from botornado.s3.connection import *
+
+class ListHandler(tornado.web.RequestHandler):
+    keys = ['key%04d' % i for i in range(25)]
+    tree = sorted(['data/%s/%02d' % (d, i) for d in 'abcde' for i in range(12)] +
+                  ['data/a.txt', 'data/z'])
+    page_size = 10
+
+    def get(self):
+        self.settings['requests'].append(self.get_argument('marker', ''))
+        marker = self.get_argument('marker', '')
+        prefix = self.get_argument('prefix', '')
+        delimiter = self.get_argument('delimiter', '')
+        if self.request.path.strip('/') == 'broken':
+            # a truncated page with nothing to continue from
+            self.write('<ListBucketResult><Name>broken</Name><IsTruncated>true</IsTruncated>'
+                       '</ListBucketResult>')
+            return
+        if self.request.path.strip('/') == 'tree':
+            keys = self.tree
+        else:
+            keys = self.keys
+        entries = []
+        for k in keys:
+            if k <= marker or not k.startswith(prefix):
+                continue
+            i = delimiter and k.find(delimiter, len(prefix)) or -1
+            if i < 0:
+                entries.append(('key', k))
+            elif k[:i+1] > marker and (not entries or entries[-1] != ('prefix', k[:i+1])):
+                entries.append(('prefix', k[:i+1]))
+        page = entries[:self.page_size]
+        # like S3, all the keys of a page come before its CommonPrefixes
+        contents = ''
+        for kind, name in page:
+            if kind == 'key':
+                contents += '<Contents><Key>%s</Key><Size>1</Size></Contents>' % name
+        for kind, name in page:
+            if kind == 'prefix':
+                contents += '<CommonPrefixes><Prefix>%s</Prefix></CommonPrefixes>' % name
+        next_marker = page and '<NextMarker>%s</NextMarker>' % page[-1][1] or ''
+        self.write('<ListBucketResult><Name>bucket</Name><IsTruncated>%s</IsTruncated>%s%s'
+                   '</ListBucketResult>' % (len(entries) > len(page) and 'true' or 'false',
+                                            next_marker, contents))
+
+    def post(self):
+        # Multi-Object Delete
+        names = re.findall(r'<Key>(.*?)</Key>', self.request.body)
+        quiet = '<Quiet>true</Quiet>' in self.request.body
+        self.settings['deletes'].append(len(names))
+        result = ''
+        for name in names:
+            if name.startswith('locked'):
+                result += '<Error><Key>%s</Key><Code>AccessDenied</Code></Error>' % name
+            elif not quiet:
+                result += '<Deleted><Key>%s</Key></Deleted>' % name
+        self.write('<DeleteResult>%s</DeleteResult>' % result)
+
+class AsyncBucketListTestCase(tornado.testing.AsyncHTTPTestCase, tornado.testing.LogTrapTestCase):
+    def get_app(self):
+        self.requests = []
+        self.deletes = []
+        return tornado.web.Application([(r'.*', ListHandler)], requests=self.requests,
+                                       deletes=self.deletes)
+
+    def setUp(self):
+        super(AsyncBucketListTestCase, self).setUp()
+        self.s3_client = AsyncS3Connection(aws_access_key_id='public', aws_secret_access_key='secret',
+                                           host='127.0.0.1', port=self.get_http_port(),
+                                           is_secure=False, calling_format=OrdinaryCallingFormat(),
+                                           http_client=self.http_client)
+        self.bucket = AsyncBucket(connection=self.s3_client, name='bucket')
+
+    @tornado.testing.gen_test
+    def test_fetch_next(self):
+        rs = self.bucket.list()
+        names = []
+        while (yield rs.fetch_next):
+            key = rs.next_object()
+            names.append(key.name)
+            if len(names) == 1:
+                # the second page is requested while the first is consumed
+                yield tornado.gen.sleep(0.05)
+                self.assertEqual(2, len(self.requests))
+        self.assertEqual(ListHandler.keys, names)
+        self.assertEqual(['', 'key0009', 'key0019'], self.requests)
+
+    def test_each(self):
+        names = []
+        def got(key):
+            if key is None:
+                self.stop()
+            else:
+                names.append(key.name)
+        self.bucket.list(marker='key0004').each(got)
+        self.wait()
+        self.assertEqual(ListHandler.keys[5:], names)
+
+    @tornado.testing.gen_test
+    def test_truncated_page_without_marker(self):
+        bucket = AsyncBucket(connection=self.s3_client, name='broken')
+        with self.assertRaises(BotoClientError):
+            yield bucket.list().fetch_next
+        keys = []
+        with self.assertRaises(BotoClientError):
+            yield bucket.list().each(keys.append)
+        self.assertEqual([], keys)
+
+    @tornado.testing.gen_test
+    def test_list_incremental(self):
+        self.s3_client.incremental_parsing = True
+        bucket = AsyncBucket(connection=self.s3_client, name='tree')
+        rs = yield bucket.get_all_keys(prefix='data/', delimiter='/')
+        self.assertEqual(['data/a.txt', 'data/z', 'data/a/', 'data/b/', 'data/c/', 'data/d/',
+                          'data/e/'], [k.name for k in rs])
+        self.assertFalse(rs.is_truncated)
+
+    @tornado.testing.gen_test
+    def test_list_parallel_ordered(self):
+        bucket = AsyncBucket(connection=self.s3_client, name='tree')
+        rs = bucket.list_parallel(max_concurrency=3)
+        names = []
+        while (yield rs.fetch_next):
+            names.append(rs.next_object().name)
+        self.assertEqual(ListHandler.tree, names)
+
+    @tornado.testing.gen_test
+    def test_list_parallel_ordered_paged(self):
+        # the discovery listing spans several pages
+        ListHandler.page_size = 3
+        try:
+            for name, keys in (('tree', ListHandler.tree), ('bucket', ListHandler.keys)):
+                for ordered in (True, False):
+                    bucket = AsyncBucket(connection=self.s3_client, name=name)
+                    rs = bucket.list_parallel(max_concurrency=2, ordered=ordered)
+                    names = []
+                    while (yield rs.fetch_next):
+                        names.append(rs.next_object().name)
+                    self.assertEqual(keys, ordered and names or sorted(names))
+        finally:
+            ListHandler.page_size = 10
+
+    @tornado.testing.gen_test
+    def test_list_parallel_unordered(self):
+        bucket = AsyncBucket(connection=self.s3_client, name='tree')
+        rs = bucket.list_parallel(prefix='data/', ordered=False)
+        names = []
+        while (yield rs.fetch_next):
+            names.append(rs.next_object().name)
+        self.assertEqual(ListHandler.tree, sorted(names))
+        self.assertNotEqual(ListHandler.tree, names)
+
+    @tornado.testing.gen_test
+    def test_delete_keys(self):
+        keys = ['key%04d' % i for i in range(2500)] + ['locked', Prefix(name='dir/')]
+        result = yield self.bucket.delete_keys(keys, quiet=False, max_concurrency=2)
+        self.assertEqual([1000, 1000, 501], sorted(self.deletes, reverse=True))
+        self.assertEqual(2500, len(result.deleted))
+        self.assertEqual(['locked', 'dir/'], sorted([e.key for e in result.errors], reverse=True))
+
+    @tornado.testing.gen_test
+    def test_delete_keys_from_listing(self):
+        result = yield self.bucket.delete_keys(self.bucket.list())
+        self.assertEqual([25], self.deletes)
+        self.assertEqual([], result.deleted)
+        self.assertEqual([], result.errors)
+
+if __name__ == '__main__':
+    tornado.testing.main()
+
+# vim:set ft=python sw=4 :
@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
+
+import StringIO
+
+import tornado.concurrent
+import tornado.gen
+import tornado.testing
+import tornado.web
+
+from boto.exception import S3ResponseError
+
+from botornado.s3.bucket import *
+from botornado.s3.connection import *
+from botornado.s3.key import *
+
+class KeyHandler(tornado.web.RequestHandler):
+    body = 'y' * (1024 * 1024 + 1)
+
+    @tornado.gen.coroutine
+    def get(self):
+        etag = '"%s"' % md5(self.body).hexdigest()
+        self.settings['gets'].append(self.request.headers.get('If-None-Match'))
+        if self.request.headers.get('If-None-Match') == etag:
+            self.set_status(304)
+            return
+        self.set_header('ETag', etag)
+        body = self.body
+        if self.request.headers.get('Range'):
+            if self.request.headers.get('If-Match', etag) != etag:
+                self.send_error(412)
+                return
+            start, end = self.request.headers['Range'].split('=')[1].split('-')
+            if int(start) in self.settings['failing_ranges']:
+                self.send_error(403)
+                return
+            body = body[int(start):int(end)+1]
+            self.set_status(206)
+            self.set_header('Content-Range', 'bytes %s-%s/%d' % (start, end, len(self.body)))
+        for i in range(0, len(body), 65536):
+            self.write(body[i:i+65536])
+            self.flush()
+            if self.settings['chunk_delay']:
+                yield tornado.gen.sleep(self.settings['chunk_delay'])
+        self.finish()
+
+    def head(self):
+        etag = '"%s"' % md5(self.body).hexdigest()
+        self.settings['heads'].append(self.request.headers.get('If-None-Match'))
+        if self.request.headers.get('If-None-Match') == etag:
+            self.set_status(304)
+            self.finish()
+            return
+        self.set_header('ETag', etag)
+        self.set_header('Content-Length', str(len(self.body)))
+        self.finish()
+
+    def delete(self):
+        self.send_error(403)
+
+    def put(self):
+        self.settings['puts'].append(self.request.headers.get('Content-MD5'))
+        self.set_header('ETag', '"%s"' % md5(self.request.body).hexdigest())
+        self.finish()
+
+class CountingIO(StringIO.StringIO):
+    def read(self, n=-1):
+        data = StringIO.StringIO.read(self, n)
+        self.bytes_read = getattr(self, 'bytes_read', 0) + len(data)
+        return data
+
+    def tell(self):
+        self.tells = getattr(self, 'tells', 0) + 1
+        return StringIO.StringIO.tell(self)
+
+class ProducerlessClient(object):
+    # an HTTP client that ignores body producers, as curl_httpclient does
+    def __init__(self, client):
+        self.client = client
+        self.bodies = []
+
+    def fetch(self, request, callback):
+        self.bodies.append(request.body)
+        request.body_producer = None
+        self.client.fetch(request, callback=callback)
+
+class SmallPartKey(AsyncKey):
+    MinimumPartSize = 1000
+
+class MultiPartHandler(tornado.web.RequestHandler):
+    def post(self):
+        uploads = self.settings['uploads']
+        if 'uploads' in self.request.query.split('&'):
+            uploads['parts'] = {}
+            self.write('<InitiateMultipartUploadResult>'
+                       '<Bucket>multipart</Bucket><Key>key</Key><UploadId>upload</UploadId>'
+                       '</InitiateMultipartUploadResult>')
+        else:
+            parts = uploads['parts']
+            uploads['body'] = ''.join([parts[n] for n in sorted(parts)])
+            uploads['completed'] = self.request.body
+            self.write('<CompleteMultipartUploadResult>'
+                       '<Bucket>multipart</Bucket><Key>key</Key><ETag>"%s-%d"</ETag>'
+                       '</CompleteMultipartUploadResult>' % (md5(uploads['body']).hexdigest(), len(parts)))
+
+    def put(self):
+        uploads = self.settings['uploads']
+        part_num = int(self.get_argument('partNumber'))
+        if part_num in uploads.get('failing', ()):
+            self.send_error(400)
+            return
+        uploads['parts'][part_num] = self.request.body
+        self.set_header('ETag', '"%s"' % md5(self.request.body).hexdigest())
+        self.finish()
+
+    def delete(self):
+        self.settings['uploads']['cancelled'] = True
+        self.set_status(204)
+        self.finish()
+
+class AsyncKeyTestCase(tornado.testing.AsyncHTTPTestCase, tornado.testing.LogTrapTestCase):
+    def get_app(self):
+        self.uploads = {}
+        return tornado.web.Application([(r'/multipart/.*', MultiPartHandler),
+                                        (r'.*', KeyHandler)], uploads=self.uploads,
+                                       heads=[], gets=[], puts=[],
+                                       failing_ranges=set(), chunk_delay=0)
+
+    def setUp(self):
+        super(AsyncKeyTestCase, self).setUp()
+        self.s3_client = AsyncS3Connection(aws_access_key_id='public', aws_secret_access_key='secret',
+                                           host='127.0.0.1', port=self.get_http_port(),
+                                           is_secure=False, calling_format=OrdinaryCallingFormat(),
+                                           http_client=self.http_client)
+        self.bucket = AsyncBucket(connection=self.s3_client, name='bucket')
+
+    def test_set_contents_from_string(self):
+        key = AsyncKey(bucket=self.bucket, name='key')
+        progress = []
+        def cb(transmitted, size):
+            progress.append(transmitted)
+        data = 'x' * (key.BufferSize * 10 + 1)
+        key.set_contents_from_string(data, cb=cb, num_cb=-1, callback=self.stop)
+        self.wait()
+        self.assertEqual(md5(data).hexdigest(), key.md5)
+        self.assertEqual('"%s"' % key.md5, key.etag)
+        self.assertEqual(len(data), progress[-1])
+        self.assertTrue(12 < len(progress))
+
+    @tornado.testing.gen_test
+    def test_set_contents_with_executor(self):
+        s3_client = AsyncS3Connection(aws_access_key_id='public', aws_secret_access_key='secret',
+                                      host='127.0.0.1', port=self.get_http_port(),
+                                      is_secure=False, calling_format=OrdinaryCallingFormat(),
+                                      http_client=self.http_client,
+                                      executor=tornado.concurrent.dummy_executor)
+        key = AsyncKey(bucket=AsyncBucket(connection=s3_client, name='bucket'), name='key')
+        progress = []
+        def cb(transmitted, size):
+            progress.append(transmitted)
+        data = 'x' * (key.ExecutorBufferSize * 2 + 1)
+        yield key.set_contents_from_string(data, cb=cb, num_cb=-1)
+        self.assertEqual(md5(data).hexdigest(), key.md5)
+        self.assertEqual('"%s"' % key.md5, key.etag)
+        self.assertEqual([0, key.ExecutorBufferSize, key.ExecutorBufferSize * 2, len(data), len(data)],
+                         progress)
+
+    @tornado.testing.gen_test
+    def test_set_contents_without_body_producer(self):
+        http_client = ProducerlessClient(self.http_client)
+        s3_client = AsyncS3Connection(aws_access_key_id='public', aws_secret_access_key='secret',
+                                      host='127.0.0.1', port=self.get_http_port(),
+                                      is_secure=False, calling_format=OrdinaryCallingFormat(),
+                                      http_client=http_client)
+        key = AsyncKey(bucket=AsyncBucket(connection=s3_client, name='bucket'), name='key')
+        data = 'x' * (key.BufferSize * 10 + 1)
+        yield key.set_contents_from_string(data)
+        self.assertEqual([data], http_client.bodies)
+        self.assertEqual('"%s"' % md5(data).hexdigest(), key.etag)
+
+    @tornado.testing.gen_test
+    def test_set_contents_single_pass(self):
+        key = AsyncKey(bucket=self.bucket, name='key')
+        data = 'x' * (key.BufferSize * 10 + 1)
+        fp = CountingIO(data)
+        yield key.set_contents_from_file(fp, single_pass=True)
+        self.assertEqual(len(data), fp.bytes_read)
+        self.assertEqual(md5(data).hexdigest(), key.md5)
+        self.assertEqual('"%s"' % key.md5, key.etag)
+        self.assertEqual([None], self._app.settings['puts'])
+
+    def test_get_contents_as_string(self):
+        key = AsyncKey(bucket=self.bucket, name='key')
+        progress = []
+        def cb(received, size):
+            progress.append((received, size))
+        key.get_contents_as_string(cb=cb, num_cb=5, callback=self.stop)
+        data = self.wait()
+        self.assertEqual(KeyHandler.body, data)
+        self.assertEqual(len(data), key.size)
+        self.assertEqual('"%s"' % key.md5, key.etag)
+        self.assertEqual((len(data), len(data)), progress[-1])
+        self.assertTrue(2 < len(progress))
+
+    @tornado.testing.gen_test
+    def test_get_key_future(self):
+        key = yield self.bucket.get_key('key')
+        self.assertEqual('key', key.name)
+        self.assertEqual(len(KeyHandler.body), key.size)
+
+    @tornado.testing.gen_test
+    def test_get_key_cached(self):
+        s3_client = AsyncS3Connection(aws_access_key_id='public', aws_secret_access_key='secret',
+                                      host='127.0.0.1', port=self.get_http_port(),
+                                      is_secure=False, calling_format=OrdinaryCallingFormat(),
+                                      http_client=self.http_client, metadata_cache_ttl=0.05)
+        bucket = AsyncBucket(connection=s3_client, name='bucket')
+        heads = self._app.settings['heads']
+        keys = yield [bucket.get_key('key') for i in range(3)]
+        key = yield bucket.get_key('key')
+        self.assertEqual([None], heads)
+        self.assertTrue(all(k.etag == key.etag for k in keys))
+        self.assertFalse(key is keys[0])
+        yield tornado.gen.sleep(0.06)
+        key = yield bucket.get_key('key')
+        etag = key.etag
+        self.assertEqual([None, etag], heads)
+        self.assertEqual(len(KeyHandler.body), key.size)
+        yield key.set_contents_from_string('z')
+        yield bucket.get_key('key')
+        self.assertEqual([None, etag, None], heads)
+
+    @tornado.testing.gen_test
+    def test_get_contents_cached(self):
+        s3_client = AsyncS3Connection(aws_access_key_id='public', aws_secret_access_key='secret',
+                                      host='127.0.0.1', port=self.get_http_port(),
+                                      is_secure=False, calling_format=OrdinaryCallingFormat(),
+                                      http_client=self.http_client,
+                                      content_cache_size=4 * 1024 * 1024,
+                                      content_cache_max_object_size=2 * 1024 * 1024)
+        key = AsyncKey(bucket=AsyncBucket(connection=s3_client, name='bucket'), name='key')
+        gets = self._app.settings['gets']
+        self.assertEqual(KeyHandler.body, (yield key.get_contents_as_string()))
+        etag = key.etag
+        self.assertEqual(KeyHandler.body, (yield key.get_contents_as_string()))
+        self.assertEqual([None, etag], gets)
+        self.assertEqual(len(KeyHandler.body), s3_client.content_cache.weight)
+        yield key.set_contents_from_string('z')
+        self.assertEqual(0, s3_client.content_cache.weight)
+        self.assertEqual(KeyHandler.body, (yield key.get_contents_as_string()))
+        self.assertEqual([None, etag, None], gets)
+        # a write that completes while the object is being read
+        s3_client.content_cache.clear()
+        future = key.get_contents_as_string()
+        key.bucket._invalidate_caches('key')
+        self.assertEqual(KeyHandler.body, (yield future))
+        self.assertEqual(0, s3_client.content_cache.weight)
+        # a request that cannot even be sent
+        def make_request(*args, **kwargs):
+            raise BotoClientError('broken')
+        s3_client.make_request = make_request
+        with self.assertRaises(BotoClientError):
+            yield key.get_contents_as_string()
+        self.assertEqual({}, s3_client.content_cache._fills)
+
+    @tornado.testing.gen_test
+    def test_error_on_future(self):
+        with self.assertRaises(S3ResponseError):
+            yield self.bucket.delete_key('key')
+
+    def test_get_contents_to_file_ranged(self):
+        key = AsyncKey(bucket=self.bucket, name='key')
+        progress = []
+        def cb(received, size):
+            progress.append(received)
+        fp = StringIO.StringIO()
+        key.get_contents_to_file(fp, cb=cb, num_cb=10, range_size=100000,
+                                 max_concurrency=4, callback=self.stop)
+        response = self.wait()
+        self.assertEqual(206, response.status)
+        self.assertEqual(KeyHandler.body, fp.getvalue())
+        self.assertEqual(len(KeyHandler.body), key.size)
+        self.assertEqual(len(KeyHandler.body), progress[-1])
+        self.assertTrue(progress == sorted(progress) and len(progress) <= 12)
+
+    @tornado.testing.gen_test
+    def test_ranged_get_fails_on_changed_object(self):
+        key = AsyncKey(bucket=self.bucket, name='key')
+        key.size = len(KeyHandler.body)
+        key.etag = '"stale"'
+        with self.assertRaises(S3ResponseError):
+            yield key.get_file(StringIO.StringIO(), range_size=100000)
+
+    @tornado.testing.gen_test
+    def test_ranged_get_stops_writing_on_error(self):
+        key = AsyncKey(bucket=self.bucket, name='key')
+        key.size = len(KeyHandler.body)
+        self._app.settings['failing_ranges'].add(0)
+        self._app.settings['chunk_delay'] = 0.01
+        fp = StringIO.StringIO()
+        with self.assertRaises(S3ResponseError):
+            yield key.get_file(fp, range_size=200000)
+        written = fp.getvalue()
+        # let the other ranges in flight run to their end
+        yield tornado.gen.sleep(0.1)
+        self.assertEqual(written, fp.getvalue())
+
+    def test_set_contents_from_file_multipart(self):
+        bucket = AsyncBucket(connection=self.s3_client, name='multipart')
+        key = SmallPartKey(bucket=bucket, name='key')
+        progress = []
+        def cb(transmitted, size):
+            progress.append(transmitted)
+        data = ''.join([chr(ord('a') + i % 26) * 1000 for i in range(100)])
+        key.set_contents_from_file(StringIO.StringIO(data), cb=cb, num_cb=10,
+                                   multipart_threshold=1000, part_size=7000,
+                                   max_concurrency=3, callback=self.stop)
+        completed = self.wait()
+        self.assertEqual(15, len(self.uploads['parts']))
+        self.assertEqual(data, self.uploads['body'])
+        self.assertEqual('"%s-15"' % md5(data).hexdigest(), key.etag)
+        self.assertEqual(key.etag, completed.etag)
+        self.assertEqual(len(data), progress[-1])
+        self.assertTrue(progress == sorted(progress) and len(progress) <= 11)
+
+    @tornado.testing.gen_test
+    def test_multipart_with_executor(self):
+        s3_client = AsyncS3Connection(aws_access_key_id='public', aws_secret_access_key='secret',
+                                      host='127.0.0.1', port=self.get_http_port(),
+                                      is_secure=False, calling_format=OrdinaryCallingFormat(),
+                                      http_client=self.http_client,
+                                      executor=tornado.concurrent.dummy_executor)
+        key = SmallPartKey(bucket=AsyncBucket(connection=s3_client, name='multipart'), name='key')
+        data = ''.join([chr(ord('a') + i % 26) * 1000 for i in range(20)])
+        fp = CountingIO(data)
+        yield key.set_contents_from_file(fp, multipart_threshold=1000, part_size=3000,
+                                         max_concurrency=3)
+        self.assertEqual(data, self.uploads['body'])
+        # the offsets of the parts are not taken from the shared fp
+        self.assertEqual(1, fp.tells)
+
+    @tornado.testing.gen_test
+    def test_multipart_cancelled_on_error(self):
+        bucket = AsyncBucket(connection=self.s3_client, name='multipart')
+        key = SmallPartKey(bucket=bucket, name='key')
+        self.uploads['failing'] = (3,)
+        with self.assertRaises(S3ResponseError):
+            yield key.set_contents_from_file(StringIO.StringIO('z' * 10000),
+                                             multipart_threshold=1000, part_size=1000)
+        self.assertTrue(self.uploads['cancelled'])
+
+    def test_multipart_part_size_limits(self):
+        bucket = AsyncBucket(connection=self.s3_client, name='multipart')
+        key = AsyncKey(bucket=bucket, name='key')
+        data = StringIO.StringIO('z' * 10000)
+        self.assertRaises(BotoClientError, key.set_contents_from_file, data,
+                          multipart_threshold=1000, part_size=1000)
+        key = SmallPartKey(bucket=bucket, name='key')
+        key.MaximumParts = 9
+        self.assertRaises(BotoClientError, key.set_contents_from_file, data,
+                          multipart_threshold=1000, part_size=1000)
+        self.assertFalse(self.uploads)
+
+if __name__ == '__main__':
+    tornado.testing.main()
+
+# vim:set ft=python sw=4 :
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+import tornado.gen
+import tornado.testing
+import tornado.web
+
+import boto.regioninfo
+from botornado.sqs.connection import *
+from botornado.sqs.message import *
+from botornado.sqs.queue import *
+
+class SQSHandler(tornado.web.RequestHandler):
+    @tornado.gen.coroutine
+    def get(self):
+        action = self.get_argument('Action')
+        self.settings['requests'].append(action)
+        if action == 'ListQueues':
+            yield tornado.gen.sleep(0.01)
+            prefix = self.get_argument('QueueNamePrefix', '')
+            urls = ''.join('<QueueUrl>http://%s/123/%s</QueueUrl>' % (self.request.host, name)
+                           for name in ['other', 'queue'] if name.startswith(prefix))
+            self.write('<ListQueuesResponse><ListQueuesResult>%s</ListQueuesResult>'
+                       '</ListQueuesResponse>' % urls)
+        else:
+            self.write('<%sResponse></%sResponse>' % (action, action))
+
+    def post(self):
+        action = self.get_argument('Action')
+        self.settings['requests'].append(action)
+        entries = []
+        i = 1
+        while self.get_argument('%sRequestEntry.%d.Id' % (action, i), None) is not None:
+            entries.append((self.get_argument('%sRequestEntry.%d.Id' % (action, i)),
+                            self.get_argument('%sRequestEntry.%d.MessageBody' % (action, i), None)))
+            i += 1
+        self.settings['entries'].append(len(entries))
+        body = ''
+        for entry_id, message_body in entries:
+            if message_body == 'lost':
+                continue
+            elif entry_id == 'bad' or message_body == 'bad':
+                body += ('<BatchResultErrorEntry><Id>%s</Id><SenderFault>true</SenderFault>'
+                         '<Code>InvalidParameterValue</Code><Message>bad</Message>'
+                         '</BatchResultErrorEntry>' % entry_id)
+            elif action == 'SendMessageBatch':
+                body += ('<SendMessageBatchResultEntry><Id>%s</Id><MessageId>m-%s</MessageId>'
+                         '<MD5OfMessageBody>0</MD5OfMessageBody></SendMessageBatchResultEntry>'
+                         % (entry_id, entry_id))
+            else:
+                body += '<%sResultEntry><Id>%s</Id></%sResultEntry>' % (action, entry_id, action)
+        self.write('<%sResponse><%sResult>%s</%sResult></%sResponse>'
+                   % (action, action, body, action, action))
+
+class AsyncSQSConnectionTestCase(tornado.testing.AsyncHTTPTestCase, tornado.testing.LogTrapTestCase):
+    def get_app(self):
+        self.requests = []
+        self.entries = []
+        return tornado.web.Application([(r'.*', SQSHandler)], requests=self.requests,
+                                       entries=self.entries)
+
+    def setUp(self):
+        super(AsyncSQSConnectionTestCase, self).setUp()
+        region = boto.regioninfo.RegionInfo(name='local', endpoint='127.0.0.1')
+        self.sqs_client = AsyncSQSConnection(region=region, aws_access_key_id='public',
+                                             aws_secret_access_key='secret',
+                                             port=self.get_http_port(), is_secure=False,
+                                             http_client=self.http_client)
+        self.queue = AsyncQueue(self.sqs_client, 'http://127.0.0.1:%d/123/queue' % self.get_http_port())
+
+    @tornado.testing.gen_test
+    def test_write_batch(self):
+        rs = yield self.queue.write_batch([('a', 'body a', 0), ('bad', 'body b', 0), ('c', 'body c', 0)])
+        self.assertEqual(['SendMessageBatch'], self.requests)
+        self.assertEqual(['a', 'c'], [r['id'] for r in rs.results])
+        self.assertEqual('m-a', rs.results[0]['message_id'])
+        self.assertEqual(['bad'], [e['id'] for e in rs.errors])
+        self.assertEqual('InvalidParameterValue', rs.errors[0]['error_code'])
+
+    @tornado.testing.gen_test
+    def test_delete_and_change_visibility_batch(self):
+        messages = []
+        for i in range(3):
+            m = AsyncMessage(self.queue)
+            m.receipt_handle = 'handle-%d' % i
+            messages.append(m)
+        rs = yield self.queue.delete_message_batch(messages)
+        self.assertEqual(['0', '1', '2'], [r['id'] for r in rs.results])
+        rs = yield self.queue.change_message_visibility_batch([(m, 30) for m in messages])
+        self.assertEqual(['0', '1', '2'], [r['id'] for r in rs.results])
+        self.assertEqual(['DeleteMessageBatch', 'ChangeMessageVisibilityBatch'], self.requests)
+
+    @tornado.testing.gen_test
+    def test_write_with_linger(self):
+        self.queue.write_linger = 0.01
+        messages = [AsyncRawMessage(self.queue, body='message %d' % i) for i in range(23)]
+        messages[12].set_body('bad')
+        # left out of the response
+        messages[15].set_body('lost')
+        futures = [self.queue.write(m) for m in messages]
+        for i, future in enumerate(futures):
+            if i in (12, 15):
+                with self.assertRaises(SQSError):
+                    yield future
+            else:
+                message = yield future
+                self.assertTrue(message.id.startswith('m-'))
+        self.assertEqual(['SendMessageBatch'] * 3, self.requests)
+        self.assertEqual([10, 10, 3], self.entries)
+
+    @tornado.testing.gen_test
+    def test_get_queue_cached(self):
+        sqs_client = AsyncSQSConnection(region=self.sqs_client.region, aws_access_key_id='public',
+                                        aws_secret_access_key='secret',
+                                        port=self.get_http_port(), is_secure=False,
+                                        http_client=self.http_client, queue_cache_ttl=60)
+        queues = yield [sqs_client.get_queue('queue') for i in range(5)]
+        self.assertEqual(['ListQueues'], self.requests)
+        self.assertTrue(all(q is queues[0] for q in queues))
+        self.assertEqual('queue', queues[0].name)
+        queue = yield sqs_client.get_queue('queue')
+        self.assertTrue(queue is queues[0])
+        self.assertEqual(None, (yield sqs_client.get_queue('missing')))
+        self.assertEqual(['ListQueues', 'ListQueues'], self.requests)
+        yield sqs_client.delete_queue(queue)
+        queue = yield sqs_client.get_queue('queue')
+        self.assertFalse(queue is queues[0])
+        self.assertEqual(['ListQueues', 'ListQueues', 'DeleteQueue', 'ListQueues'], self.requests)
+
+if __name__ == '__main__':
+    tornado.testing.main()
+
+# vim:set ft=python sw=4 :
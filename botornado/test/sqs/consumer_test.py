@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+
+import tornado.gen
+import tornado.testing
+import tornado.web
+
+import boto.regioninfo
+from botornado.sqs.connection import *
+from botornado.sqs.consumer import *
+from botornado.sqs.lease import *
+from botornado.sqs.message import *
+from botornado.sqs.queue import *
+from botornado.test.sqs.connection_test import SQSHandler
+
+class ConsumerHandler(SQSHandler):
+    @tornado.gen.coroutine
+    def get(self):
+        if self.get_argument('Action') == 'GetQueueAttributes':
+            self.settings['requests'].append('GetQueueAttributes')
+            self.write('<GetQueueAttributesResponse><GetQueueAttributesResult><Attribute>'
+                       '<Name>VisibilityTimeout</Name><Value>2</Value></Attribute>'
+                       '</GetQueueAttributesResult></GetQueueAttributesResponse>')
+            return
+        # ReceiveMessage
+        self.settings['requests'].append(self.get_argument('Action'))
+        self.settings['waits'].append(self.get_argument('WaitTimeSeconds', None))
+        messages = self.settings['messages']
+        if not messages:
+            yield tornado.gen.sleep(0.02)
+        n = int(self.get_argument('MaxNumberOfMessages'))
+        received, messages[:n] = messages[:n], []
+        body = ''
+        for m in received:
+            body += ('<Message><MessageId>%s</MessageId><ReceiptHandle>handle-%s</ReceiptHandle>'
+                     '<MD5OfBody>0</MD5OfBody><Body>%s</Body></Message>' % (m, m, m))
+        self.write('<ReceiveMessageResponse><ReceiveMessageResult>%s</ReceiveMessageResult>'
+                   '</ReceiveMessageResponse>' % body)
+
+    def post(self):
+        if self.get_argument('Action') == 'DeleteMessageBatch':
+            i = 1
+            while self.get_argument('DeleteMessageBatchRequestEntry.%d.Id' % i, None):
+                handle = self.get_argument('DeleteMessageBatchRequestEntry.%d.ReceiptHandle' % i)
+                if handle in self.settings['failing']:
+                    self.send_error(400)
+                    return
+                self.settings['deleted'].append(handle)
+                i += 1
+        SQSHandler.post(self)
+
+class AsyncQueueConsumerTestCase(tornado.testing.AsyncHTTPTestCase, tornado.testing.LogTrapTestCase):
+    def get_app(self):
+        self.requests = []
+        self.messages = ['%02d' % i for i in range(25)]
+        self.deleted = []
+        self.waits = []
+        self.failing = set()
+        return tornado.web.Application([(r'.*', ConsumerHandler)], requests=self.requests,
+                                       entries=[], messages=self.messages,
+                                       deleted=self.deleted, waits=self.waits,
+                                       failing=self.failing)
+
+    def setUp(self):
+        super(AsyncQueueConsumerTestCase, self).setUp()
+        region = boto.regioninfo.RegionInfo(name='local', endpoint='127.0.0.1')
+        self.sqs_client = AsyncSQSConnection(region=region, aws_access_key_id='public',
+                                             aws_secret_access_key='secret',
+                                             port=self.get_http_port(), is_secure=False,
+                                             http_client=self.http_client)
+        self.queue = AsyncQueue(self.sqs_client, 'http://127.0.0.1:%d/123/queue' % self.get_http_port(),
+                                message_class=AsyncRawMessage)
+
+    @tornado.testing.gen_test
+    def test_consume(self):
+        state = {'running': 0, 'max_running': 0}
+        handled = []
+        @tornado.gen.coroutine
+        def handler(message):
+            state['running'] += 1
+            state['max_running'] = max(state['max_running'], state['running'])
+            yield tornado.gen.sleep(0.001)
+            state['running'] -= 1
+            if message.get_body() == '13':
+                raise ValueError('cannot handle 13')
+            handled.append(message.get_body())
+        consumer = AsyncQueueConsumer(self.queue, handler, receivers=3, max_in_flight=4,
+                                      wait_time_seconds=1)
+        consumer.start()
+        while consumer.handled + consumer.failed < 25:
+            yield tornado.gen.sleep(0.01)
+        yield consumer.stop()
+        self.assertEqual(4, state['max_running'])
+        self.assertEqual(24, consumer.handled)
+        self.assertEqual(1, consumer.failed)
+        self.assertEqual(sorted(['handle-%s' % m for m in handled]), sorted(self.deleted))
+        self.assertTrue('handle-13' not in self.deleted)
+        self.assertTrue(self.requests.count('DeleteMessageBatch') < 24)
+        self.assertEqual(set(['1']), set(self.waits))
+
+    @tornado.testing.gen_test
+    def test_consume_with_leases(self):
+        del self.messages[1:]
+        leases = AsyncLeaseManager(self.queue, visibility_timeout=0.1, interval=0.02)
+        @tornado.gen.coroutine
+        def handler(message):
+            self.assertTrue(message in leases)
+            yield tornado.gen.sleep(0.2)
+        consumer = AsyncQueueConsumer(self.queue, handler, receivers=1,
+                                      wait_time_seconds=1, lease_manager=leases)
+        consumer.start()
+        while consumer.handled < 1:
+            yield tornado.gen.sleep(0.01)
+        yield consumer.stop()
+        self.assertEqual(0, len(leases))
+        self.assertTrue(leases.extended >= 2)
+        self.assertEqual(leases.extended, self.requests.count('ChangeMessageVisibilityBatch'))
+        self.assertEqual(['handle-00'], self.deleted)
+
+    @tornado.testing.gen_test
+    def test_lease_manager(self):
+        leases = AsyncLeaseManager(self.queue)
+        leases.stop()
+        message = AsyncRawMessage(self.queue)
+        message.receipt_handle = 'handle-00'
+        leases.add(message)
+        leases.start()
+        while leases.visibility_timeout is None:
+            yield tornado.gen.sleep(0.01)
+        # the VisibilityTimeout of the queue, not a default
+        self.assertEqual(2, leases.visibility_timeout)
+        self.assertEqual(1, leases.interval)
+        leases.extend()
+        leases.extend()
+        while leases.extended < 1:
+            yield tornado.gen.sleep(0.01)
+        self.assertEqual(1, self.requests.count('ChangeMessageVisibilityBatch'))
+        leases.stop()
+        leases.stop()
+
+    @tornado.testing.gen_test
+    def test_read(self):
+        message = yield self.queue.read()
+        self.assertTrue(isinstance(message, AsyncRawMessage))
+        self.assertEqual('00', message.get_body())
+
+    @tornado.testing.gen_test
+    def test_read_light_messages(self):
+        self.queue.set_message_class(AsyncLightRawMessage)
+        rs = yield self.queue.get_messages(10)
+        self.assertEqual(10, len(rs))
+        self.assertTrue(isinstance(rs[3], AsyncLightRawMessage))
+        self.assertFalse(hasattr(rs[3], '__dict__'))
+        self.assertEqual(('03', 'handle-03', '0', '03'),
+                         (rs[3].id, rs[3].receipt_handle, rs[3].md5, rs[3].get_body()))
+        rs = yield self.queue.delete_message_batch(rs)
+        self.assertEqual(10, len(rs.results))
+
+    @tornado.testing.gen_test
+    def test_save_and_load(self):
+        fd, file_name = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            n = yield self.queue.save_to_filename(file_name, sep='\n\n', receivers=3)
+            self.assertEqual(25, n)
+            self.assertEqual(['handle-%02d' % i for i in range(25)], sorted(self.deleted))
+            self.assertEqual(3, self.requests.count('DeleteMessageBatch'))
+            n = yield self.queue.clear()
+            self.assertEqual(0, n)
+            del self.requests[:]
+            n = yield self.queue.load_from_filename(file_name)
+            self.assertEqual(25, n)
+            self.assertEqual(['SendMessageBatch'] * 3, self.requests)
+        finally:
+            os.remove(file_name)
+
+    @tornado.testing.gen_test
+    def test_clear_stops_on_failed_delete(self):
+        self.failing.add('handle-00')
+        with self.assertRaises(SQSError):
+            yield self.queue.clear(page_size=1, receivers=2)
+        # the other receiver stopped too instead of reading the whole queue
+        self.assertTrue(self.messages)
+        self.assertFalse('handle-00' in self.deleted)
+
+if __name__ == '__main__':
+    tornado.testing.main()
+
+# vim:set ft=python sw=4 :
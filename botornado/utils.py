@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+import collections
+import time
+import tornado.concurrent
+import tornado.ioloop
+
+from boto.utils import *
+
+class AsyncLRUCache(object):
+    """
+    A cache that keeps at most capacity items, evicting the least
+    recently used one when full, and forgets an item ttl seconds after
+    it has been set.  Unlike :class:`boto.utils.LRUCache` it can fetch
+    the missing items itself:
+
+        cache = AsyncLRUCache(1024, ttl=60)
+        queue = yield cache.fetch(name, lambda: connection.get_queue(name))
+
+    Concurrent fetches of the same key share one call of the fetcher.  A
+    result of None is not cached.  Expired items are kept until they are
+    evicted, so that they can be revalidated (see get_stale).
+
+    If weigher is given, capacity bounds the sum of weigher(value) over
+    the cached values instead of their number, e.g. len to bound the
+    bytes of cached strings.
+
+    Values fetched without fetch are cached with begin_fill and set, so
+    that a value fetched before an invalidation is not cached after it:
+
+        generation = cache.begin_fill(key)
+        ...
+        cache.set(key, value, generation=generation)
+    """
+
+    def __init__(self, capacity=1024, ttl=None, weigher=None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.weigher = weigher
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = collections.OrderedDict()
+        self._pending = {}
+        # key -> [generation, fills in flight]
+        self._fills = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return self.get(key, touch=False) is not None
+
+    def get(self, key, default=None, touch=True):
+        """
+        Return the value cached for key, or default if it is missing or
+        has expired.
+        """
+        entry = self._items.get(key)
+        if entry is None:
+            return default
+        value, expires, weight = entry
+        if expires is not None and expires <= time.time():
+            return default
+        if touch:
+            del self._items[key]
+            self._items[key] = entry
+        return value
+
+    def get_stale(self, key, default=None):
+        """
+        Return the value cached for key even if it has expired.
+        """
+        entry = self._items.get(key)
+        if entry is None:
+            return default
+        return entry[0]
+
+    def set(self, key, value, ttl=None, generation=None):
+        """
+        Cache value for key.  If generation is given, the fill of key
+        that begin_fill returned it for ends, and value is not cached if
+        key has been invalidated since.
+        """
+        if generation is not None:
+            fill = self._fills.get(key)
+            self.end_fill(key)
+            if fill is None or fill[0] != generation:
+                return
+        ttl = ttl if ttl is not None else self.ttl
+        weight = self.weigher(value) if self.weigher is not None else 1
+        self._remove(key)
+        if weight > self.capacity:
+            return
+        self._items[key] = (value, time.time() + ttl if ttl is not None else None, weight)
+        self.weight += weight
+        while self.weight > self.capacity:
+            key, entry = self._items.popitem(last=False)
+            self.weight -= entry[2]
+
+    def _remove(self, key):
+        entry = self._items.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[2]
+
+    def begin_fill(self, key):
+        """
+        Return the generation of key for a fill of key that starts now,
+        to be passed to set, or to end_fill if the fill fails.
+        """
+        fill = self._fills.setdefault(key, [0, 0])
+        fill[1] += 1
+        return fill[0]
+
+    def end_fill(self, key):
+        """
+        End a fill of key that begin_fill has been called for without
+        caching anything.
+        """
+        fill = self._fills.get(key)
+        if fill is not None:
+            fill[1] -= 1
+            if fill[1] <= 0:
+                del self._fills[key]
+
+    def invalidate(self, key):
+        """
+        Forget key.  The result of a fetch or a fill of key that is in
+        flight is not cached either.
+        """
+        self._remove(key)
+        self._pending.pop(key, None)
+        fill = self._fills.get(key)
+        if fill is not None:
+            fill[0] += 1
+
+    def clear(self):
+        self._items.clear()
+        self._pending.clear()
+        for fill in self._fills.itervalues():
+            fill[0] += 1
+        self.weight = 0
+
+    def fetch(self, key, fetcher):
+        """
+        Return a Future of the value cached for key.  If there is none,
+        fetcher is called to return a Future of the value, unless a fetch
+        of key is already in flight, whose Future is returned instead.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            future = tornado.concurrent.Future()
+            future.set_result(value)
+            return future
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.hits += 1
+            return pending
+        self.misses += 1
+        future = fetcher()
+        self._pending[key] = future
+        def fetched(future):
+            if self._pending.get(key) is not future:
+                # invalidated while in flight
+                return
+            del self._pending[key]
+            if future.exception() is None and future.result() is not None:
+                self.set(key, future.result())
+        tornado.ioloop.IOLoop.current().add_future(future, fetched)
+        return future
+
+# vim:set ft=python sw=4 :
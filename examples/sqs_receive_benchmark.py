@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+import base64
+import os
+import sys
+import timeit
+import xml.sax
+
+# Run from the repository root as `python examples/sqs_receive_benchmark.py`.  The root
+# is put first on sys.path so that the boto and botornado of the
+# checkout are measured, not an installed copy.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import boto.handler
+from boto.resultset import ResultSet
+from botornado.sqs.message import AsyncMessage, AsyncLightMessage, ReceiveMessageParser
+
+# a ReceiveMessage response of 10 messages with 1KB bodies
+body = '<ReceiveMessageResponse><ReceiveMessageResult>'
+for i in range(10):
+    body += ('<Message><MessageId>%08d-0000-0000-0000-000000000000</MessageId>'
+             '<ReceiptHandle>%s</ReceiptHandle><MD5OfBody>%032d</MD5OfBody>'
+             '<Body>%s</Body><Attribute><Name>SentTimestamp</Name>'
+             '<Value>1325376000000</Value></Attribute></Message>'
+             % (i, 'h' * 300, i, base64.b64encode('x' * 1024)))
+body += ('</ReceiveMessageResult><ResponseMetadata><RequestId>r</RequestId>'
+         '</ResponseMetadata></ReceiveMessageResponse>')
+
+def sax(read_body):
+    rs = ResultSet([('Message', AsyncMessage)])
+    xml.sax.parseString(body, boto.handler.XmlHandler(rs, None))
+    if read_body:
+        for m in rs:
+            m.get_body()
+
+def expat(read_body):
+    rs = ReceiveMessageParser(None, AsyncLightMessage).parse(body)
+    if read_body:
+        for m in rs:
+            m.get_body()
+
+number = 2000
+for read_body in (False, True):
+    for f in (sax, expat):
+        t = timeit.timeit(lambda: f(read_body), number=number)
+        print '%-5s get_body=%-5s %8.1f us/response' % (f.__name__, read_body, t / number * 1e6)
+
+# vim:set ft=python :
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import base64
+import os
+import sys
+import timeit
+
+# Run from the repository root as `python examples/xml_parser_benchmark.py`.  The root
+# is put first on sys.path so that the boto and botornado of the
+# checkout are measured, not an installed copy.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from boto.resultset import ResultSet
+from boto.s3.prefix import Prefix
+import botornado.handler
+from botornado.s3.key import AsyncKey
+from botornado.sqs.message import AsyncMessage
+
+# a ListBucket page of 1000 keys
+list_bucket = '<ListBucketResult><Name>bucket</Name><IsTruncated>true</IsTruncated>'
+for i in range(1000):
+    list_bucket += ('<Contents><Key>logs/2012/01/%08d.gz</Key>'
+                    '<LastModified>2012-01-26T00:00:00.000Z</LastModified>'
+                    '<ETag>&quot;%032d&quot;</ETag><Size>%d</Size>'
+                    '<Owner><ID>%s</ID><DisplayName>owner</DisplayName></Owner>'
+                    '<StorageClass>STANDARD</StorageClass></Contents>' % (i, i, i * 100, 'f' * 64))
+list_bucket += '</ListBucketResult>'
+
+# a ReceiveMessage response of 10 messages with 1KB bodies
+receive_message = '<ReceiveMessageResponse><ReceiveMessageResult>'
+for i in range(10):
+    receive_message += ('<Message><MessageId>%08d-0000-0000-0000-000000000000</MessageId>'
+                        '<ReceiptHandle>%s</ReceiptHandle><MD5OfBody>%032d</MD5OfBody>'
+                        '<Body>%s</Body></Message>' % (i, 'h' * 300, i, base64.b64encode('x' * 1024)))
+receive_message += '</ReceiveMessageResult></ReceiveMessageResponse>'
+
+benchmarks = [
+    ('ListBucket', list_bucket, 100,
+     lambda: ResultSet([('Contents', AsyncKey), ('CommonPrefixes', Prefix)])),
+    ('ReceiveMessage', receive_message, 2000,
+     lambda: ResultSet([('Message', AsyncMessage)])),
+]
+
+for name, body, number, root in benchmarks:
+    for parser in ('sax', 'expat'):
+        botornado.handler.set_parser(parser)
+        t = timeit.timeit(lambda: botornado.handler.parse(body, root(), None), number=number)
+        print '%-15s %-6s %10.1f us/response' % (name, parser, t / number * 1e6)
+
+# vim:set ft=python :
@@ -20,7 +20,7 @@ setup(
     url='https://github.com/yyuu/botornado',
     install_requires=[
 #       "boto==2.2.2", # current version of botornado includes tested version of boto in source tree
-        "tornado>=2.1.1",
+        "tornado>=4.1,<6", # return_future was removed in tornado 6
     ],
     packages=find_packages(),
     test_suite='botornado.test',